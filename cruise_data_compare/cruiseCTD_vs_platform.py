@@ -19,7 +19,6 @@ from geopy.distance import geodesic
 import os
 import matplotlib.pyplot as plt
 import numpy as np
-import xarray as xr
 import functions.common as cf
 import functions.plotting as pf
 pd.set_option('display.width', 320, "display.max_columns", 10)  # for display in pycharm console
@@ -112,7 +111,7 @@ for uframe_window in uframe_windows:
                         datasets.append(u)
 
                 if len(datasets) == 1:
-                    with xr.open_dataset(datasets[0], mask_and_scale=False) as ds:
+                    with cf.open_nc_dataset(datasets[0], mask_and_scale=False) as ds:
                         ds = ds.swap_dims({'obs': 'time'})
                         # select data within +/- 1 day of the CTD cast
                         dstart = cast_start - uframe_window
@@ -7,6 +7,7 @@ Modified on Oct 11 2018 by Lori Garzio
 sDir: location to save summary output
 f: file containing THREDDs urls with .nc files to analyze. The column containing the THREDDs urls must be labeled
 'outputUrl' (e.g. an output from one of the data_download scripts)
+n_workers: number of .nc files analyzed at the same time (in separate processes)
 """
 
 import pandas as pd
@@ -16,12 +17,13 @@ sDir = '/Users/lgarzio/Documents/repo/OOI/ooi-data-lab/data-review-tools/data_re
 f = '/Users/lgarzio/Documents/OOI/DataReviews/test3/GS01SUMO/data_request_summary_20181026T0933.csv'
 #sDir = '/Users/lgarzio/Documents/OOI/DataReviews/test3'
 #f = '/Users/lgarzio/Documents/OOI/DataReviews/test/data_request_summary_metbk.csv'
+n_workers = 1
 
 ff = pd.read_csv(f)
 url_list = ff['outputUrl'].tolist()
 url_list = [u for u in url_list if (u not in 'no_output_url') & ('ENG' not in str(u))]
 
-json_nc_analysis = scripts.nc_file_analysis.main(sDir, url_list)
+json_nc_analysis = scripts.nc_file_analysis.main(sDir, url_list, n_workers)
 
 json_method_comparison = scripts.compare_methods.main(sDir, url_list)
 
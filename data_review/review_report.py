@@ -10,6 +10,7 @@ sDir: location to save summary output, and where the script finds the last time
 import pandas as pd
 import datetime as dt
 import os
+import functions.common as cf
 pd.set_option('display.width', 320, "display.max_columns", 10)  # for display in pycharm console
 
 sDir = '/Users/lgarzio/Documents/repo/OOI/ooi-data-lab/data-review-tools/data_review/review_reports'
@@ -44,7 +45,7 @@ for root, dirs, files in os.walk(sDir):
 
 mdate = max(mdates)
 
-f = pd.read_csv('https://datareview.marine.rutgers.edu/notes/export')
+f = cf.get_review_notes()
 f['modified'] = f['modified'].map(lambda t: dt.datetime.strptime(t.replace(',', ''), '%m/%d/%y %I:%M %p'))
 df = f.loc[(f['modified'] > mdate) & (f['type'] != 'draft')]
 df = df.fillna('')
@@ -27,18 +27,19 @@ n_diff_greater_zero: count of absolute differences that are >0
 """
 
 import os
-import xarray as xr
 import pandas as pd
 import numpy as np
 import json
-from datetime import timedelta
 import functions.common as cf
 
+TIME_TOLERANCE = 0.5  # seconds: data points from two methods are compared if their timestamps are this close
 
-def compare_data(df):
+
+def compare_data(df, tolerance=TIME_TOLERANCE):
     names = df.columns
     summary = dict(deployments=dict())
     for d, row in df.iterrows():
+        datasets = DeploymentDatasets()  # datasets are opened once per deployment and shared by all comparisons
         for i, n in enumerate(names):
             ii = i + 1
             if ii > 1:
@@ -59,33 +60,12 @@ def compare_data(df):
                             if compare not in summary['deployments'][d]['comparison'].keys():
                                 summary['deployments'][d]['comparison'][compare] = dict(vars=dict())
 
-                            if len(f0) == 1:
-                                ds0 = xr.open_dataset(f0[0])
-                                ds0 = ds0.swap_dims({'obs': 'time'})
-                            else:
-                                ds0 = xr.open_mfdataset(f0)
-                                ds0 = ds0.swap_dims({'obs': 'time'})
-                                ds0 = ds0.chunk({'time': 100})
-                            splt0 = compare.split(' ')[0].split('-')
-                            ds0_sci_vars = cf.return_science_vars(splt0[1])
-                            ds0_method = splt0[0]
-
-                            if len(f1) == 1:
-                                ds1 = xr.open_dataset(f1[0])
-                                ds1 = ds1.swap_dims({'obs': 'time'})
-                            else:
-                                ds1 = xr.open_mfdataset(f1)
-                                ds1 = ds1.swap_dims({'obs': 'time'})
-                                ds1 = ds1.chunk({'time': 100})
-                            splt1 = compare.split(' ')[1].split('-')
-                            ds1_sci_vars = cf.return_science_vars(splt1[1])
-                            ds1_method = splt1[0]
+                            ds0_method = names[x].split('-')[0]
+                            ds1_method = n.split('-')[0]
 
                             # find where the variable long names are the same
-                            ds0names = long_names(ds0, ds0_sci_vars)
-                            ds0names.rename(columns={'name': 'name_ds0'}, inplace=True)
-                            ds1names = long_names(ds1, ds1_sci_vars)
-                            ds1names.rename(columns={'name': 'name_ds1'}, inplace=True)
+                            ds0names = datasets.long_names(names[x], f0).rename(columns={'name': 'name_ds0'})
+                            ds1names = datasets.long_names(n, f1).rename(columns={'name': 'name_ds1'})
                             mapping = pd.merge(ds0names, ds1names, on='long_name', how='inner')
                             print('----------------------')
                             print('{}: {}'.format(d, compare))
@@ -98,12 +78,9 @@ def compare_data(df):
                                 index, name_ds0, long_name, name_ds1 = rr
                                 print(long_name)
 
-                                # Compare data from two data streams (round timestamps to the nearest second).
-                                ds0_rename = '_'.join((str(name_ds0), 'ds0'))
-                                [ds0_df, ds0_units, n0, n0_nan] = get_ds_variable_info(ds0, name_ds0, ds0_rename)
-
-                                ds1_rename = '_'.join((str(name_ds1), 'ds1'))
-                                [ds1_df, ds1_units, n1, n1_nan] = get_ds_variable_info(ds1, name_ds1, ds1_rename)
+                                # Compare data from two data streams (timestamps within the tolerance are matched).
+                                [ds0_df, ds0_units, n0, n0_nan] = datasets.variable_info(names[x], f0, name_ds0)
+                                [ds1_df, ds1_units, n1, n1_nan] = datasets.variable_info(n, f1, name_ds1)
 
                                 # Compare units
                                 if ds0_units == ds1_units:
@@ -121,12 +98,9 @@ def compare_data(df):
                                         ds0_missing_dict = '2D dataset'
                                         ds1_missing_dict = '2D dataset'
                                     else:
-                                        # Merge dataframes from both methods
-                                        merged = pd.merge(ds0_df, ds1_df, on='time', how='outer')
-
-                                        # Drop rows where both variables are NaNs, and make sure the timestamps are in order
-                                        merged.dropna(subset=[ds0_rename, ds1_rename], how='all', inplace=True)
-                                        if len(merged) == 0:
+                                        # Match the data points of both methods by time and compare them
+                                        result = compare_variables(ds0_df, ds1_df, tolerance)
+                                        if result is None:
                                             print('No valid data to compare')
                                             n_comparison = 0
                                             n_diff_g_zero = None
@@ -134,96 +108,94 @@ def compare_data(df):
                                             max_diff = None
                                             ds0_missing_dict = 'No valid data to compare'
                                             ds1_missing_dict = 'No valid data to compare'
+
+                                        # If the number of data points for comparison is less than 1% of the smaller
+                                        # sample size, the timestamps of the two datasets don't match
+                                        elif result['n_comparison'] == 0 or float(result['n_comparison'])/float(min(n0, n1))*100 < 1.00:
+                                            n_comparison = 0
+                                            n_diff_g_zero = None
+                                            min_diff = None
+                                            max_diff = None
+                                            ds0_missing_dict = 'timestamp_seconds do not match'
+                                            ds1_missing_dict = 'timestamp_seconds do not match'
+
                                         else:
-                                            merged = merged.sort_values('time').reset_index(drop=True)
-                                            m_intersect = merged[merged[ds0_rename].notnull() & merged[ds1_rename].notnull()]
-
-                                            # If the number of data points for comparison is less than 1% of the smaller sample size
-                                            # compare the timestamps by rounding to the nearest hour
-                                            if len(m_intersect) == 0 or float(len(m_intersect))/float(min(n0, n1))*100 < 1.00:
-                                                n_comparison = 0
-                                                n_diff_g_zero = None
-                                                min_diff = None
-                                                max_diff = None
-
-                                                utime_df0 = unique_timestamps_hour(ds0)
-                                                utime_df0['ds0'] = 'ds0'
-                                                utime_df1 = unique_timestamps_hour(ds1)
-                                                utime_df1['ds1'] = 'ds1'
-                                                umerged = pd.merge(utime_df0, utime_df1, on='time', how='outer')
-                                                umerged = umerged.sort_values('time').reset_index(drop=True)
-
-                                                if 'telemetered' in ds0_method:
-                                                    ds0_missing_dict = 'method not checked for missing data'
-                                                else:
-                                                    ds0_missing = umerged.loc[umerged['ds0'].isnull()]
-                                                    if len(ds0_missing) > 0:
-                                                        ds0_missing_dict = missing_data_times(ds0_missing)
-                                                        if ds0_missing_dict != blank_dict:
-                                                            ds0_missing_dict['n_hours_missing'] = ds0_missing_dict.pop('n_missing')
-                                                            ds0_missing_dict['n_hours_missing_total'] = ds0_missing_dict.pop('n_missing_total')
-                                                        else:
-                                                            ds0_missing_dict = 'timestamps rounded to the hour: no missing data'
-                                                    else:
-                                                        ds0_missing_dict = 'timestamps rounded to the hour: no missing data'
-
-                                                if 'telemetered' in ds1_method:
-                                                    ds1_missing_dict = 'method not checked for missing data'
-                                                else:
-                                                    ds1_missing = umerged.loc[umerged['ds1'].isnull()]
-                                                    if len(ds1_missing) > 0:
-                                                        ds1_missing_dict = missing_data_times(ds1_missing)
-                                                        if ds1_missing_dict != blank_dict:
-                                                            ds1_missing_dict['n_hours_missing'] = ds1_missing_dict.pop('n_missing')
-                                                            ds1_missing_dict['n_hours_missing_total'] = ds1_missing_dict.pop('n_missing_total')
-                                                        else:
-                                                            ds1_missing_dict = 'timestamps rounded to the hour: no missing data'
-                                                    else:
-                                                        ds1_missing_dict = 'timestamps rounded to the hour: no missing data'
+                                            # Find where data are available in one dataset and missing in the other.
+                                            # Don't check for missing data in telemetered datasets.
+                                            if 'telemetered' in ds0_method:
+                                                ds0_missing_dict = 'method not checked for missing data'
+                                            elif result['ds0_missing'] == blank_dict:
+                                                ds0_missing_dict = 'no missing data'
+                                            else:
+                                                ds0_missing_dict = result['ds0_missing']
 
+                                            if 'telemetered' in ds1_method:
+                                                ds1_missing_dict = 'method not checked for missing data'
+                                            elif result['ds1_missing'] == blank_dict:
+                                                ds1_missing_dict = 'no missing data'
                                             else:
-                                                # Find where data are available in one dataset and missing in the other if
-                                                # timestamps match exactly. Don't check for missing data in telemetered
-                                                # datasets.
-                                                if 'telemetered' in ds0_method:
-                                                    ds0_missing_dict = 'method not checked for missing data'
-                                                else:
-                                                    ds0_missing = merged.loc[merged[ds0_rename].isnull()]
-                                                    if len(ds0_missing) > 0:
-                                                        ds0_missing_dict = missing_data_times(ds0_missing)
-                                                        if ds0_missing_dict == blank_dict:
-                                                            ds0_missing_dict = 'no missing data'
-                                                    else:
-                                                        ds0_missing_dict = 'no missing data'
-
-                                                if 'telemetered' in ds1_method:
-                                                    ds1_missing_dict = 'method not checked for missing data'
-                                                else:
-                                                    ds1_missing = merged.loc[merged[ds1_rename].isnull()]
-                                                    if len(ds1_missing) > 0:
-                                                        ds1_missing_dict = missing_data_times(ds1_missing)
-                                                        if ds1_missing_dict == blank_dict:
-                                                            ds1_missing_dict = 'no missing data'
-                                                    else:
-                                                        ds1_missing_dict = 'no missing data'
-
-                                                # Where the data intersect, calculate the difference between the methods
-                                                diff = m_intersect[ds0_rename] - m_intersect[ds1_rename]
-                                                n_diff_g_zero = sum(abs(diff) > 0.99999999999999999)
-
-                                                min_diff = round(min(abs(diff)), 10)
-                                                max_diff = round(max(abs(diff)), 10)
-                                                n_comparison = len(diff)
+                                                ds1_missing_dict = result['ds1_missing']
+
+                                            n_comparison = result['n_comparison']
+                                            n_diff_g_zero = result['n_diff_greater_zero']
+                                            min_diff = result['min_abs_diff']
+                                            max_diff = result['max_abs_diff']
 
                                     summary['deployments'][d]['comparison'][compare]['vars'][str(long_name)] = dict(
                                         ds0=dict(name=name_ds0, units=ds0_units, n=n0, n_nan=n0_nan, missing=ds0_missing_dict),
                                         ds1=dict(name=name_ds1, units=ds1_units, n=n1, n_nan=n1_nan, missing=ds1_missing_dict),
                                         unit_test=unit_test, n_comparison=n_comparison, n_diff_greater_zero=n_diff_g_zero,
                                         min_abs_diff=min_diff, max_abs_diff=max_diff)
+        datasets.close()
     return summary
 
 
-def get_ds_variable_info(dataset, variable_name, rename):
+class DeploymentDatasets(object):
+    """
+    Datasets of one deployment, keyed by method-stream. Each dataset is opened the first time it's needed, and its
+    science variable long names are only read once, no matter how many other methods it's compared with. Variable data
+    aren't kept in memory (xarray's cache is off), so only the two variables being compared are loaded at a time. The
+    datasets stay open until close() is called.
+    """
+    def __init__(self):
+        self._datasets = dict()
+        self._long_names = dict()
+
+    def dataset(self, method_stream, files):
+        try:
+            return self._datasets[method_stream]
+        except KeyError:
+            pass
+
+        if len(files) == 1:
+            ds = cf.open_nc_dataset(files[0], cache=False)
+            ds = ds.swap_dims({'obs': 'time'})
+        else:
+            ds = cf.open_nc_mfdataset(files)
+            ds = ds.swap_dims({'obs': 'time'})
+            ds = ds.chunk({'time': 100})
+        self._datasets[method_stream] = ds
+        return ds
+
+    def long_names(self, method_stream, files):
+        # dataframe of the science variable names and long names
+        if method_stream not in self._long_names:
+            sci_vars = cf.return_science_vars(method_stream.split('-')[1])
+            self._long_names[method_stream] = long_names(self.dataset(method_stream, files), sci_vars)
+        return self._long_names[method_stream]
+
+    def variable_info(self, method_stream, files, variable_name):
+        # get_ds_variable_info for a variable in the dataset
+        return get_ds_variable_info(self.dataset(method_stream, files), variable_name)
+
+    def close(self):
+        for ds in self._datasets.values():
+            ds.close()
+        self._datasets.clear()
+        self._long_names.clear()
+
+
+def get_ds_variable_info(dataset, variable_name):
     ds_units = var_units(dataset[variable_name])
     if len(dataset[variable_name].dims) > 1:
         print('variable has more than 1 dimension')
@@ -232,13 +204,10 @@ def get_ds_variable_info(dataset, variable_name, rename):
         n_nan = None
     else:
         if 'time' in list(dataset[variable_name].coords):  # only add if time is a coordinate
-            ds_df = pd.DataFrame({'time': dataset['time'].values, variable_name: dataset[variable_name].values})
-            ds_df.rename(columns={str(variable_name): rename}, inplace=True)
-            n = len(ds_df[rename])
-            n_nan = sum(ds_df[rename].isnull())
-
-            # round to the nearest second
-            ds_df['time'] = ds_df['time'].map(lambda t: t.replace(microsecond=0) + timedelta(seconds=(round(t.microsecond / 1000000.0))))
+            values = np.asarray(dataset[variable_name].values, dtype='float64')
+            ds_df = (dataset['time'].values.astype('datetime64[ns]', copy=False), values)
+            n = len(values)
+            n_nan = int(np.sum(np.isnan(values)))
         else:
             print('time is not a coordinate')
             ds_df = 'time is not a coordinate'
@@ -277,56 +246,119 @@ def merge_two_dicts(dict1, dict2):
     return dict1
 
 
-def missing_data_times(df):
-    # return a dictionary of time ranges, number of data points and number of days where data are missing (but available
-    # in a comparable dataset). skips gaps that are only 1 data point (or one hour if data are rounded to the hour).
+def match_times(t0, t1, tolerance):
+    """
+    Find the nearest timestamp in t1 for each timestamp in t0
+    :param t0: sorted int64 timestamps (ns)
+    :param t1: sorted int64 timestamps (ns)
+    :param tolerance: maximum time difference (ns)
+    :return: index of the matching timestamp in t1 for each timestamp in t0 (-1 if there is no timestamp in t1 within
+    the tolerance)
+    """
+    match = np.full(len(t0), -1, dtype='int64')
+    if len(t0) == 0 or len(t1) == 0:
+        return match
+
+    right = np.clip(np.searchsorted(t1, t0), 0, len(t1) - 1)
+    left = np.clip(right - 1, 0, len(t1) - 1)
+    nearest = np.where(np.abs(t0 - t1[left]) <= np.abs(t1[right] - t0), left, right)
+    ind = np.abs(t1[nearest] - t0) <= tolerance
+    match[ind] = nearest[ind]
+    return match
+
+
+def compare_variables(ds0_data, ds1_data, tolerance=TIME_TOLERANCE):
+    """
+    Compare a variable from two datasets: the valid data points (not NaN) are sorted by time once, and each data point
+    is matched to the nearest data point in the other dataset within the tolerance
+    :param ds0_data: (time, values) arrays from get_ds_variable_info
+    :param ds1_data: (time, values) arrays from get_ds_variable_info
+    :param tolerance: maximum time difference between matched data points (seconds)
+    :return: dictionary containing the number of matched data points, the number of absolute differences >0, the
+    min/max absolute difference, and the data missing from each dataset (see missing_data_times). None if neither
+    dataset has valid data
+    """
+    tol = int(tolerance * 1e9)
+    t0, v0 = valid_sorted(ds0_data)
+    t1, v1 = valid_sorted(ds1_data)
+    if len(t0) + len(t1) == 0:
+        return None
+
+    match0 = match_times(t0, t1, tol)
+    match1 = match_times(t1, t0, tol)
+    matched = match0 >= 0
+    diff = np.abs(v0[matched] - v1[match0[matched]])
+    n_comparison = len(diff)
+    if n_comparison > 0:
+        n_diff_g_zero = int(np.sum(diff > 0.99999999999999999))
+        min_diff = round(float(np.min(diff)), 10)
+        max_diff = round(float(np.max(diff)), 10)
+    else:
+        n_diff_g_zero = None
+        min_diff = None
+        max_diff = None
+
+    return dict(n_comparison=n_comparison, n_diff_greater_zero=n_diff_g_zero, min_abs_diff=min_diff,
+                max_abs_diff=max_diff, ds0_missing=missing_data_times(t1, match1 < 0, t0),
+                ds1_missing=missing_data_times(t0, match0 < 0, t1))
+
+
+def valid_sorted(ds_data):
+    # return the int64 timestamps (ns) and values of the data points that are not NaN, sorted by time
+    t, v = ds_data
+    ind = ~np.isnan(v)
+    t = t[ind].astype('int64')
+    v = v[ind]
+    order = np.argsort(t, kind='stable')
+    return t[order], v[order]
+
+
+def missing_data_times(t, missing, t_other):
+    """
+    Return a dictionary of time ranges, number of data points and number of days where data are missing from one
+    dataset (but available in a comparable dataset). Consecutive missing data points make one gap until a data point
+    from the other dataset falls between them. Skips gaps that are only 1 data point.
+    :param t: sorted int64 timestamps (ns) of the data in the comparable dataset
+    :param missing: boolean array, True where the data point in t is missing from the other dataset
+    :param t_other: sorted int64 timestamps (ns) of the data in the other dataset
+    """
     md_list = []
     n_list = []
     mdays = []
-    index_break = []
-    ilist = df.index.tolist()
 
-    if len(ilist) == 1:
-        ii = ilist[0]
-        md_list.append(pd.to_datetime(str(df['time'][ii])).strftime('%Y-%m-%dT%H:%M:%S'))
+    imissing = np.where(missing)[0]
+    if len(imissing) == 1:
+        md_list.append(time_string(t[imissing])[0])
         n_list.append(1)
-    else:
-        for i, n in enumerate(ilist):
-            if i == 0:
-                index_break.append(ilist[i])
-            elif i == (len(ilist) - 1):
-                index_break.append(ilist[i])
-            else:
-                if (n - ilist[i-1]) > 1:
-                    index_break.append(ilist[i-1])
-                    index_break.append(ilist[i])
-
-        for ii, nn in enumerate(index_break):
-            if ii % 2 == 0:  # check that the index is an even number
-                if index_break[ii + 1] != nn:  # only list gaps that are more than 1 data point
-                    try:
-                        # create a list of timestamps for each gap to get the unique # of days missing from one dataset
-                        time_lst = [df['time'][t].date() for t in range(nn, index_break[ii + 1] + 1)]
-                    except KeyError:  # if the last data gap is only 1 point, skip
-                        continue
-                    md_list.append([pd.to_datetime(str(df['time'][nn])).strftime('%Y-%m-%dT%H:%M:%S'),
-                                    pd.to_datetime(str(df['time'][index_break[ii + 1]])).strftime('%Y-%m-%dT%H:%M:%S')])
-                    n_list.append(index_break[ii + 1] - nn + 1)
-                    mdays.append(len(np.unique(time_lst)))
-
-    n_total = sum(n_list)
-    n_days = sum(mdays)
+    elif len(imissing) > 1:
+        # a new gap starts where the missing data points aren't consecutive, or data from the other dataset are between
+        # them
+        n_before = np.searchsorted(t_other, t[imissing])
+        new_gap = np.r_[True, (np.diff(imissing) > 1) | (np.diff(n_before) > 0)]
+        starts = np.where(new_gap)[0]
+        ends = np.r_[starts[1:], len(imissing)] - 1
+        days = t[imissing].astype('datetime64[ns]').astype('datetime64[D]')
+        new_day = np.r_[True, (np.diff(days) > np.timedelta64(0, 'D')) | new_gap[1:]]
+        n_days = np.add.reduceat(new_day.astype('int64'), starts)
+
+        gaps = ends > starts  # only list gaps that are more than 1 data point
+        gap_starts = time_string(t[imissing[starts[gaps]]])
+        gap_ends = time_string(t[imissing[ends[gaps]]])
+        md_list = [[s, e] for s, e in zip(gap_starts, gap_ends)]
+        n_list = (ends[gaps] - starts[gaps] + 1).tolist()
+        mdays = n_days[gaps].tolist()
+
+    n_total = int(sum(n_list))
+    n_days = int(sum(mdays))
 
     return dict(missing_data_gaps=md_list, n_missing=n_list, n_missing_total=n_total, n_missing_days_total=n_days)
 
 
-def unique_timestamps_hour(ds):
-    # return dataframe of the unique timestamps rounded to the nearest hour
-    df = pd.DataFrame(ds['time'].values, columns=['time'])
-    df = df['time'].map(lambda t: t.replace(second=0, microsecond=0, nanosecond=0, minute=0, hour=t.hour) + timedelta(hours=t.minute // 30))
-    udf = pd.DataFrame(np.unique(df), columns=['time'])
-
-    return udf
+def time_string(t):
+    # format int64 timestamps (ns) as strings, rounded to the nearest second like round(t.microsecond / 1e6) (half a
+    # second is rounded down)
+    t = t.astype('datetime64[ns]') + np.timedelta64(499999000, 'ns')
+    return np.datetime_as_string(t.astype('datetime64[s]')).tolist()
 
 
 def var_units(variable):
@@ -339,6 +371,8 @@ def var_units(variable):
 
 
 def main(sDir, url_list):
+    catalogs = cf.resolve_catalogs(url_list)
+
     # get summary lists of reference designators and delivery methods
     rd_list = []
     rdm_list = []
@@ -373,7 +407,7 @@ def main(sDir, url_list):
                 for u in urls:
                     splitter = u.split('/')[-2].split('-')
                     catalog_rms = '-'.join((r, splitter[-2], splitter[-1]))
-                    udatasets = cf.get_nc_urls([u])
+                    udatasets = catalogs.get(u, [])
                     idatasets = []
                     for dss in udatasets:  # filter out collocated data files
                         if catalog_rms == dss.split('/')[-1].split('_20')[0][15:]:
@@ -35,6 +35,8 @@ def main(url_list, sDir, mDir, zcell_size, zdbar, start_time, end_time, inpercen
     start_time : select start date to slice timeseries
     end_time : select end date to slice timeseries
     """""
+    catalogs = cf.resolve_catalogs(url_list)
+
     rd_list = []
     ms_list = []
     for uu in url_list:
@@ -71,7 +73,7 @@ def main(url_list, sDir, mDir, zcell_size, zdbar, start_time, end_time, inpercen
             splitter = u.split('/')[-2].split('-')
             rd_check = '-'.join((splitter[1], splitter[2], splitter[3], splitter[4]))
             if rd_check == r:
-                udatasets = cf.get_nc_urls([u])
+                udatasets = catalogs.get(u, [])
                 datasets.append(udatasets)
 
         datasets = list(itertools.chain(*datasets))
@@ -146,17 +148,17 @@ def main(url_list, sDir, mDir, zcell_size, zdbar, start_time, end_time, inpercen
                         if 'pressure' in vinfo['var_name']:
                             pass
                         else:
-                            columns = ['tsec', 'dbar', str(vinfo['var_name'])]
                             # create depth ranges
                             min_r = int(round(min(y) - zcell_size))
                             max_r = int(round(max(y) + zcell_size))
                             ranges = list(range(min_r, max_r, zcell_size))
 
                             # group data by depth
-                            groups, d_groups = gt.group_by_depth_range(t, y, z, columns, ranges)
+                            groups = gt.depth_groups(y, ranges)
 
                             print('writing data ranges for {}'.format(vinfo['var_name']))
-                            stat_data = groups.describe()[vinfo['var_name']]
+                            stat_data = groups.describe(z)
+                            stat_data.index.name = 'dbar'
                             stat_data.insert(loc=0, column='parameter', value=sv, allow_duplicates=False)
                             t_deploy = deployments[0]
                             for i in range(len(deployments))[1:len(deployments)]:
@@ -176,14 +178,13 @@ def main(url_list, sDir, mDir, zcell_size, zdbar, start_time, end_time, inpercen
                         m_water_depth = None
 
                         # plot non-erroneous -suspect data
+                        leg_text = ('{} % erroneous values removed after Human In the Loop review'.format(
+                                                                                                    (len(t)/l0) * 100),)
                         fig, ax, bar = pf.plot_xsection(subsite, t, y, z, clabel, ylabel, t_eng, m_water_depth,
-                                                        inpercentile, stdev=None)
+                                                        inpercentile, stdev=None, leg_below=leg_text)
 
                         title0 = 'Data colored using the upper and lower {} percentile.'.format(inpercentile)
                         ax.set_title(r+'\n'+title0, fontsize=9)
-                        leg_text = ('{} % erroneous values removed after Human In the Loop review'.format(
-                                                                                                    (len(t)/l0) * 100),)
-                        ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
 
 
                         for ii in range(len(end_times)):
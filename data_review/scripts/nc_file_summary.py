@@ -285,6 +285,8 @@ def main(f, ps, mc):
                                     continue
                                 elif '2D dataset' in md:
                                     continue
+                                elif md in md_options:
+                                    continue
                                 else:
                                     md = ast.literal_eval(md)
                                     n_missing_gaps.append(len(md['missing_data_gaps']))
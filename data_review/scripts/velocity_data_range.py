@@ -34,36 +34,14 @@ def index_dataset(refdes, var_name, var_data, fv):
 
 def index_dataset_2d(refdes, var_name, var_data, fv):
     [g_min, g_max] = cf.get_global_ranges(refdes, var_name)
-    fdata = dict()
-    n_nan = []
-    n_fv = []
-    n_grange = []
-    for i in range(len(var_data)):
-        vd = var_data[i]
-        n_nani = np.sum(np.isnan(vd))
-
-        # convert fill values to nans
-        vd[vd == fv] = np.nan
-        n_fvi = np.sum(np.isnan(vd)) - n_nani
-
-        if g_min is not None and g_max is not None:
-            vd[vd < g_min] = np.nan
-            vd[vd > g_max] = np.nan
-            n_grangei = np.sum(np.isnan(vd) - n_fvi - n_nani)
-        else:
-            n_grangei = 'no global ranges'
-
-        fdata.update({i: vd})
-        n_nan.append(int(n_nani))
-        n_fv.append(int(n_fvi))
-        n_grange.append(int(n_grangei))
+    [fdata, n_nan, n_fv, n_grange] = cf.index_2d_data(var_data, fv, g_min, g_max)
 
     return [fdata, g_min, g_max, n_nan, n_fv, n_grange]
 
 
 def main(sDir, plotting_sDir, url_list, sd_calc):
-    dr = pd.read_csv('https://datareview.marine.rutgers.edu/notes/export')
-    drn = dr.loc[dr.type == 'exclusion']
+    catalogs = cf.resolve_catalogs(url_list)
+
     rd_list = []
     for uu in url_list:
         elements = uu.split('/')[-2].split('-')
@@ -78,7 +56,7 @@ def main(sDir, plotting_sDir, url_list, sd_calc):
             splitter = u.split('/')[-2].split('-')
             rd_check = '-'.join((splitter[1], splitter[2], splitter[3], splitter[4]))
             if rd_check == r:
-                udatasets = cf.get_nc_urls([u])
+                udatasets = catalogs.get(u, [])
                 datasets.append(udatasets)
         datasets = list(itertools.chain(*datasets))
         fdatasets = []
@@ -104,14 +82,7 @@ def main(sDir, plotting_sDir, url_list, sd_calc):
 
         # find time ranges to exclude from analysis for data review database
         subsite = r.split('-')[0]
-        subsite_node = '-'.join((subsite, r.split('-')[1]))
-
-        drne = drn.loc[drn.reference_designator.isin([subsite, subsite_node, r])]
-        et = []
-        for i, row in drne.iterrows():
-            sdate = cf.format_dates(row.start_date)
-            edate = cf.format_dates(row.end_date)
-            et.append([sdate, edate])
+        et = [[sdate, edate] for sdate, edate, _, _ in cf.exclusion_time_ranges(subsite, r)]
 
         # get science variable long names from the Data Review Database
         stream_sci_vars = cd.sci_var_long_names(r)
@@ -286,24 +257,8 @@ def main(sDir, plotting_sDir, url_list, sd_calc):
                             deploy = list(np.unique(deploy_final))
                             deployments = [int(dd) for dd in deploy]
 
-                            num_outliers = []
-                            mean = []
-                            vmin = []
-                            vmax = []
-                            sd = []
-                            n_stats = []
-                            for i in range(len(dd_data)):
-                                dd = data[i]
-                                # drop nans before calculating stats
-                                dd = dd[~np.isnan(dd)]
-                                [num_outliersi, meani, vmini, vmaxi, sdi, n_statsi] = cf.variable_statistics(dd,
-                                                                                                             sd_calc)
-                                num_outliers.append(num_outliersi)
-                                mean.append(meani)
-                                vmin.append(vmini)
-                                vmax.append(vmaxi)
-                                sd.append(sdi)
-                                n_stats.append(n_statsi)
+                            # statistics for all columns at once (NaNs are ignored)
+                            [num_outliers, mean, vmin, vmax, sd, n_stats] = cf.variable_statistics_2d(dd_data, sd_calc)
 
                         else:
                             [dataind, g_min, g_max, n_nan, n_fv, n_grange] = index_dataset(r, vinfo['var_name'], data,
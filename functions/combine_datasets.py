@@ -1,5 +1,4 @@
 #! /usr/bin/env python
-import xarray as xr
 import numpy as np
 import pandas as pd
 import functions.common as cf
@@ -23,13 +22,9 @@ def append_science_data(preferred_stream_df, n_streams, refdes, dataset_list, sc
             for d in dataset_list:
                 ds_drms = d.split('/')[-1].split('_20')[0]
                 if ds_drms == drms:
-                    ds = xr.open_dataset(d, mask_and_scale=False)
-                    ds = ds.swap_dims({'obs': 'time'})
-                    if stime is not None and etime is not None:
-                        ds = ds.sel(time=slice(stime, etime))
-                        if len(ds['time'].values) == 0:
-                            print('No data for specified time range: ({} to {})'.format(stime, etime))
-                            continue
+                    ds = open_projected_dataset(d, sci_vars_dict, stime, etime)
+                    if ds is None:
+                        continue
 
                     fmethod_stream = '-'.join((ds.collection_method, ds.stream))
                     for strm, b in sci_vars_dict.items():
@@ -42,9 +37,59 @@ def append_science_data(preferred_stream_df, n_streams, refdes, dataset_list, sc
                             variable_dict, pressure_unit, pressure_name = append_variable_data(ds, sci_vars_dict,
                                                                                                strm, et)
 
+    sci_vars_dict = concatenate_columns(sci_vars_dict)
     return sci_vars_dict, pressure_unit, pressure_name
 
 
+def open_projected_dataset(d, sci_vars_dict, stime=None, etime=None):
+    """
+    Open a dataset and load only the variables needed to combine the science data: time, deployment, pressure and
+    the science variables defined in the Data Review Database (matched by name or long name, from the file metadata).
+    Over OPeNDAP, only these variables (and only the requested time range) are transferred.
+    :param d: url or path of a netCDF file
+    :param sci_vars_dict: dictionary of science variables from sci_var_long_names_check
+    :param stime: optional start time of the data to load
+    :param etime: optional end time of the data to load
+    :return: xarray dataset, or None if there are no data in the time range
+    """
+    ds = cf.open_nc_dataset(d, mask_and_scale=False)
+    ds = ds.swap_dims({'obs': 'time'})
+    if stime is not None and etime is not None:
+        ds = ds.sel(time=slice(stime, etime))
+        if len(ds['time'].values) == 0:
+            print('No data for specified time range: ({} to {})'.format(stime, etime))
+            return None
+
+    keep = projection_variables(ds, sci_vars_dict)
+    ds = ds[keep]
+    ds = ds.drop([x for x in ds.coords if x not in keep and x != 'time'])
+    return ds.load()
+
+
+def projection_variables(ds, sci_vars_dict):
+    # return the variables in a dataset that are used by append_variable_data and append_evaluated_data
+    long_names = []
+    var_names = []
+    for strm in sci_vars_dict.values():
+        for ln, vinfo in strm['vars'].items():
+            long_names.append(ln)
+            var_names.append(vinfo['var_name'])
+
+    keep = []
+    for var in list(ds.data_vars.keys()) + list(ds.coords):
+        if var in ['time', 'deployment'] or var in var_names or 'pressure' in var or 'dbar' in var:
+            keep.append(var)
+        else:
+            try:
+                long_name = ds[var].long_name
+            except AttributeError:
+                continue
+            if len([x for x in long_names if long_name in x]) > 0:
+                keep.append(var)
+
+    return [x for x in keep if x != 'time']
+
+
 def append_variable_data(ds, variable_dict, common_stream_name, exclude_times):
     pressure_unit, pressure_name = [], []
     ds_vars = cf.return_raw_vars(list(ds.data_vars.keys()) + list(ds.coords))
@@ -74,20 +119,16 @@ def append_variable_data(ds, variable_dict, common_stream_name, exclude_times):
                     if p_name not in pressure_name:
                         pressure_name.append(p_name)
 
+                    # timestamps outside of the time ranges to exclude (the same for every column of 2D data)
+                    keep, _ = cf.time_exclusion_mask(tD, exclude_times)
+                    tD = tD[keep]
+                    pD = pD[keep]
+                    deployD = deployD[keep]
+
                     if len(ds[var].dims) == 1:
-                        if len(exclude_times) > 0:
-                            for et in exclude_times:
-                                tD, pD, varD, deployD = exclude_time_ranges(tD, pD, varD, deployD, et)
-                            if len(tD) > 0:
-                                vars_dict[long_name]['t'] = np.append(vars_dict[long_name]['t'], tD)
-                                vars_dict[long_name]['pressure'] = np.append(vars_dict[long_name]['pressure'], pD)
-                                vars_dict[long_name]['values'] = np.append(vars_dict[long_name]['values'], varD)
-                                vars_dict[long_name]['deployments'] = np.append(vars_dict[long_name]['deployments'], deployD)
-                        else:
-                            vars_dict[long_name]['t'] = np.append(vars_dict[long_name]['t'], tD)
-                            vars_dict[long_name]['pressure'] = np.append(vars_dict[long_name]['pressure'], pD)
-                            vars_dict[long_name]['values'] = np.append(vars_dict[long_name]['values'], varD)
-                            vars_dict[long_name]['deployments'] = np.append(vars_dict[long_name]['deployments'], deployD)
+                        varD = varD[keep]
+                        if len(tD) > 0:
+                            append_to_columns(vars_dict[long_name], tD, pD, varD, deployD)
                     else:
                         # appending 2D datasets
                         if type(vars_dict[long_name]['values']) != dict:
@@ -103,43 +144,64 @@ def append_variable_data(ds, variable_dict, common_stream_name, exclude_times):
                         else:
                             lendims = len(varD)
                         for i in range(lendims):
-                            tD = ds['time'].values  # reset the time variable
-                            deployD = ds['deployment'].values
-                            pDi = pD
                             try:
                                 vars_dict[long_name]['values'][i]
                             except KeyError:
                                 vars_dict[long_name]['values'].update({i: np.array([])})
                             try:
-                                varDi = varD[i]
+                                varDi = varD[i][keep]
                             except IndexError:
                                 varDi = np.empty(np.shape(tD))
                                 varDi[:] = np.nan
-                            if len(exclude_times) > 0:
-                                for et in exclude_times:
-                                    tD, pDi, varDi, deployD = exclude_time_ranges(tD, pDi, varDi, deployD, et)
-                                if len(tD) > 0:
-                                    if i == 0:
-                                        vars_dict[long_name]['t'] = np.append(vars_dict[long_name]['t'], tD)
-                                        vars_dict[long_name]['pressure'] = np.append(vars_dict[long_name]['pressure'], pDi)
-                                        vars_dict[long_name]['values'][i] = np.append(vars_dict[long_name]['values'][i], varDi)
-                                        vars_dict[long_name]['deployments'] = np.append(vars_dict[long_name]['deployments'], deployD)
-                                    else:
-                                        vars_dict[long_name]['values'][i] = np.append(vars_dict[long_name]['values'][i],varDi)
-                            else:
+                            if len(tD) > 0:
                                 if i == 0:
-                                    vars_dict[long_name]['t'] = np.append(vars_dict[long_name]['t'], tD)
-                                    vars_dict[long_name]['pressure'] = np.append(vars_dict[long_name]['pressure'], pDi)
-                                    vars_dict[long_name]['values'][i] = np.append(vars_dict[long_name]['values'][i], varDi)
-                                    vars_dict[long_name]['deployments'] = np.append(vars_dict[long_name]['deployments'], deployD)
+                                    append_to_columns(vars_dict[long_name], tD, pD, varDi, deployD, column=i)
                                 else:
-                                    vars_dict[long_name]['values'][i] = np.append(vars_dict[long_name]['values'][i], varDi)
+                                    append_to_columns(vars_dict[long_name], values=varDi, column=i)
         except AttributeError:
             continue
 
     return variable_dict, pressure_unit, pressure_name
 
 
+def append_to_columns(var_dict, t=None, pressure=None, values=None, deployments=None, column=None):
+    """
+    Queue data to be added to the 't', 'pressure', 'values' and 'deployments' arrays of a variable. The queued
+    arrays are joined once by concatenate_columns, instead of copying everything appended so far for every file
+    (and every column of 2D data) with np.append.
+    :param var_dict: dictionary for one variable, initialized by initialize_empty_arrays
+    :param column: column index for 2D data, where var_dict['values'] is a dictionary of column: array
+    """
+    if 'pending' not in var_dict:
+        var_dict['pending'] = dict(t=[], pressure=[], deployments=[], values=dict())
+    pending = var_dict['pending']
+    for key, data in [('t', t), ('pressure', pressure), ('deployments', deployments)]:
+        if data is not None:
+            pending[key].append(np.ravel(data))
+    if values is not None:
+        if column not in pending['values']:
+            pending['values'][column] = []
+        pending['values'][column].append(np.ravel(values))
+
+
+def concatenate_columns(dictionary):
+    # join the arrays queued by append_to_columns into one array per variable and key
+    for strm in dictionary.values():
+        for var_dict in strm['vars'].values():
+            pending = var_dict.pop('pending', None)
+            if pending is None:
+                continue
+            for key in ['t', 'pressure', 'deployments']:
+                if len(pending[key]) > 0:
+                    var_dict[key] = np.concatenate([var_dict[key]] + pending[key])
+            for column, chunks in pending['values'].items():
+                if column is None:
+                    var_dict['values'] = np.concatenate([var_dict['values']] + chunks)
+                else:
+                    var_dict['values'][column] = np.concatenate([var_dict['values'][column]] + chunks)
+    return dictionary
+
+
 def common_long_names(science_variable_dictionary):
     # return dictionary of common variables
     vals_df = pd.DataFrame(science_variable_dictionary)
@@ -160,9 +222,7 @@ def common_long_names(science_variable_dictionary):
 
 
 def exclude_time_ranges(time_data, pressure_data, variable_data, deploy_data, time_lst):
-    t0 = np.datetime64(time_lst[0])
-    t1 = np.datetime64(time_lst[1])
-    ind = np.where((time_data < t0) | (time_data > t1), True, False)
+    ind, _ = cf.time_exclusion_mask(time_data, [time_lst])
     timedata = time_data[ind]
     pressuredata = pressure_data[ind]
     variabledata = variable_data[ind]
@@ -259,13 +319,9 @@ def append_evaluated_science_data(sDir, preferred_stream_df, n_streams, refdes,
             for d in dataset_list:
                 ds_drms = d.split('/')[-1].split('_20')[0]
                 if ds_drms == drms:
-                    ds = xr.open_dataset(d, mask_and_scale=False)
-                    ds = ds.swap_dims({'obs': 'time'})
-                    if stime is not None and etime is not None:
-                        ds = ds.sel(time=slice(stime, etime))
-                        if len(ds['time'].values) == 0:
-                            print('No data for specified time range: ({} to {})'.format(stime, etime))
-                            continue
+                    ds = open_projected_dataset(d, sci_vars_dict, stime, etime)
+                    if ds is None:
+                        continue
 
                     fmethod_stream = '-'.join((ds.collection_method, ds.stream))
                     for strm, b in sci_vars_dict.items():
@@ -280,6 +336,7 @@ def append_evaluated_science_data(sDir, preferred_stream_df, n_streams, refdes,
                             variable_dict, pressure_unit, pressure_name, l0 = append_evaluated_data(sDir, row['deployment'],
                                                                         ds, sci_vars_dict, strm, zdbar)
 
+    sci_vars_dict = concatenate_columns(sci_vars_dict)
     return sci_vars_dict, pressure_unit, pressure_name, l0
 
 
@@ -341,10 +398,7 @@ def append_evaluated_data(sDir, deployment, ds, variable_dict, common_stream_nam
                     else:
                         print('erroneous data - rejected all')
 
-                    vars_dict[long_name]['t'] = np.append(vars_dict[long_name]['t'], tD)
-                    vars_dict[long_name]['pressure'] = np.append(vars_dict[long_name]['pressure'], pD)
-                    vars_dict[long_name]['values'] = np.append(vars_dict[long_name]['values'], varD)
-                    vars_dict[long_name]['deployments'] = np.append(vars_dict[long_name]['deployments'], deployD)
+                    append_to_columns(vars_dict[long_name], tD, pD, varD, deployD)
                 total_len += l0
 
         except AttributeError:
@@ -364,80 +418,49 @@ def reject_erroneous_data(r, v, t, y, z, d, fz):
     :param fz: fill values defined in the data file
     :return: filtered data from fill values, NaNs, extreme values '|1e7|' and data outside global ranges
     """
-
-    # reject fill values
-    fv_ind = z != fz
-    y_nofv = y[fv_ind]
-    t_nofv = t[fv_ind]
-    z_nofv = z[fv_ind]
-    d_nofv = d[fv_ind]
-    print(len(z) - len(z_nofv), ' fill values')
-
-    # reject NaNs
-    nan_ind = ~np.isnan(z_nofv)
-    t_nofv_nonan = t_nofv[nan_ind]
-    y_nofv_nonan = y_nofv[nan_ind]
-    z_nofv_nonan = z_nofv[nan_ind]
-    d_nofv_nonan = d_nofv[nan_ind]
-    print(len(z_nofv) - len(z_nofv_nonan), ' NaNs')
-
-    # reject extreme values
-    ev_ind = cf.reject_extreme_values(z_nofv_nonan)
-    t_nofv_nonan_noev = t_nofv_nonan[ev_ind]
-    y_nofv_nonan_noev = y_nofv_nonan[ev_ind]
-    z_nofv_nonan_noev = z_nofv_nonan[ev_ind]
-    d_nofv_nonan_noev = d_nofv_nonan[ev_ind]
-    print(len(z_nofv_nonan) - len(z_nofv_nonan_noev), ' Extreme Values', '|1e7|')
-
-    # reject values outside global ranges:
     global_min, global_max = cf.get_global_ranges(r, v)
     if isinstance(global_min, (int, float)) and isinstance(global_max, (int, float)):
-        gr_ind = cf.reject_global_ranges(z_nofv_nonan_noev, global_min, global_max)
-        dtime = t_nofv_nonan_noev[gr_ind]
-        zpressure = y_nofv_nonan_noev[gr_ind]
-        ndata = z_nofv_nonan_noev[gr_ind]
-        ndeploy = d_nofv_nonan_noev[gr_ind]
+        ind, n_fv, n_nan, n_ev, n_gr = cf.erroneous_data_mask(z, fz, global_min, global_max)
     else:
-        gr_ind = []
-        dtime = t_nofv_nonan_noev
-        zpressure = y_nofv_nonan_noev
-        ndata = z_nofv_nonan_noev
-        ndeploy = d_nofv_nonan_noev
+        ind, n_fv, n_nan, n_ev, n_gr = cf.erroneous_data_mask(z, fz)
 
-    print('{} global ranges [{} - {}]'.format(len(ndata) - len(z_nofv_nonan_noev), global_min, global_max))
+    print(n_fv, ' fill values')
+    print(n_nan, ' NaNs')
+    print(n_ev, ' Extreme Values', '|1e7|')
+    print('{} global ranges [{} - {}]'.format(n_gr, global_min, global_max))
+
+    # apply the combined selection once to all aligned arrays
+    dtime = t[ind]
+    zpressure = y[ind]
+    ndata = z[ind]
+    ndeploy = d[ind]
 
     return dtime, zpressure, ndata, ndeploy
 
 
 def reject_timestamps_data_portal(subsite, r, tt, yy, zz, dd):
-    dr = pd.read_csv('https://datareview.marine.rutgers.edu/notes/export')
-    drn = dr.loc[dr.type == 'exclusion']
+    # reject data in the time ranges flagged for exclusion in the Data Review Database
     t_ex = tt
     y_ex = yy
     z_ex = zz
     d_ex = dd
 
-    if len(drn) != 0:
-        subsite_node = '-'.join((subsite, r.split('-')[1]))
-        drne = drn.loc[drn.reference_designator.isin([subsite, subsite_node, r])]
-        if len(drne['reference_designator']) != 0:
-            for ij, row in drne.iterrows():
-                sdate = cf.format_dates(row.start_date)
-                edate = cf.format_dates(row.end_date)
-                ts = np.datetime64(sdate)
-                te = np.datetime64(edate)
-                if len(t_ex) != 0:
-                    if t_ex.max() < ts or t_ex.min() > te:
-                        print('outside range - skipping')
-                        continue
-                    else:
-                        ind = np.where((t_ex < ts) | (t_ex > te), True, False)
-                        if len(ind) != 0:
-                            t_ex = t_ex[ind]
-                            z_ex = z_ex[ind]
-                            y_ex = y_ex[ind]
-                            d_ex = d_ex[ind]
-                            print('Portal: excluding {} timestamps in [{} - {}]'.format(len(ind), sdate, edate))
+    if len(tt) > 0:
+        time_ranges = []
+        for sdate, edate, ts, te in cf.exclusion_time_ranges(subsite, r):
+            if tt.max() < ts or tt.min() > te:
+                print('outside range - skipping')
+            else:
+                time_ranges.append([sdate, edate, ts, te])
+
+        if len(time_ranges) > 0:
+            ind, counts = cf.time_exclusion_mask(tt, [[ts, te] for _, _, ts, te in time_ranges])
+            t_ex = tt[ind]
+            z_ex = zz[ind]
+            y_ex = yy[ind]
+            d_ex = dd[ind]
+            for (sdate, edate, _, _), n in zip(time_ranges, counts):
+                print('Portal: excluding {} timestamps in [{} - {}]'.format(n, sdate, edate))
 
     return t_ex, y_ex, z_ex, d_ex
 
@@ -481,17 +504,6 @@ def reject_data_in_depth_range(tt, yy, zz, dd, zdbar):
 
 
 def reject_suspect_data(t, y, z, d, timestamps):
-    t = [(np.datetime64(pd.to_datetime(tx))) for tx in t]
-    data = pd.DataFrame({'yy': y, 'zz': z, 'dd': d, 'tt': t}, index=t)
-    dtime = [(np.datetime64(pd.to_datetime(row))) for row in timestamps]
-    #dtime = np.array(timestamps, dtype='datetime64[ns]')
-
-    if pd.to_datetime(max(t)) > pd.to_datetime(min(dtime)) or pd.to_datetime(min(t)) < pd.to_datetime(max(dtime)):
-        ind = np.where((dtime >= min(t)) & (dtime <= max(t)))
-        if len(dtime) - len(ind[0]) > 0:
-            list_to_drop = [value for index, value in enumerate(dtime) if index in list(ind[0])]
-            dtime = list_to_drop
-
-        data = data.drop(dtime)
-
-    return data['tt'], data['yy'].values, data['zz'].values, data['dd'].values
+    # reject data at the suspect timestamps
+    ind = cf.suspect_timestamp_mask(t, timestamps)
+    return np.asarray(t)[ind], y[ind], z[ind], d[ind]
@@ -2,7 +2,6 @@
 import os
 import itertools
 import pandas as pd
-import xarray as xr
 import numpy as np
 import functions.common as cf
 import matplotlib
@@ -34,7 +33,7 @@ def compare_variable_attributes(fdatasets, r):
         deployment = fdatasets[ii].split('/')[-1].split('_')[0].split('deployment')[-1]
         deployment = int(deployment)
 
-        ds = xr.open_dataset(fdatasets[ii], mask_and_scale=False)
+        ds = cf.open_nc_dataset(fdatasets[ii], mask_and_scale=False)
         time = ds['time'].values
 
         dr_dp = '-'.join((str(deployment))) #,ds.collection_method, ds.stream
@@ -78,7 +77,7 @@ def append_data(vars_df, fdatasets):
 
     for ii in [0, 1]:  # range(len(fdatasets)):
         print('\n', fdatasets[ii].split('/')[-1])
-        ds = xr.open_dataset(fdatasets[ii], mask_and_scale=False)
+        ds = cf.open_nc_dataset(fdatasets[ii], mask_and_scale=False)
         dr_ms = '-'.join((ds.collection_method, ds.stream))
 
         # get data:
@@ -222,7 +221,7 @@ def main(sDir, url_list, preferred_only, name_list):
 
         for ii in [0, 1]:  # range(len(fdatasets)):
             print('\n', fdatasets[ii].split('/')[-1])
-            ds = xr.open_dataset(fdatasets[ii], mask_and_scale=False)
+            ds = cf.open_nc_dataset(fdatasets[ii], mask_and_scale=False)
             dr_ms = '-'.join((ds.collection_method, ds.stream))
 
             # get data:
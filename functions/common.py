@@ -4,27 +4,34 @@ import pandas as pd
 import requests
 import re
 import itertools
+import functools
+import json
+import io
 import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import xarray as xr
 import numpy as np
 import datetime as dt
-from urllib.request import urlopen
-import json
 from geopy.distance import geodesic
 import urllib3
 import functions.plotting as pf
+import functions.group_by_timerange as gt
+import functions.remote_cache as rc
+import functions.running_stats as rs
+import functions.http_client as hc
+import functions.nc_mirror as nm
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 def check_request_status(thredds_url):
     check_complete = thredds_url.replace('/catalog/', '/fileServer/')
     check_complete = check_complete.replace('/catalog.html', '/status.txt')
-    session = requests.session()
-    r = session.get(check_complete)
+    r = hc.get(check_complete)
     while r.status_code != requests.codes.ok:
         print('Data request is still fulfilling. Trying again in 1 minute.')
         time.sleep(60)
-        r = session.get(check_complete)
+        r = hc.get(check_complete)
     print('Data request has fulfilled.')
 
 
@@ -40,33 +47,85 @@ def create_dir(new_dir):
                 raise
 
 
-def deploy_location_check(refdes):
-    # Calculate the distance in kilometers between an instrument's location (defined in asset management) and previous
-    # deployment locations
-    deploy_loc = {}
+def deploy_location_check(refdes, exact=False):
+    """
+    Calculate the distance in kilometers between an instrument's location (defined in asset management) and previous
+    deployment locations
+    :param refdes: reference designator
+    :param exact: if True, calculate each distance with geopy (geodesic) instead of the vectorized calculation
+    :return: dictionary of diff_km_Dx_to_Dy: distance
+    """
     dr_data = refdes_datareview_json(refdes)
-    for i, d in enumerate(dr_data['instrument']['deployments']):
-        deploy_loc[i] = {}
-        deploy_loc[i]['deployment'] = d['deployment_number']
-        deploy_loc[i]['lat'] = d['latitude']
-        deploy_loc[i]['lon'] = d['longitude']
-
-    # put info in a data frame
-    df = pd.DataFrame.from_dict(deploy_loc, orient='index').sort_index()
+    deployments = dr_data['instrument']['deployments']
+    deploy_num = [int(d['deployment_number']) for d in deployments]
+    lat = np.array([d['latitude'] for d in deployments], dtype=float)
+    lon = np.array([d['longitude'] for d in deployments], dtype=float)
+
+    # every deployment is compared to all of the deployments listed before it
+    i1, i0 = np.tril_indices(len(deployments), -1)
+    if exact:
+        dist = np.full(len(i1), np.nan)
+    else:
+        dist = vincenty_distance(lat[i0], lon[i0], lat[i1], lon[i1])
+
     y = {}
-    for i, k in df.iterrows():
-        if i > 0:
-            loc1 = [k['lat'], k['lon']]
-            d1 = int(k['deployment'])
-            for x in range(i):
-                info0 = df.iloc[x]
-                compare = 'diff_km_D{}_to_D{}'.format(d1, int(info0['deployment']))
-                loc0 = [info0['lat'], info0['lon']]
-                diff_loc = round(geodesic(loc0, loc1).kilometers, 4)
-                y.update({compare: diff_loc})
+    for i, x, diff_loc in zip(i1, i0, dist):
+        if np.isnan(diff_loc):  # exact calculation, or the vectorized calculation didn't converge
+            diff_loc = geodesic([lat[x], lon[x]], [lat[i], lon[i]]).kilometers
+        compare = 'diff_km_D{}_to_D{}'.format(deploy_num[i], deploy_num[x])
+        y.update({compare: round(float(diff_loc), 4)})
     return y
 
 
+def vincenty_distance(lat1, lon1, lat2, lon2, max_iter=200, tol=1e-12):
+    """
+    Distance in kilometers between arrays of points on the WGS-84 ellipsoid (Vincenty's inverse formula). Agrees
+    with geopy's geodesic to well under a millimeter.
+    :param lat1, lon1, lat2, lon2: arrays of coordinates in decimal degrees
+    :return: array of distances, NaN where the formula doesn't converge (nearly antipodal points)
+    """
+    a = 6378.137
+    f = 1 / 298.257223563
+    b = (1 - f) * a
+
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2)]
+    u1 = np.arctan((1 - f) * np.tan(lat1))
+    u2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    big_l = lon2 - lon1
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # points on the equator: cos2_alpha = 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            converged = np.abs(lam - lam_prev) < tol
+            if converged.all():
+                break
+
+        u_sq = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        dist = b * big_a * (sigma - delta_sigma)
+
+    return np.where(converged, dist, np.nan)
+
+
 def filter_collocated_instruments(main_sensor, datasets):
     # Remove collocated instruments from a list of datasets from THREDDS
     datasets_filtered = []
@@ -100,7 +159,7 @@ def get_deployment_information(data, deployment):
 
 def get_url_content(url_address):
     # get content of a url in a json format
-    r = requests.get(url_address)
+    r = hc.get(url_address)
     if r.status_code is not 200:
         print(r.reason)
         print('Problem wi chatth', url_address)
@@ -109,75 +168,192 @@ def get_url_content(url_address):
     return url_content
 
 def get_global_ranges(refdes, variable, api_user=None, api_token=None):
+    # return [global_min, global_max] for a variable (None if not defined), from the global range table
+    ranges = get_global_range_table(refdes, api_user, api_token)
+    return global_range_values(ranges, variable)
+
+
+@functools.lru_cache(maxsize=128)
+def get_global_range_table(refdes, api_user=None, api_token=None):
+    """
+    Return all QC parameters defined in uFrame for a reference designator. The table is fetched once per run (and
+    kept on disk, see functions.remote_cache), so looking up the ranges for many variables costs one request.
+    :param refdes: reference designator
+    :return: dictionary of (streamParameter, qcId): {parameter: value}
+    """
     port = '12578'
     spl = refdes.split('-')
     base_url = '{}/qcparameters/inv/{}/{}/{}/'.format(port, spl[0], spl[1], '-'.join((spl[2], spl[3])))
     url = 'https://ooinet.oceanobservatories.org/api/m2m/{}'.format(base_url)
-    if (api_user is None) or (api_token is None):
-        r = requests.get(url, verify=False)
+
+    entry = rc.read_entry('global_ranges', url)
+    if entry is not None and (rc.OFFLINE or rc.is_fresh(entry)):
+        qc_params = json.loads(entry['content'])
     else:
-        r = requests.get(url, auth=(api_user, api_token), verify=False)
-
-    if r.status_code is 200:
-        if r.json():  # If r.json is not empty
-            values = pd.io.json.json_normalize(r.json())
-            t1 = values[values['qcParameterPK.streamParameter'] == variable]
-            if not t1.empty:
-                t2 = t1[t1['qcParameterPK.qcId'] == 'dataqc_globalrangetest_minmax']
-                if not t2.empty:
-                    global_min = float(t2[t2['qcParameterPK.parameter'] == 'dat_min'].iloc[0]['value'])
-                    global_max = float(t2[t2['qcParameterPK.parameter'] == 'dat_max'].iloc[0]['value'])
-                else:
-                    global_min = None
-                    global_max = None
-            else:
-                global_min = None
-                global_max = None
+        if (api_user is None) or (api_token is None):
+            r = hc.get(url, verify=False)
         else:
-            global_min = None
-            global_max = None
-    else:
-        raise Exception('uFrame is not responding to request for global ranges. Try again later.')
+            r = hc.get(url, auth=(api_user, api_token), verify=False)
+
+        if r.status_code != 200:
+            raise Exception('uFrame is not responding to request for global ranges. Try again later.')
+        qc_params = r.json()
+        rc.write_entry('global_ranges', url, r.text)
+
+    ranges = dict()
+    if not isinstance(qc_params, list):  # empty or error response
+        qc_params = []
+    for qp in qc_params:
+        pk = qp['qcParameterPK']
+        key = (pk['streamParameter'], pk['qcId'])
+        if key not in ranges:
+            ranges[key] = dict()
+        # keep the first value listed, as the per-variable lookup always has
+        if pk['parameter'] not in ranges[key]:
+            ranges[key][pk['parameter']] = qp['value']
+
+    return ranges
+
 
+def get_stream_global_ranges(refdes, variables, api_user=None, api_token=None):
+    """
+    Return the global ranges for all variables of a stream with one lookup
+    :param refdes: reference designator
+    :param variables: list of variable names
+    :return: dictionary of variable: [global_min, global_max]
+    """
+    ranges = get_global_range_table(refdes, api_user, api_token)
+    return {v: global_range_values(ranges, v) for v in variables}
+
+
+def global_range_values(ranges, variable):
+    gr = ranges.get((variable, 'dataqc_globalrangetest_minmax'))
+    try:
+        global_min = float(gr['dat_min'])
+        global_max = float(gr['dat_max'])
+    except (TypeError, KeyError):
+        global_min = None
+        global_max = None
     return [global_min, global_max]
 
 
 def get_nc_urls(catalog_urls):
     """
-    Return a list of urls to access netCDF files in THREDDS
+    Return a list of urls to access netCDF files in THREDDS. Catalog pages are cached on disk (see
+    functions.remote_cache), so each catalog is only downloaded once per cache ttl.
     :param catalog_urls: List of THREDDS catalog urls
     :return: List of netCDF urls for data access
     """
-    tds_url = 'https://opendap.oceanobservatories.org/thredds/dodsC'
-    datasets = []
-    for i in catalog_urls:
-        # check that the request has fulfilled
-        check_request_status(i)
-
-        dataset = requests.get(i).text
-        ii = re.findall(r'href=[\'"]?([^\'" >]+)', dataset)
-        #x = re.findall(r'(ooi/.*?.nc)', dataset)
-        x = [y for y in ii if y.endswith('.nc')]
-        for i in x:
-            if i.endswith('.nc') == False:
-                x.remove(i)
-        for i in x:
-            try:
-                float(i[-4])
-            except:
-                x.remove(i)
-        #dataset = [os.path.join(tds_url, i) for i in x]
-        dataset = [os.path.join(tds_url, i.split('=')[-1]) for i in x]
-        datasets.append(dataset)
+    resolved = resolve_catalogs(catalog_urls)
+    datasets = [resolved.get(i, []) for i in catalog_urls]
     datasets = list(itertools.chain(*datasets))
     return datasets
 
 
+def open_nc_dataset(nc_file, **kwargs):
+    """
+    Open a netCDF file with xarray. If the local mirror is on (see functions.nc_mirror), THREDDS files are
+    downloaded the first time they are opened and read from the local copy.
+    :param nc_file: url or path of a netCDF file
+    :param kwargs: keyword arguments passed to xr.open_dataset
+    """
+    return xr.open_dataset(nm.local_path(nc_file), **kwargs)
+
+
+def open_nc_mfdataset(nc_files, **kwargs):
+    # open several netCDF files as one dataset with xarray, reading local copies of mirrored files (see open_nc_dataset)
+    return xr.open_mfdataset([nm.local_path(f) for f in nc_files], **kwargs)
+
+
+def iter_nc_urls(catalog_urls, max_workers=8, wait=5, max_wait=60):
+    """
+    Resolve THREDDS catalogs concurrently. The status of all pending data requests is checked together, and the
+    time between checks doubles (up to max_wait) while requests are still fulfilling. Catalogs that can't be
+    resolved (e.g. the server can't be reached) are reported and skipped.
+    :param catalog_urls: List of THREDDS catalog urls
+    :param max_workers: number of threads used to check request status and download catalogs
+    :param wait: seconds to wait before the first re-check of pending requests
+    :param max_wait: maximum number of seconds between checks
+    :return: generator of (catalog url, list of netCDF urls), in the order the requests complete
+    """
+    pending = list(dict.fromkeys(catalog_urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0:
+            futures = {executor.submit(resolve_catalog, u): u for u in pending}
+            pending = []
+            for f in as_completed(futures):
+                try:
+                    nc_urls = f.result()
+                except Exception as e:
+                    print('Unable to resolve {}: {}'.format(futures[f], e))
+                    continue
+                if nc_urls is None:
+                    pending.append(futures[f])
+                else:
+                    yield futures[f], nc_urls
+
+            if len(pending) > 0:
+                print('{} data request(s) still fulfilling. Trying again in {} seconds.'.format(len(pending), wait))
+                time.sleep(wait)
+                wait = min(wait * 2, max_wait)
+
+
+def parse_catalog(catalog_html):
+    # return the netCDF urls listed in a THREDDS catalog page
+    tds_url = 'https://opendap.oceanobservatories.org/thredds/dodsC'
+    ii = re.findall(r'href=[\'"]?([^\'" >]+)', catalog_html)
+    #x = re.findall(r'(ooi/.*?.nc)', dataset)
+    x = [y for y in ii if y.endswith('.nc')]
+    for i in x:
+        if i.endswith('.nc') == False:
+            x.remove(i)
+    for i in x:
+        try:
+            float(i[-4])
+        except:
+            x.remove(i)
+    #dataset = [os.path.join(tds_url, i) for i in x]
+    dataset = [os.path.join(tds_url, i.split('=')[-1]) for i in x]
+    return dataset
+
+
+def request_fulfilled(thredds_url):
+    # check (without waiting) whether the data request for a THREDDS catalog has fulfilled
+    check_complete = thredds_url.replace('/catalog/', '/fileServer/')
+    check_complete = check_complete.replace('/catalog.html', '/status.txt')
+    r = hc.get(check_complete)
+    return r.status_code == requests.codes.ok
+
+
+def resolve_catalog(thredds_url):
+    """
+    Return the netCDF urls in a THREDDS catalog, or None if the data request is still fulfilling
+    :param thredds_url: THREDDS catalog url
+    """
+    # a catalog that is already cached has fulfilled
+    if not rc.OFFLINE and rc.read_entry('catalog', thredds_url) is None:
+        if not request_fulfilled(thredds_url):
+            return None
+    return parse_catalog(rc.fetch_text(thredds_url, 'catalog'))
+
+
+def resolve_catalogs(catalog_urls, max_workers=8):
+    """
+    Resolve THREDDS catalogs concurrently (see iter_nc_urls)
+    :param catalog_urls: List of THREDDS catalog urls
+    :param max_workers: number of threads used to check request status and download catalogs
+    :return: dictionary of catalog url: list of netCDF urls (catalogs that can't be resolved are left out)
+    """
+    resolved = dict()
+    for u, nc_urls in iter_nc_urls(catalog_urls, max_workers):
+        resolved[u] = nc_urls
+    return resolved
+
+
 def get_preferred_stream_info(refdes):
     ps_link = 'https://raw.githubusercontent.com/ooi-data-lab/data-review-tools/master/data_review/output/{}/{}/{}-preferred_stream.json'.format(
         refdes.split('-')[0], refdes, refdes)
-    pslnk = urlopen(ps_link)
-    psl = json.loads(pslnk.read())
+    psl = hc.get_json(ps_link)
     ps_df = pd.DataFrame.from_dict(psl, orient='index')
     ps_df = ps_df.reset_index()
     ps_df.rename(columns={'index': 'deployment'}, inplace=True)
@@ -192,7 +368,7 @@ def nc_attributes(nc_file):
     Return global information from a netCDF file
     :param nc_file: url for a netCDF file on the THREDDs server
     """
-    with xr.open_dataset(nc_file) as ds:
+    with open_nc_dataset(nc_file) as ds:
         fname = nc_file.split('/')[-1].split('.nc')[0]
         subsite = ds.subsite
         node = ds.node
@@ -206,12 +382,19 @@ def nc_attributes(nc_file):
 
 
 def refdes_datareview_json(refdes):
-    # returns information about a reference designator from the Data Review Database
+    # returns information about a reference designator from the Data Review Database. The response is requested once
+    # per run, and each call returns a new copy that the caller can modify
+    return json.loads(_refdes_datareview_text(refdes))
+
+
+@functools.lru_cache(maxsize=256)
+def _refdes_datareview_text(refdes):
     url = 'http://datareview.marine.rutgers.edu/instruments/view/'
     ref_des_url = os.path.join(url, refdes)
     ref_des_url += '.json'
-    r = requests.get(ref_des_url).json()
-    return r
+    r = hc.get(ref_des_url)
+    r.json()  # raise here (and don't cache the response) if it isn't json
+    return r.text
 
 
 def reject_global_ranges(data, gmin, gmax):
@@ -239,6 +422,13 @@ def reject_outliers(data, m=3):
     return ind
 
 def return_array_subsites_standard_loc(array):
+    # return the locations of the sites in an array from the Data Review Database. The sites are requested once per
+    # run, and each call returns a new copy that the caller can modify
+    return _array_subsites_standard_loc(array).copy()
+
+
+@functools.lru_cache(maxsize=16)
+def _array_subsites_standard_loc(array):
     DBurl= 'https://datareview.marine.rutgers.edu/regions/view/{}.json'.format(array)
     url_ct = get_url_content(DBurl)['region']['sites']
     loc_df = pd.DataFrame()
@@ -257,7 +447,7 @@ def return_stream_vars(stream):
     # return all variables that should be found in a stream (from the data review database)
     stream_vars = []
     dr = 'http://datareview.marine.rutgers.edu/streams/view/{}.json'.format(stream)
-    r = requests.get(dr)
+    r = hc.get(dr)
     params = r.json()['stream']['parameters']
     for p in params:
         stream_vars.append(p['name'])
@@ -278,7 +468,7 @@ def return_science_vars(stream):
     # return only the science variables (defined in preload) for a data stream
     sci_vars = []
     dr = 'http://datareview.marine.rutgers.edu/streams/view/{}.json'.format(stream)
-    r = requests.get(dr)
+    r = hc.get(dr)
     params = r.json()['stream']['parameters']
     for p in params:
         if p['data_product_type'] == 'Science Data':
@@ -336,162 +526,340 @@ def variable_statistics(var_data, stdev=None):
     :param variable: array containing data
     :param stdev: desired standard deviation to exclude from analysis
     """
+    # the data are processed in chunks (see functions.running_stats) instead of making filtered copies of the array
+    var_data = np.asarray(var_data)
     if stdev is None:
-        varD = var_data
+        stats = rs.RunningStats()
+        for c in rs.iter_chunks(var_data):
+            stats.update(c)
         num_outliers = None
+        n = stats.n + stats.n_nan
     else:
-        ind = reject_extreme_values(var_data)
-        var = var_data[ind]
-
-        if len(var) > 0:
-            ind2 = reject_outliers(var, stdev)
-            varD = var[ind2]
-            varD = varD.astype('float64')  # force variables to be float64 (float32 is not JSON serializable)
-            try:
-                num_outliers = int(np.sum(~ind) + np.sum(~ind2))
-            except TypeError:
-                num_outliers = int(np.sum(~np.array(ind2)))
-        else:
-            num_outliers = int(np.sum(~np.array(ind)))
-            varD = var
-
-    if len(varD) > 0:
-        mean = round(np.nanmean(varD), 4)
-        min = round(np.nanmin(varD), 4)
-        max = round(np.nanmax(varD), 4)
-        sd = round(np.nanstd(varD), 4)
-        n = len(varD)
+        num_outliers, stats = rs.clipped_statistics(lambda: rs.iter_chunks(var_data), stdev)
+        n = stats.n
+
+    if n > 0:
+        mean = round(stats.mean, 4)
+        min = round(stats.min, 4)
+        max = round(stats.max, 4)
+        sd = round(stats.std, 4)
     else:
         mean = None
         min = None
         max = None
         sd = None
-        n = 0
 
     return [num_outliers, mean, min, max, sd, n]
 
 
 def variable_statistics_spkir(var_data):
-    mean = []
-    min = []
-    max = []
-    sd = []
-    n = int(len(var_data.values.flatten()) - np.sum(np.isnan(var_data.values)))
+    # statistics for each wavelength (spectra), calculated for all wavelengths at once
+    vd = np.moveaxis(var_data.values, var_data.get_axis_num('spectra'), 0)
+    vd = vd.reshape(vd.shape[0], -1)
+    n = int(vd.size - np.sum(np.isnan(vd)))
     num_outliers = None
-    for i in range(len(var_data['spectra'])):
-        vd = var_data.sel(spectra=i).values
-        mean.append(round(np.nanmean(vd), 2))
-        min.append(round(np.nanmin(vd), 2))
-        max.append(round(np.nanmax(vd), 2))
-        sd.append(round(np.nanstd(vd), 2))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN wavelengths
+        mean = [round(float(x), 2) for x in np.nanmean(vd, axis=1)]
+        min = [round(float(x), 2) for x in np.nanmin(vd, axis=1)]
+        max = [round(float(x), 2) for x in np.nanmax(vd, axis=1)]
+        sd = [round(float(x), 2) for x in np.nanstd(vd, axis=1)]
 
     return [num_outliers, mean, min, max, sd, n]
 
 
+def stack_columns(var_data):
+    """
+    Return the columns of a 2D variable ({column: array}, see functions.combine_datasets) as one 2D array with a row
+    for each column. Columns can have different lengths (e.g. deployments with different numbers of bins), so shorter
+    columns are padded with NaNs.
+    :return: 2D array, and the length of each column
+    """
+    columns = [np.asarray(var_data[i], dtype='float64') for i in range(len(var_data))]
+    lengths = np.array([len(c) for c in columns], dtype='int64')
+    data = np.full((len(columns), int(lengths.max()) if len(columns) > 0 else 0), np.nan)
+    for i, c in enumerate(columns):
+        data[i, :len(c)] = c
+    return data, lengths
+
+
+def index_2d_data(var_data, fv, g_min=None, g_max=None):
+    """
+    Convert fill values and data outside of global ranges to NaNs for each column of a 2D variable
+    :param var_data: dictionary of column: array
+    :param fv: fill value
+    :param g_min, g_max: global ranges (None if there are no global ranges)
+    :return: dictionary of column: array with NaNs, and lists with the number of NaNs, fill values and data outside
+    of global ranges in each column
+    """
+    data, lengths = stack_columns(var_data)
+    isnan = np.isnan(data) & (np.arange(data.shape[1]) < lengths[:, np.newaxis])  # not counting the padding
+    isfv = data == fv
+    reject = isfv
+    n_nan = [int(x) for x in np.sum(isnan, axis=1)]
+    n_fv = [int(x) for x in np.sum(isfv, axis=1)]
+
+    if g_min is not None and g_max is not None:
+        outside = (data < g_min) | (data > g_max)
+        outside &= ~isfv
+        reject = reject | outside
+        n_grange = [int(x) for x in np.sum(outside, axis=1)]
+    else:
+        n_grange = ['no global ranges'] * len(data)
+
+    data[reject] = np.nan
+    fdata = {i: data[i, :lengths[i]] for i in range(len(data))}
+
+    return [fdata, n_nan, n_fv, n_grange]
+
+
+def variable_statistics_2d(var_data, stdev=None):
+    """
+    Calculate statistics for each column of a 2D variable (e.g. OPTAA wavelengths or ADCP bins), ignoring NaNs. Gives
+    the same results as variable_statistics for each column, calculated for all of the columns at once.
+    :param var_data: dictionary of column: array, or 2D array with a row for each column
+    :param stdev: desired standard deviation to exclude from analysis
+    :return: lists of num_outliers, mean, min, max, sd and n, one item for each column
+    """
+    if isinstance(var_data, dict):
+        data = stack_columns(var_data)[0]  # the padding is NaN, so it's ignored
+    else:
+        data = np.asarray(var_data, dtype='float64')
+    notnan = ~np.isnan(data)
+
+    def _mean_std(keep, n):
+        # mean and standard deviation of the kept values in each row
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.sum(np.where(keep, data, 0.0), axis=1) / n
+            sd = np.sqrt(np.sum(np.where(keep, (data - mean[:, np.newaxis]) ** 2, 0.0), axis=1) / n)
+        return mean, sd
+
+    if stdev is None:
+        keep = notnan
+        num_outliers = [None] * len(data)
+    else:
+        # reject extreme values, then outliers beyond stdev standard deviations of the mean
+        valid = (data > -1e7) & (data < 1e7)
+        m, s = _mean_std(valid, np.sum(valid, axis=1))
+        m = m[:, np.newaxis]
+        s = s[:, np.newaxis]
+        with np.errstate(invalid='ignore'):
+            keep = valid & ((np.abs(data - m) < stdev * s) | ~(s > 0.0))
+        num_outliers = [int(x) for x in np.sum(notnan & ~keep, axis=1)]
+
+    n = np.sum(keep, axis=1)
+    mean, sd = _mean_std(keep, n)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # columns without data
+        vmin = np.nanmin(np.where(keep, data, np.nan), axis=1)
+        vmax = np.nanmax(np.where(keep, data, np.nan), axis=1)
+    n = [int(x) for x in n]
+
+    def _round(values):
+        return [round(float(v), 4) if nn > 0 else None for v, nn in zip(values, n)]
+
+    return [num_outliers, _round(mean), _round(vmin), _round(vmax), _round(sd), n]
+
+
+def get_review_notes():
+    # return all review notes from the Data Review Database (downloaded once per run)
+    return _review_notes().copy()
+
+
+@functools.lru_cache(maxsize=1)
+def _review_notes():
+    r = hc.get('https://datareview.marine.rutgers.edu/notes/export')
+    return pd.read_csv(io.StringIO(r.text))
+
+
+@functools.lru_cache(maxsize=1)
+def get_exclusion_index():
+    """
+    Return the exclusion notes from the Data Review Database grouped by the reference designator they were entered
+    for (subsite, subsite-node or full reference designator). The notes are downloaded and the dates are parsed once
+    per run. Notes with dates that can't be parsed are skipped.
+    :return: dictionary of reference_designator: list of (row number, start date, end date, start datetime64,
+    end datetime64)
+    """
+    dr = _review_notes()
+    drn = dr.loc[dr.type == 'exclusion']
+    index = dict()
+    for i, (rd, sd, ed) in enumerate(zip(drn.reference_designator, drn.start_date, drn.end_date)):
+        try:
+            sdate = format_dates(sd)
+            edate = format_dates(ed)
+        except (ValueError, AttributeError, TypeError):
+            print('Skipping exclusion note for {} with invalid dates: {} to {}'.format(rd, sd, ed))
+            continue
+        if rd not in index:
+            index[rd] = []
+        index[rd].append((i, sdate, edate, np.datetime64(sdate), np.datetime64(edate)))
+    return index
+
+
+def exclusion_time_ranges(subsite, r):
+    """
+    Return the time ranges to exclude for a reference designator, from the exclusion notes entered for its subsite,
+    subsite-node or the reference designator itself
+    :param subsite: subsite (e.g. CE01ISSM)
+    :param r: reference designator
+    :return: list of (start date, end date, start datetime64, end datetime64), in the order of the notes export
+    """
+    subsite_node = '-'.join((subsite, r.split('-')[1]))
+    index = get_exclusion_index()
+    rows = []
+    for rd in dict.fromkeys([subsite, subsite_node, r]):
+        rows.extend(index.get(rd, []))
+    return [x[1:] for x in sorted(rows)]
+
+
 def format_dates(dd):
     fd = dt.datetime.strptime(dd.replace(',', ''), '%m/%d/%y %I:%M %p')
     fd2 = dt.datetime.strftime(fd, '%Y-%m-%dT%H:%M:%S')
     return fd2
 
 
-def reject_timestamps_in_groups(groups, d_groups, n_std, inpercentile):
-    y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_exclude = [], [], [], [], [], [], [], []
-
-    tm = 1
-    for ii in range(len(groups)):
-        nan_ind = d_groups[ii + tm].notnull()
-        if not nan_ind.any():
-            print('{} {} {}'.format('group', ii, 'is all NaNs'))
-            tm += 2
-            continue
-        xtime = d_groups[ii + tm][nan_ind]
-        ypres = d_groups[ii + tm + 1][nan_ind]
-        nval = d_groups[ii + tm + 2][nan_ind]
-        tm += 2
-
-        l_arr.append(len(nval))  # count of data to filter out small groups
-        y_avg.append(ypres.mean())
-        n_avg.append(nval.mean())
-        n_min.append(nval.min())
-        n_max.append(nval.max())
-
-        if n_std is not None:
-            upper_l = nval.mean() + n_std * nval.std()
-            lower_l = nval.mean() - n_std * nval.std()
-            n0_std.append(upper_l)
-            n1_std.append(lower_l)
-            t_ind = np.where((nval < lower_l) | (nval > upper_l), True, False)
-            # d_ind = np.where((nval > lower_l) & (nval < upper_l), True, False)
-        else:
-            upper_l = np.percentile(nval, 100 - inpercentile)
-            lower_l = np.percentile(nval, inpercentile)
-            n0_std.append(upper_l)
-            n1_std.append(lower_l)
-            t_ind = np.where((nval < lower_l) | (nval > upper_l), True, False)
-            # d_ind = np.where((nval > lower_l) & (nval < upper_l), True, False)
+def group_outliers(gi, y, values, n_std=None, inpercentile=None):
+    """
+    Find outliers in groups of data (e.g. depth ranges) for all groups at once. Outliers are outside of the mean +/-
+    n_std standard deviations of their group, or outside of the inpercentile and 100 - inpercentile percentiles if
+    n_std is None.
+    :param gi: groups of the data points (functions.group_by_timerange.GroupIndex)
+    :param y: array of pressure/depth
+    :param values: array of data values
+    :return: for the groups that contain data: average pressure, mean, min, max, upper limit, lower limit and
+    number of data points; and a boolean array of the outliers, in the order of the original data
+    """
+    mask, upper, lower = gi.outlier_mask(values, n_std, inpercentile)
+    counts = gi.counts
+    for ii in np.where(counts == 0)[0]:
+        print('{} {} {}'.format('group', ii, 'is all NaNs'))
 
-        time_exclude = np.append(time_exclude, xtime[t_ind].values)
-        # n_data = np.append(n_data, nval[d_ind].values)
-        # n_time = np.append(n_time, xtime[d_ind].values)
-        # n_pres = np.append(n_pres, ypres[d_ind].values)
+    ind = counts > 0
+    y_avg = list(gi.mean(y)[ind])
+    n_avg = list(gi.mean(values)[ind])
+    n_min = list(gi.min(values)[ind])
+    n_max = list(gi.max(values)[ind])
+    n0_std = list(upper[ind])
+    n1_std = list(lower[ind])
+    l_arr = [int(x) for x in counts[ind]]  # count of data to filter out small groups
 
-    time_to_exclude = np.unique(time_exclude)
+    return y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, mask
+
+
+def reject_timestamps_in_depth_ranges(t, y, values, ranges, n_std, inpercentile):
+    """
+    Group data by depth range and find the timestamps of the outliers in each group (see group_outliers)
+    :param t: array of timestamps
+    :param y: array of pressure/depth
+    :param values: array of data values
+    :param ranges: depth range edges (e.g. list(range(0, 100, 5)))
+    :return: y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr (see group_outliers) and the unique timestamps to
+    exclude
+    """
+    gi = gt.depth_groups(y, ranges)
+    y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, mask = group_outliers(gi, y, values, n_std, inpercentile)
+    time_to_exclude = pd.DatetimeIndex(np.unique(np.asarray(t)[mask])).astype(object).values
 
     return y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_to_exclude
 
 
-def reject_timestamps_dataportal(subsite, r, tt, yy, zz, lat=None, lon=None):
+def reject_timestamps_in_groups(groups, d_groups, n_std, inpercentile):
+    # same as reject_timestamps_in_depth_ranges, for the output of functions.group_by_timerange.group_by_depth_range
+    n_groups = len(groups)
+    xtime = d_groups[list(range(1, 3 * n_groups + 1, 3))].values.T.ravel()
+    ypres = d_groups[list(range(2, 3 * n_groups + 1, 3))].values.T.ravel().astype('float64')
+    nval = d_groups[list(range(3, 3 * n_groups + 1, 3))].values.T.ravel().astype('float64')
+    codes = np.repeat(np.arange(n_groups), len(d_groups))
+    codes[pd.isnull(xtime)] = -1
+
+    gi = gt.GroupIndex(codes, range(n_groups))
+    y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, mask = group_outliers(gi, ypres, nval, n_std, inpercentile)
+    time_to_exclude = pd.DatetimeIndex(np.unique(pd.to_datetime(xtime[mask]).values)).astype(object).values
 
-    dr = pd.read_csv('https://datareview.marine.rutgers.edu/notes/export')
-    drn = dr.loc[dr.type == 'exclusion']
-    i = 0
+    return y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_to_exclude
 
+
+def reject_timestamps_dataportal(subsite, r, tt, yy, zz, lat=None, lon=None):
+    # reject data in the time ranges flagged for exclusion in the Data Review Database
     t_ex = tt
     y_ex = yy
     z_ex = zz
     lat_ex = lat
     lon_ex = lon
 
-    if len(drn) != 0:
-        subsite_node = '-'.join((subsite, r.split('-')[1]))
-        drne = drn.loc[drn.reference_designator.isin([subsite, subsite_node, r])]
-        if len(drne['reference_designator']) != 0:
-            for ij, row in drne.iterrows():
-                sdate = format_dates(row.start_date)
-                edate = format_dates(row.end_date)
-                ts = np.datetime64(sdate)
-                te = np.datetime64(edate)
-                if tt.max() < ts:
-                    continue
-                elif tt.min() > te:
-                    continue
-                else:
-                    if i == 0:
-                        ind = np.where((tt < ts) | (tt > te), True, False)
-                        t_ex = tt[ind]
-                        z_ex = zz[ind]
-                        y_ex = yy[ind]
-                        if lat is not None:
-                            lat_ex = lat[ind]
-                        if lon is not None:
-                            lon_ex = lon[ind]
-                        i += 1
-                        print('excluding {} timestamps [{} - {}]'.format(np.sum(~ind), sdate, edate))
-                    else:
-                        ind = np.where((t_ex < ts) | (t_ex > te), True, False)
-                        t_ex = t_ex[ind]
-                        z_ex = z_ex[ind]
-                        y_ex = y_ex[ind]
-                        if lat is not None:
-                            lat_ex = lat_ex[ind]
-                        if lon is not None:
-                            lon_ex = lon_ex[ind]
-                        i += 1
-                        print('excluding {} timestamps [{} - {}]'.format(np.sum(~ind), sdate, edate))
+    if len(tt) > 0:
+        time_ranges = [x for x in exclusion_time_ranges(subsite, r) if x[2] <= tt.max() and x[3] >= tt.min()]
+        if len(time_ranges) > 0:
+            ind, counts = time_exclusion_mask(tt, [[ts, te] for _, _, ts, te in time_ranges])
+            t_ex = tt[ind]
+            z_ex = zz[ind]
+            y_ex = yy[ind]
+            if lat is not None:
+                lat_ex = lat[ind]
+            if lon is not None:
+                lon_ex = lon[ind]
+            for (sdate, edate, _, _), n in zip(time_ranges, counts):
+                print('excluding {} timestamps [{} - {}]'.format(n, sdate, edate))
 
     return t_ex, z_ex, y_ex, lat_ex, lon_ex
 
 
+def time_exclusion_mask(t, time_ranges):
+    """
+    Return a mask of the timestamps that fall outside of all time ranges. Overlapping ranges are merged and the
+    timestamps are located with one binary search, so the cost doesn't grow with the number of ranges.
+    :param t: array of timestamps (datetime64)
+    :param time_ranges: list of [start, end] time ranges to exclude (inclusive), as strings or datetime64
+    :return: boolean array (True = keep; NaT timestamps are dropped if there are time ranges), list of the number of
+    timestamps in each time range
+    """
+    t = np.asarray(t).astype('datetime64[ns]')
+    keep = np.ones(len(t), dtype=bool)
+    if len(time_ranges) == 0 or len(t) == 0:
+        return keep, [0] * len(time_ranges)
+
+    starts = np.array([np.datetime64(x[0]) for x in time_ranges]).astype('datetime64[ns]')
+    ends = np.array([np.datetime64(x[1]) for x in time_ranges]).astype('datetime64[ns]')
+
+    # NaT isn't outside of any time range
+    valid = ~np.isnat(t)
+    keep[~valid] = False
+    t = t[valid]
+
+    # binary search needs sorted timestamps
+    order = None
+    if not np.all(t[1:] >= t[:-1]):
+        order = np.argsort(t, kind='stable')
+        t = t[order]
+
+    counts = np.searchsorted(t, ends, side='right') - np.searchsorted(t, starts, side='left')
+    counts = [int(max(c, 0)) for c in counts]
+
+    # merge overlapping time ranges
+    srt = np.argsort(starts, kind='stable')
+    starts = starts[srt]
+    ends = ends[srt]
+    new_range = np.append(True, starts[1:] > np.maximum.accumulate(ends)[:-1])
+    merged_starts = starts[new_range]
+    merged_ends = np.maximum.reduceat(ends, np.flatnonzero(new_range))
+
+    # mark the excluded index ranges and expand them with a cumulative sum
+    edges = np.zeros(len(t) + 1, dtype=int)
+    np.add.at(edges, np.searchsorted(t, merged_starts, side='left'), 1)
+    np.add.at(edges, np.searchsorted(t, merged_ends, side='right'), -1)
+    excluded = np.cumsum(edges[:-1]) > 0
+
+    if order is None:
+        keep[valid] = ~excluded
+    else:
+        kept = np.empty(len(t), dtype=bool)
+        kept[order] = ~excluded
+        keep[valid] = kept
+
+    return keep, counts
+
+
 def add_pressure_to_dictionary_of_sci_vars(ds):
     y_unit = []
     y_name = []
@@ -575,6 +943,27 @@ def add_pressure_to_dictionary_of_sci_vars(ds):
     return pressure, y, y_unit, y_name, y_fillvalue
 
 
+def erroneous_data_mask(z, fz, global_min=None, global_max=None):
+    """
+    Evaluate the fill value, NaN, extreme value '|1e7|' and global range tests in one pass over the data. Each data
+    point is labeled with the first test it fails, so the counts match applying the tests one after another.
+    :param z: data values
+    :param fz: fill value defined in the data file
+    :param global_min: global range minimum (optional)
+    :param global_max: global range maximum (optional)
+    :return: boolean array of data that pass all tests, n_fv, n_nan, n_ev, n_gr
+    """
+    z = np.asarray(z)
+    stage = np.zeros(len(z), dtype=np.uint8)
+    if global_min is not None and global_max is not None:
+        stage[(z < global_min) | (z > global_max)] = 4
+    stage[~reject_extreme_values(z)] = 3
+    stage[np.isnan(z)] = 2
+    stage[z == fz] = 1
+    counts = np.bincount(stage, minlength=5)
+    return stage == 0, int(counts[1]), int(counts[2]), int(counts[3]), int(counts[4])
+
+
 def reject_erroneous_data(r, v, t, y, z, fz, lat=None, lon=None):
 
     """
@@ -586,83 +975,52 @@ def reject_erroneous_data(r, v, t, y, z, fz, lat=None, lon=None):
     :param fz: fill values defined in the data file
     :return: filtered data from fill values, NaNs, extreme values '|1e7|' and data outside global ranges
     """
+    global_min, global_max = get_global_ranges(r, v)
+    if isinstance(global_min, (int, float)) and isinstance(global_max, (int, float)):
+        ind, n_fv, n_nan, n_ev, n_gr = erroneous_data_mask(z, fz, global_min, global_max)
+    else:
+        ind, n_fv, n_nan, n_ev, n_gr = erroneous_data_mask(z, fz)
 
-    # reject fill values
-    fv_ind = z != fz
-    y_nofv = y[fv_ind]
-    t_nofv = t[fv_ind]
-    z_nofv = z[fv_ind]
-    if lat is not None:
-        lat = lat[fv_ind]
-    if lon is not None:
-        lon = lon[fv_ind]
-    n_fv = np.sum(~fv_ind)
     print(n_fv, ' fill values')
-
-    # reject NaNs
-    nan_ind = ~np.isnan(z_nofv)
-    t_nofv_nonan = t_nofv[nan_ind]
-    y_nofv_nonan = y_nofv[nan_ind]
-    z_nofv_nonan = z_nofv[nan_ind]
-    if lat is not None:
-        lat = lat[nan_ind]
-    if lon is not None:
-        lon = lon[nan_ind]
-    n_nan = np.sum(~nan_ind)
     print(n_nan, ' NaNs')
-
-    # reject extreme values
-    ev_ind = reject_extreme_values(z_nofv_nonan)
-    t_nofv_nonan_noev = t_nofv_nonan[ev_ind]
-    y_nofv_nonan_noev = y_nofv_nonan[ev_ind]
-    z_nofv_nonan_noev = z_nofv_nonan[ev_ind]
-    if lat is not None:
-        lat = lat[ev_ind]
-    if lon is not None:
-        lon = lon[ev_ind]
-    n_ev = np.sum(~ev_ind)
     print(n_ev, ' Extreme Values', '|1e7|')
-
-    # reject values outside global ranges:
-    global_min, global_max = get_global_ranges(r, v)
     if isinstance(global_min, (int, float)) and isinstance(global_max, (int, float)):
-        gr_ind = reject_global_ranges(z_nofv_nonan_noev, global_min, global_max)
-        dtime = t_nofv_nonan_noev[gr_ind]
-        zpressure = y_nofv_nonan_noev[gr_ind]
-        ndata = z_nofv_nonan_noev[gr_ind]
-        if lat is not None:
-            lat = lat[gr_ind]
-        if lon is not None:
-            lon = lon[gr_ind]
-        n_gr = np.sum(~gr_ind)
         print('{} Global ranges [{} - {}]'.format(n_gr, global_min, global_max))
     else:
-        n_gr = 0
-        dtime = t_nofv_nonan_noev
-        zpressure = y_nofv_nonan_noev
-        ndata = z_nofv_nonan_noev
         print('no global ranges for {}'.format(v))
 
+    # apply the combined selection once to all aligned arrays
+    dtime = t[ind]
+    zpressure = y[ind]
+    ndata = z[ind]
+    if lat is not None:
+        lat = lat[ind]
+    if lon is not None:
+        lon = lon[ind]
+
     return dtime, zpressure, ndata, n_fv, n_nan, n_ev, n_gr, global_min, global_max, lat, lon
 
 def reject_suspect_data(t, y, z, timestamps):
-    print(timestamps[1], type(timestamps[1]))
-    data = pd.DataFrame({'yy': y, 'zz': z, 'tt': t}, index=t)
-    l0 = len(data['tt'])
+    # reject data at the suspect timestamps
+    ind = suspect_timestamp_mask(t, timestamps)
+    print('rejected suspect data', int(np.sum(ind)), 'out < - > in', len(ind))
+    return np.asarray(t)[ind], z[ind], y[ind]
 
-    dtime = [(np.datetime64(str(row))) for row in timestamps]
-    print(dtime[1], type(dtime[1]), pd.to_datetime(min(dtime)), min(dtime))
 
-    if pd.to_datetime(t.max()) > pd.to_datetime(min(dtime)) or pd.to_datetime(t.min()) < pd.to_datetime(max(dtime)):
-        ind = np.where((dtime >= t.min()) & (dtime <= t.max()))
-        if len(dtime) - len(ind[0]) > 0:
-            list_to_drop = [value for index, value in enumerate(dtime) if index in list(ind[0])]
-            dtime = list_to_drop
-
-        data = data.drop(dtime)
-        print('rejected suspect data', len(data['tt']), 'out < - > in', l0)
-
-    return data['tt'], data['zz'].values, data['yy'].values
+def suspect_timestamp_mask(t, timestamps):
+    """
+    Return a mask of the data that are not at a suspect timestamp. Both sets of times are compared as int64
+    nanoseconds with a sort-based join (np.isin), instead of dropping timestamps from an indexed DataFrame.
+    :param t: array of data timestamps
+    :param timestamps: list of suspect timestamps (strings or datetime64)
+    :return: boolean array (True = keep)
+    """
+    t_ns = np.asarray(t).astype('datetime64[ns]').view('int64')
+    if len(timestamps) == 0:
+        return np.ones(len(t_ns), dtype=bool)
+    # entry by entry: str(Timestamp) drops zero fractional seconds, so a list of strings can mix formats
+    ex_ns = np.array([np.datetime64(x) for x in timestamps]).astype('datetime64[ns]').view('int64')
+    return ~np.isin(t_ns, np.unique(ex_ns))
 
 
 def in_list(x, ix):
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+"""
+@brief Point decimation for plots of long records.
+A figure can't show more points than it has pixels, so points that would be drawn on top of each other are dropped
+before plotting. The data are binned on a grid with one cell per pixel of the axes (and, for color-coded scatter
+plots, by color), and the last point in each occupied cell (the one drawn on top) is kept. The minimum and maximum
+of each pixel column and the extremes of x and color are always kept, so extrema and isolated outliers are still
+plotted. The number of points plotted depends on the size and resolution of the figure, not on the length of the
+record.
+"""
+
+import numpy as np
+
+DPI = 150  # resolution of the saved figures (see functions.plotting.save_fig)
+COLOR_LEVELS = 16  # number of color bins for color-coded scatter plots
+
+
+def axes_pixels(ax, dpi=None):
+    # width and height of the axes in pixels in the saved figure
+    if dpi is None:
+        dpi = DPI
+    fig = ax.get_figure()
+    pos = ax.get_position()
+    width = int(np.ceil(pos.width * fig.get_figwidth() * dpi))
+    height = int(np.ceil(pos.height * fig.get_figheight() * dpi))
+    return max(width, 1), max(height, 1)
+
+
+def _as_float(a):
+    a = np.asarray(a)
+    if np.issubdtype(a.dtype, np.datetime64):
+        f = a.astype('datetime64[ns]').astype('int64').astype('float64')
+        f[np.isnat(a)] = np.nan
+        return f
+    return a.astype('float64')
+
+
+def _bins(a, n):
+    # bin number (0 to n - 1) of each value, between the min and max of the values
+    amin = np.min(a)
+    span = np.max(a) - amin
+    if span == 0:
+        return np.zeros(len(a), dtype='int64')
+    return np.minimum(((a - amin) / span * n).astype('int64'), n - 1)
+
+
+def decimate_indices(x, y, width, height, c=None, color_levels=None):
+    """
+    Find the data points to plot
+    :param x: x data (numbers or datetime64)
+    :param y: y data
+    :param width: width of the axes in pixels
+    :param height: height of the axes in pixels
+    :param c: data used for the colors of a scatter plot (optional)
+    :param color_levels: number of color bins. Default: COLOR_LEVELS
+    :return: sorted indices of the points to plot (points with NaNs aren't plotted)
+    """
+    if color_levels is None:
+        color_levels = COLOR_LEVELS
+    xf = _as_float(x)
+    yf = _as_float(y)
+    valid = ~np.isnan(xf) & ~np.isnan(yf)
+    if c is not None:
+        cf = _as_float(c)
+        valid &= ~np.isnan(cf)
+    ind = np.flatnonzero(valid)
+    if len(ind) == 0:
+        return ind
+
+    ix = _bins(xf[ind], width)
+    iy = _bins(yf[ind], height)
+    cell = ix * height + iy
+    if c is not None:
+        cell = cell * color_levels + _bins(cf[ind], color_levels)
+    cell_last = len(cell) - 1 - np.unique(cell[::-1], return_index=True)[1]
+
+    # minimum and maximum of each pixel column
+    order = np.lexsort((yf[ind], ix))
+    col_start = np.flatnonzero(np.r_[True, np.diff(ix[order]) != 0])
+    col_end = np.r_[col_start[1:], len(order)] - 1
+
+    # x and color extremes, so axis limits and color scales are the same as with all data
+    extremes = [np.argmin(xf[ind]), np.argmax(xf[ind])]
+    if c is not None:
+        extremes += [np.argmin(cf[ind]), np.argmax(cf[ind])]
+
+    keep = np.unique(np.concatenate((cell_last, order[col_start], order[col_end], extremes)))
+    return ind[keep]
+
+
+def legend_text(n_before, n_after):
+    return 'plotted {} of {} points (decimated)'.format(n_after, n_before)
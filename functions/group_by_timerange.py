@@ -2,10 +2,244 @@
 
 import pandas as pd
 import numpy as np
-from pandas import Series
+from collections import OrderedDict
 from pandas import Grouper
 from pandas import DataFrame
-from pandas import concat
+
+PERIOD_ALIASES = {'A': 'Y', 'AS': 'Y'}  # Grouper frequencies that are spelled differently for periods in newer pandas
+
+
+class GroupIndex(object):
+    """
+    Groups of data points, found by sorting the group number of each point once. The data stay in the original
+    arrays: order contains the indices of the points sorted by group (in their original order within a group), and
+    the points in group i are order[starts[i]:ends[i]]. Reductions are calculated for all groups at once and skip
+    NaNs (like pandas).
+    """
+    def __init__(self, codes, labels):
+        """
+        :param codes: group number of each data point (-1 if the point isn't in any group)
+        :param labels: label of each group (e.g. time period or depth interval)
+        """
+        self.codes = np.asarray(codes, dtype='int64')
+        self.labels = labels
+        order = np.argsort(self.codes, kind='stable')
+        self.order = order[self.codes[order] >= 0]
+        sorted_codes = self.codes[self.order]
+        self.starts = np.searchsorted(sorted_codes, np.arange(len(labels)), side='left')
+        self.ends = np.searchsorted(sorted_codes, np.arange(len(labels)), side='right')
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def counts(self):
+        return self.ends - self.starts
+
+    def indices(self, i):
+        # indices of the points in group i, in the original arrays
+        return self.order[self.starts[i]:self.ends[i]]
+
+    def sorted_values(self, values):
+        # values of the points in all groups, sorted by group
+        return np.asarray(values)[self.order]
+
+    def _reduce(self, ufunc, values, empty):
+        out = np.full(len(self), empty, dtype='float64')
+        nonempty = self.counts > 0
+        if nonempty.any():
+            out[nonempty] = ufunc.reduceat(values, self.starts[nonempty])
+        return out
+
+    def count(self, values):
+        # number of values that are not NaN in each group
+        return self._reduce(np.add, ~np.isnan(self.sorted_values(values).astype('float64')), 0).astype('int64')
+
+    def sum(self, values):
+        v = self.sorted_values(values).astype('float64')
+        return self._reduce(np.add, np.where(np.isnan(v), 0.0, v), 0.0)
+
+    def mean(self, values):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum(values) / self.count(values)
+
+    def std(self, values, ddof=1):
+        # standard deviation of each group (ddof=1 like pandas)
+        v = self.sorted_values(values).astype('float64')
+        group_mean = np.repeat(self.mean(values), self.counts)
+        sq = np.where(np.isnan(v), 0.0, (v - group_mean) ** 2)
+        dof = self.count(values) - ddof
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(dof > 0, np.sqrt(self._reduce(np.add, sq, 0.0) / dof), np.nan)
+
+    def min(self, values):
+        return self._reduce(np.fmin, self.sorted_values(values).astype('float64'), np.nan)
+
+    def max(self, values):
+        return self._reduce(np.fmax, self.sorted_values(values).astype('float64'), np.nan)
+
+    def percentile(self, values, q):
+        """
+        q-th percentile of each group, with linear interpolation (like np.percentile)
+        """
+        v = self.sorted_values(values).astype('float64')
+        group = np.repeat(np.arange(len(self)), self.counts)
+        v = v[np.lexsort((v, group))]  # sorted within each group, NaNs last
+        n = self.count(values)
+        out = np.full(len(self), np.nan)
+        ind = n > 0
+        pos = self.starts[ind] + (n[ind] - 1) * q / 100.
+        lo = np.floor(pos).astype('int64')
+        hi = np.ceil(pos).astype('int64')
+        out[ind] = v[lo] + (v[hi] - v[lo]) * (pos - lo)
+        return out
+
+    def describe(self, values):
+        # summary statistics of each group, in the format of pandas describe
+        return DataFrame(OrderedDict([('count', self.count(values).astype('float64')),
+                                      ('mean', self.mean(values)),
+                                      ('std', self.std(values)),
+                                      ('min', self.min(values)),
+                                      ('25%', self.percentile(values, 25)),
+                                      ('50%', self.percentile(values, 50)),
+                                      ('75%', self.percentile(values, 75)),
+                                      ('max', self.max(values))]), index=self.labels)
+
+    def outlier_mask(self, values, n_std=None, inpercentile=None, ddof=1):
+        """
+        Find the data points that are outside the limits of their group: mean +/- n_std standard deviations, or
+        between the inpercentile and 100 - inpercentile percentiles if n_std is None
+        :param ddof: delta degrees of freedom of the standard deviation (1 like pandas, 0 like numpy)
+        :return: boolean array in the order of the original data (True = outside of the limits), and the upper and
+        lower limit of each group
+        """
+        if n_std is not None:
+            mean = self.mean(values)
+            std = self.std(values, ddof)
+            upper = mean + n_std * std
+            lower = mean - n_std * std
+        else:
+            upper = self.percentile(values, 100 - inpercentile)
+            lower = self.percentile(values, inpercentile)
+
+        values = np.asarray(values, dtype='float64')
+        mask = np.zeros(len(values), dtype=bool)
+        ingroup = self.codes >= 0
+        codes = self.codes[ingroup]
+        v = values[ingroup]
+        mask[ingroup] = (v < lower[codes]) | (v > upper[codes])
+        return mask, upper, lower
+
+
+def time_groups(data_x, g_freq):
+    """
+    Group timestamps by calendar period (e.g. 'A' year, 'M' month, 'D' day). Empty periods between the first and last
+    timestamp are included, like pandas Grouper.
+    """
+    t = pd.DatetimeIndex(data_x)
+    try:
+        periods = t.to_period(g_freq)
+    except ValueError:
+        periods = t.to_period(PERIOD_ALIASES.get(g_freq, g_freq))
+    if len(periods) == 0:
+        return GroupIndex(np.array([], dtype='int64'), pd.PeriodIndex([], freq=periods.freq))
+    ordinals = periods.asi8
+    first = ordinals.min()
+    labels = pd.period_range(start=periods.min(), end=periods.max(), freq=periods.freq)
+    return GroupIndex(ordinals - first, labels)
+
+
+def sort_by_time(t, *arrays):
+    # sort timestamps (and arrays of the same length) by time. Data that are already sorted are returned as they are
+    t = np.asarray(t)
+    if len(t) < 2 or np.all(t[1:] >= t[:-1]):
+        return (t,) + tuple(np.asarray(a) for a in arrays)
+    order = np.argsort(t, kind='stable')
+    return (t[order],) + tuple(np.asarray(a)[order] for a in arrays)
+
+
+class CalendarPartitioner(object):
+    """
+    Calendar periods (year 'Y', month 'M' or day 'D') of a sorted array of timestamps (see sort_by_time). The period
+    boundaries of each unit are found once for the whole array, and the data points in a period are given as a slice,
+    so the data of each period are views of the original arrays. Periods of a smaller unit can be taken within a
+    period of a larger unit (e.g. the days of one month).
+    """
+    def __init__(self, t):
+        self.t = np.asarray(t).astype('datetime64[ns]', copy=False)
+        self._boundaries = dict()
+
+    def boundaries(self, unit):
+        # period ordinal (as in pandas Period) and index of the first data point of each non-empty period
+        if unit not in self._boundaries:
+            ordinals = self.t.astype('datetime64[{}]'.format(unit)).astype('int64')
+            starts = np.flatnonzero(np.r_[len(ordinals) > 0, np.diff(ordinals) != 0])
+            self._boundaries[unit] = (ordinals[starts], starts)
+        return self._boundaries[unit]
+
+    def _periods_within(self, unit, within):
+        ordinals, starts = self.boundaries(unit)
+        ends = np.r_[starts[1:], len(self.t)]
+        if within is None:
+            within = slice(0, len(self.t))
+        i0, i1 = np.searchsorted(starts, [within.start, within.stop])
+        return ordinals[i0:i1], starts[i0:i1], ends[i0:i1]
+
+    def periods(self, unit, within=None):
+        """
+        Iterate over the non-empty periods in time order
+        :param unit: 'Y', 'M' or 'D'
+        :param within: slice of a larger period (from periods), or None for all data
+        :return: (position of the period in group_index(unit, within), pandas Period, slice of the data points)
+        """
+        ordinals, starts, ends = self._periods_within(unit, within)
+        for o, s, e in zip(ordinals, starts, ends):
+            yield int(o - ordinals[0]), pd.Period(ordinal=int(o), freq=unit), slice(int(s), int(e))
+
+    def group_index(self, unit, within=None):
+        """
+        GroupIndex of the periods, for statistics of each period (e.g. describe). Empty periods between the first and
+        last period are included, like pandas Grouper. Group codes refer to the data points in within.
+        """
+        ordinals, starts, ends = self._periods_within(unit, within)
+        if len(ordinals) == 0:
+            return GroupIndex(np.array([], dtype='int64'), pd.PeriodIndex([], freq=unit))
+        labels = pd.period_range(start=pd.Period(ordinal=int(ordinals[0]), freq=unit),
+                                 periods=int(ordinals[-1] - ordinals[0]) + 1, freq=unit)
+        return GroupIndex(np.repeat(ordinals - ordinals[0], ends - starts), labels)
+
+
+def depth_groups(z, ranges):
+    # group data by depth range (bins as in pd.cut). Points outside of the ranges aren't in any group
+    cut = pd.cut(np.asarray(z), ranges)
+    return GroupIndex(cut.codes, cut.categories)
+
+
+def _wide_frame(gi, arrays):
+    # one block of columns per group, padded with NaNs to the length of the largest group (numbered from 1)
+    n_groups = len(gi)
+    counts = gi.counts
+    max_len = int(counts.max()) if n_groups > 0 else 0
+    row = np.arange(len(gi.order)) - np.repeat(gi.starts, counts)
+    col = np.repeat(np.arange(n_groups), counts)
+
+    blocks = []
+    for a in arrays:
+        a = gi.sorted_values(a)
+        if np.issubdtype(a.dtype, np.datetime64):
+            out = np.full((max_len, n_groups), np.datetime64('NaT'), dtype=a.dtype)
+        elif np.issubdtype(a.dtype, np.number):
+            out = np.full((max_len, n_groups), np.nan)
+        else:
+            out = np.full((max_len, n_groups), np.nan, dtype=object)
+        out[row, col] = a
+        blocks.append(out)
+
+    columns = dict()
+    for g in range(n_groups):
+        for j, out in enumerate(blocks):
+            columns[g * len(blocks) + j + 1] = out[:, g]
+    return DataFrame(columns, columns=range(1, n_groups * len(blocks) + 1))
 
 
 def group_by_time_range(data_x, data_y, g_freq):
@@ -15,9 +249,8 @@ def group_by_time_range(data_x, data_y, g_freq):
     series['DO'] = data_y
     groups = series.groupby(Grouper(freq=g_freq))
 
-    g_data = concat([DataFrame(x[1].values) for x in groups], axis=1)
-    g_data = DataFrame(g_data)
-    g_data.columns = range(1, len(g_data.columns) + 1)
+    gi = GroupIndex(groups.ngroup().values, range(len(groups)))
+    g_data = _wide_frame(gi, [series['Date'].values, series['DO'].values])
 
     return groups, g_data
 
@@ -28,9 +261,8 @@ def group_by_time_frequency(data_x, data_y, columns, g_freq):
     data_in[columns[1:len(columns)]] = data_y
     groups = data_in.groupby(Grouper(freq=g_freq))
 
-    d_groups = concat([DataFrame(x[1].values) for x in groups], axis=1)
-    d_groups = DataFrame(d_groups)
-    d_groups.columns = range(1, len(d_groups.columns) + 1)
+    gi = GroupIndex(groups.ngroup().values, range(len(groups)))
+    d_groups = _wide_frame(gi, [data_in[c].values for c in columns])
 
     return groups, d_groups
 
@@ -41,10 +273,9 @@ def group_by_depth_range(t, z, x, columns, ranges):
     data_in[columns[1]] = z
     data_in[columns[2]] = x
 
-    groups = data_in.groupby(pd.cut(data_in[columns[1]], ranges))
+    groups = data_in.groupby(pd.cut(data_in[columns[1]], ranges), observed=False)
 
-    d_groups = concat([DataFrame(x[1].values) for x in groups], axis=1)
-    d_groups = DataFrame(d_groups)
-    d_groups.columns = range(1, len(d_groups.columns) + 1)
+    gi = depth_groups(z, ranges)
+    d_groups = _wide_frame(gi, [data_in[c].values for c in columns])
 
     return groups, d_groups
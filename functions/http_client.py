@@ -0,0 +1,123 @@
+#! /usr/bin/env python
+"""
+@brief Shared HTTP client for the Data Review Database, M2M and THREDDS requests.
+All requests go through one requests.Session, so connections (and TLS handshakes) are reused between calls.
+Failed GET requests (connection errors and 5xx responses) are retried with backoff, every request has a timeout,
+and the number of simultaneous requests to one host is limited. Request counts by host are available from
+request_stats().
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+TIMEOUT = (10, 120)  # (connect, read) seconds
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+MAX_PER_HOST = 8  # maximum number of simultaneous requests to one host
+
+_session = None
+_lock = threading.Lock()
+_host_limits = dict()
+_stats = dict()
+
+
+def _new_session():
+    # urllib3 < 1.26 calls allowed_methods method_whitelist
+    if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS'):
+        methods = dict(allowed_methods=['GET', 'HEAD'])
+    else:
+        methods = dict(method_whitelist=['GET', 'HEAD'])
+    retry = Retry(total=RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=[500, 502, 503, 504],
+                  raise_on_status=False, **methods)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=MAX_PER_HOST, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    # return the shared session, creating it on first use
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _new_session()
+        return _session
+
+
+def _reset_after_fork():
+    # worker processes (e.g. scripts.nc_file_analysis.run_analysis) open their own connections instead of sharing the
+    # parent's sockets
+    global _session, _lock
+    _session = None
+    _lock = threading.Lock()
+    _host_limits.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _host_limit(host):
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_limits[host]
+
+
+def _count(host, key):
+    with _lock:
+        if host not in _stats:
+            _stats[host] = dict(requests=0, errors=0)
+        _stats[host][key] += 1
+
+
+def get(url, **kwargs):
+    """
+    Send a GET request through the shared session
+    :param url: url to request
+    :param kwargs: keyword arguments passed to requests (e.g. auth, headers, verify). A default timeout is added if
+    none is given
+    :return: requests.Response
+    """
+    return _request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    # send a HEAD request through the shared session (see get)
+    return _request('HEAD', url, **kwargs)
+
+
+def _request(method, url, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    host = urlparse(url).netloc
+    with _host_limit(host):
+        _count(host, 'requests')
+        try:
+            r = get_session().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            _count(host, 'errors')
+            raise
+    if r.status_code >= 400:
+        _count(host, 'errors')
+    return r
+
+
+def get_json(url, **kwargs):
+    # return the content of a url in a json format
+    return get(url, **kwargs).json()
+
+
+def request_stats():
+    # return a copy of the request counts by host: {host: {'requests': n, 'errors': n}}
+    with _lock:
+        return {host: dict(v) for host, v in _stats.items()}
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
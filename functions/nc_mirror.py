@@ -0,0 +1,374 @@
+#! /usr/bin/env python
+"""
+@brief Local mirror of netCDF files from THREDDS.
+Files are downloaded from the THREDDS fileServer (in parallel byte ranges, resuming interrupted downloads) into a
+content-addressed store (objects named by their sha256), and each url is given a local path that ends with the
+original file name, so code that parses file names keeps working. The least recently used files are removed when
+the mirror grows beyond max_size.
+Downloads are checked against the size (and the checksum, if the server sends one in a Digest or Content-MD5 header)
+reported by the server, and by default a mirrored file is checked against the server again before it is used, so a
+file that changed on the server or a corrupt copy is downloaded again.
+The index and the stored files are updated under a lock file, so several processes (e.g. the workers of
+scripts.nc_file_analysis.run_analysis) can share a mirror, and a file is only downloaded by one of them at a time.
+Mirroring is off by default. It is turned on by setting the environment variable DATA_REVIEW_MIRROR_DIR (and
+optionally DATA_REVIEW_MIRROR_MAX_GB and DATA_REVIEW_MIRROR_VERIFY), or with set_mirror_options. When it is on,
+files are mirrored when they are opened (see local_path and functions.common.open_nc_dataset).
+"""
+
+import os
+import json
+import base64
+import time
+import shutil
+import hashlib
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import functions.http_client as hc
+
+try:
+    import fcntl
+except ImportError:  # Windows: the mirror can only be shared by the threads of one process
+    fcntl = None
+
+MIRROR_DIR = os.environ.get('DATA_REVIEW_MIRROR_DIR')
+MAX_SIZE = float(os.environ.get('DATA_REVIEW_MIRROR_MAX_GB', 100)) * 1e9  # bytes
+CHUNK_SIZE = 16 * 1024 * 1024  # bytes per ranged request
+WORKERS = 4  # simultaneous ranged requests per file
+VERIFY = os.environ.get('DATA_REVIEW_MIRROR_VERIFY', 'yes').lower() not in ['0', 'false', 'no']
+
+_lock = threading.Lock()
+_thread_locks = dict()
+
+
+def _reset_after_fork():
+    # locks held by other threads of the parent process are never released in the child
+    global _lock
+    _lock = threading.Lock()
+    _thread_locks.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextlib.contextmanager
+def _locked(name):
+    """
+    Hold a lock on part of the mirror (e.g. 'index'), shared by the threads of this process and, where fcntl is
+    available, by all processes using the mirror
+    """
+    with _lock:
+        thread_lock = _thread_locks.setdefault(name, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(MIRROR_DIR, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, '{}.lock'.format(name)), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def set_mirror_options(mirror_dir=None, max_size=None, workers=None, verify=None):
+    """
+    Change the mirror settings for the current run
+    :param mirror_dir: directory of the local mirror (mirroring is on when this is set)
+    :param max_size: maximum size of the mirror in bytes
+    :param workers: number of simultaneous ranged requests per file
+    :param verify: if True, check mirrored files against the server before they are used
+    """
+    global MIRROR_DIR, MAX_SIZE, WORKERS, VERIFY
+    if mirror_dir is not None:
+        MIRROR_DIR = mirror_dir
+    if max_size is not None:
+        MAX_SIZE = float(max_size)
+    if workers is not None:
+        WORKERS = workers
+    if verify is not None:
+        VERIFY = verify
+
+
+def enabled():
+    return MIRROR_DIR is not None
+
+
+def file_server_url(url):
+    # return the fileServer (plain HTTP download) url for an OPeNDAP url
+    return url.replace('/thredds/dodsC/', '/thredds/fileServer/')
+
+
+def _url_hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def _index_path():
+    return os.path.join(MIRROR_DIR, 'index.json')
+
+
+def _load_index():
+    try:
+        with open(_index_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _save_index(index):
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    tmp = '{}.{}.{}.tmp'.format(_index_path(), os.getpid(), threading.get_ident())
+    with open(tmp, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp, _index_path())
+
+
+def file_digests(path, algorithms=('sha256',)):
+    # return the hex digests of a file, reading it once
+    hashes = [hashlib.new(a) for a in algorithms]
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            for h in hashes:
+                h.update(block)
+    return {a: h.hexdigest() for a, h in zip(algorithms, hashes)}
+
+
+def sha256_file(path):
+    return file_digests(path)['sha256']
+
+
+def server_info(r):
+    """
+    Return what a server response says about a file: size, last_modified and checksums ({algorithm: hex digest},
+    from Digest (RFC 3230) or Content-MD5 headers). Missing items are None (or an empty dictionary).
+    """
+    try:
+        size = int(r.headers['Content-Length'])
+    except (KeyError, ValueError):
+        size = None
+
+    checksums = dict()
+    digest_names = {'sha-256': 'sha256', 'sha-512': 'sha512', 'sha': 'sha1', 'md5': 'md5'}
+    headers = [('md5', r.headers.get('Content-MD5'))]
+    for d in r.headers.get('Digest', '').split(','):
+        if '=' in d:
+            name, value = d.strip().split('=', 1)
+            headers.append((digest_names.get(name.lower()), value))
+    for algorithm, value in headers:
+        if algorithm is not None and value:
+            try:
+                checksums[algorithm] = base64.b64decode(value).hex()
+            except ValueError:
+                continue
+
+    return dict(size=size, last_modified=r.headers.get('Last-Modified'), checksums=checksums)
+
+
+def check_file(path, remote):
+    """
+    Check a file against the server information from server_info
+    :return: description of the first difference, or None if the file matches
+    """
+    if remote['size'] is not None and os.path.getsize(path) != remote['size']:
+        return 'size {} != {} on the server'.format(os.path.getsize(path), remote['size'])
+    if remote['checksums']:
+        digests = file_digests(path, tuple(remote['checksums']))
+        for algorithm, value in remote['checksums'].items():
+            if digests[algorithm] != value:
+                return '{} checksum does not match the server'.format(algorithm)
+    return None
+
+
+def local_path(url):
+    """
+    Return the path to open for a netCDF file: the mirrored copy of a THREDDS file (downloaded on first use) when the
+    mirror is on, otherwise the url itself. Files that can't be mirrored are read remotely.
+    """
+    if not enabled() or '/thredds/' not in url:
+        return url
+    try:
+        return mirror_file(url)
+    except Exception as e:
+        print('Unable to mirror {} - reading remotely ({})'.format(url, e))
+        return url
+
+
+def mirror_file(url, verify=None):
+    """
+    Return the local path of a netCDF file, downloading it into the mirror if needed
+    :param url: OPeNDAP (dodsC) or fileServer url of the file
+    :param verify: if True, check a previously mirrored file against the size, checksum and modification time
+    reported by the server before it is used (the mirrored copy is used if the server can't be reached).
+    Default: VERIFY
+    :return: local path, ending with the original file name
+    """
+    if verify is None:
+        verify = VERIFY
+
+    with _locked('index'):
+        info = _load_index().get(url)
+    if info is not None and os.path.isfile(info['path']) and os.path.getsize(info['path']) == info['size']:
+        problem = None
+        if verify:
+            try:
+                r = hc.head(file_server_url(url), allow_redirects=True)
+                if r.status_code != 200:
+                    raise Exception('status {}'.format(r.status_code))
+                remote = server_info(r)
+            except Exception as e:
+                print('Unable to check {} against the server - using the mirrored copy ({})'.format(url, e))
+                remote = None
+            if remote is not None:
+                try:
+                    problem = check_file(info['path'], remote)
+                except OSError:
+                    problem = 'the mirrored copy was removed'  # evicted by another process
+                if problem is None and remote['last_modified'] and info.get('last_modified') and \
+                        remote['last_modified'] != info['last_modified']:
+                    problem = 'the file changed on the server'
+        if problem is None:
+            with _locked('index'):
+                index = _load_index()
+                if url in index:
+                    index[url]['last_access'] = time.time()
+                    _save_index(index)
+            return info['path']
+        print('{} - downloading {} again'.format(problem, url))
+
+    # one download of a file at a time (the partial download is shared, so it can be resumed)
+    with _locked(_url_hash(url)):
+        with _locked('index'):
+            current = _load_index().get(url)
+        if current is not None and os.path.isfile(current['path']) and \
+                current['sha256'] != (info or dict()).get('sha256'):
+            return current['path']  # mirrored by another process while this one was waiting
+
+        part, remote = _download(file_server_url(url))
+        problem = check_file(part, remote)
+        if problem is not None:
+            os.remove(part)
+            raise Exception('Download of {} failed: {}'.format(url, problem))
+        checksum = sha256_file(part)
+
+        obj = os.path.join(MIRROR_DIR, 'objects', checksum[0:2], checksum)
+        path = os.path.join(MIRROR_DIR, 'files', _url_hash(url), url.split('/')[-1])
+        with _locked('index'):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            if os.path.isfile(obj):
+                os.remove(part)  # identical content is already stored
+            else:
+                os.replace(part, obj)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.lexists(path):
+                os.remove(path)
+            try:
+                os.link(obj, path)
+            except OSError:
+                os.symlink(obj, path)
+
+            index = _load_index()
+            index[url] = dict(path=path, object=obj, sha256=checksum, size=os.path.getsize(obj),
+                              last_access=time.time(), last_modified=remote['last_modified'])
+            _save_index(index)
+            _evict(index, keep=url)
+
+    return path
+
+
+def mirror_urls(urls, max_workers=4):
+    """
+    Mirror a list of netCDF files ahead of time (several files at a time), e.g. to prepare for working offline.
+    Files that can't be downloaded keep their remote url.
+    :param urls: list of OPeNDAP urls
+    :param max_workers: number of files downloaded at the same time
+    :return: list of local paths (or urls), in the same order
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(local_path, urls))
+
+
+def _download(url):
+    """
+    Download a file into the mirror's partial directory, resuming a previous interrupted download (called with the
+    lock on the file held, see mirror_file)
+    :return: path of the downloaded file, and the server information about the file (see server_info)
+    """
+    partial_dir = os.path.join(MIRROR_DIR, 'partial')
+    os.makedirs(partial_dir, exist_ok=True)
+    part = os.path.join(partial_dir, '{}.part'.format(_url_hash(url)))
+    done_file = '{}.json'.format(part)
+
+    r = hc.head(url, allow_redirects=True)
+    remote = server_info(r)
+    size = remote['size']
+
+    if r.status_code != 200 or size is None or r.headers.get('Accept-Ranges') != 'bytes':
+        # no ranged requests: stream the whole file
+        with hc.get(url, stream=True) as rr:
+            rr.raise_for_status()
+            if r.status_code != 200:
+                remote = server_info(rr)
+            with open(part, 'wb') as f:
+                for block in rr.iter_content(1024 * 1024):
+                    f.write(block)
+        return part, remote
+
+    # chunks that were completed by an earlier (interrupted) download
+    try:
+        with open(done_file) as f:
+            done = json.load(f)
+        if done['size'] != size or not os.path.isfile(part):
+            raise ValueError
+    except (OSError, ValueError, KeyError):
+        done = dict(size=size, chunks=[])
+        with open(part, 'wb') as f:
+            f.truncate(size)
+
+    chunk_lock = threading.Lock()
+
+    def _fetch_chunk(i):
+        start = i * CHUNK_SIZE
+        end = min(start + CHUNK_SIZE, size) - 1
+        rr = hc.get(url, headers={'Range': 'bytes={}-{}'.format(start, end)})
+        if rr.status_code != 206 or len(rr.content) != end - start + 1:
+            raise Exception('Ranged request failed for {} (bytes {}-{})'.format(url, start, end))
+        with open(part, 'r+b') as f:
+            f.seek(start)
+            f.write(rr.content)
+        with chunk_lock:
+            done['chunks'].append(i)
+            with open(done_file, 'w') as f:
+                json.dump(done, f)
+
+    n_chunks = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+    todo = [i for i in range(n_chunks) if i not in done['chunks']]
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        list(executor.map(_fetch_chunk, todo))
+
+    os.remove(done_file)
+    return part, remote
+
+
+def _evict(index, keep=None):
+    # remove the least recently used files until the mirror is smaller than MAX_SIZE
+    objects = dict()
+    for u, info in index.items():
+        objects[info['object']] = info['size']
+    total = sum(objects.values())
+
+    for u in sorted(index, key=lambda x: index[x]['last_access']):
+        if total <= MAX_SIZE:
+            break
+        if u == keep:
+            continue
+        info = index.pop(u)
+        shutil.rmtree(os.path.dirname(info['path']), ignore_errors=True)
+        if info['object'] not in [x['object'] for x in index.values()]:
+            if os.path.isfile(info['object']):
+                os.remove(info['object'])
+            total -= info['size']
+
+    _save_index(index)
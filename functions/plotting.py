@@ -9,8 +9,11 @@ import matplotlib.dates as mdates
 import os
 import numpy as np
 import functions.common as cf
+import functions.decimation as dc
 import pandas as pd
 
+DECIMATE = False  # default for the decimate option of the timeseries, profile and cross-section plots
+
 
 def get_units(variable):
     try:
@@ -27,6 +30,38 @@ def format_date_axis(axis, figure):
     figure.autofmt_xdate()
 
 
+def decimate_points(ax, x, y, c=None):
+    """
+    Drop the points that can't be seen in the saved figure (see functions.decimation)
+    :param ax: axes the points will be plotted on
+    :param c: data used for the colors of a scatter plot (optional)
+    :return: x, y and c of the points to plot, and the text to add to the legend ('' if no points were dropped)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    ind = dc.decimate_indices(x, y, *dc.axes_pixels(ax), c=c)
+    if c is not None:
+        c = np.asarray(c)[ind]
+    if len(ind) == len(x):
+        return x, y, c, ''
+    return x[ind], y[ind], c, dc.legend_text(len(x), len(ind))
+
+
+def add_legend_text(leg_text, text):
+    # add text to the first legend entry, or make it the first entry
+    if not text:
+        return leg_text
+    if len(leg_text) == 0:
+        return (text,)
+    return ('{}\n{}'.format(leg_text[0], text),) + tuple(leg_text[1:])
+
+
+def add_legend_below(ax, leg_text, dec_text=''):
+    # legend below the axes, with the decimation text (see decimate_points) added to the first entry
+    leg_text = add_legend_text(tuple(leg_text), dec_text)
+    ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+
+
 def plot_adcp(tm, bins, v, ylabel, clabel, color, n_stdev=None):
     if type(n_stdev) == int:
         # remove data outside of n standard deviations
@@ -69,13 +104,16 @@ def plot_presf_2d(tm, var, varname, varunits):
     return fig, ax
 
 
-def plot_profiles(x, y, t, ylabel, xlabel, clabel, stdev=None):
+def plot_profiles(x, y, t, ylabel, xlabel, clabel, stdev=None, decimate=None, leg_below=None):
     """
     Create a profile plot for mobile instruments
     :param x: .nc data array containing data for plotting variable of interest (e.g. density)
     :param y: .nc data array containing data for plotting on the y-axis (e.g. pressure)
     :param t: .nc data array containing time data to be used for coloring (x,y) data pairs
     :param stdev: desired standard deviation to exclude from plotting
+    :param decimate: drop the points that can't be seen in the saved figure. Default: DECIMATE
+    :param leg_below: legend entries to show below the plot, instead of the default legend (the decimation text is
+    added to them)
     """
     if type(t) is not np.ndarray and type(t) is not list:
         t = t.values
@@ -100,6 +138,13 @@ def plot_profiles(x, y, t, ylabel, xlabel, clabel, stdev=None):
         leg_text = ('removed {} outliers (SD={})'.format(outliers, stdev),)
 
     fig, ax = plt.subplots()
+    if decimate is None:
+        decimate = DECIMATE
+    dec_text = ''
+    if decimate:
+        xD, yD, tD, dec_text = decimate_points(ax, xD, yD, c=tD)
+        leg_text = add_legend_text(leg_text, dec_text)
+
     plt.margins(y=.08, x=.02)
     plt.grid()
     sct = ax.scatter(xD, yD, c=tD, s=2, edgecolor='None', cmap='rainbow')
@@ -112,7 +157,10 @@ def plot_profiles(x, y, t, ylabel, xlabel, clabel, stdev=None):
     #plt.xlim([-0.5, 0.5])
     ax.set_xlabel(xlabel, fontsize=9)
     ax.set_ylabel(ylabel, fontsize=9)
-    ax.legend(leg_text, loc='best', fontsize=6)
+    if leg_below is None:
+        ax.legend(leg_text, loc='best', fontsize=6)
+    else:
+        add_legend_below(ax, leg_below, dec_text)
 
     return fig, ax
 
@@ -153,12 +201,13 @@ def plot_spkir_wv(tm, var, varname, varunits, wv_i):
     return fig, ax
 
 
-def plot_timeseries_all(x, y, y_name, y_units, stdev=None):
+def plot_timeseries_all(x, y, y_name, y_units, stdev=None, decimate=None):
     """
     Create a simple timeseries plot
     :param x: array containing data for x-axis (e.g. time)
     :param y: array containing data for y-axis
     :param stdev: desired standard deviation to exclude from plotting
+    :param decimate: drop the points that can't be seen in the saved figure. Default: DECIMATE
     """
     if stdev is None:
         xD = x
@@ -180,6 +229,12 @@ def plot_timeseries_all(x, y, y_name, y_units, stdev=None):
         leg_text = ('removed {} outliers (SD={})'.format(outliers, stdev),)
 
     fig, ax = plt.subplots()
+    if decimate is None:
+        decimate = DECIMATE
+    if decimate:
+        xD, yD, _, dec_text = decimate_points(ax, xD, yD)
+        leg_text = add_legend_text(leg_text, dec_text)
+
     plt.grid()
     plt.plot(xD, yD, '.', markersize=2)
 
@@ -192,12 +247,13 @@ def plot_timeseries_all(x, y, y_name, y_units, stdev=None):
     return fig, ax
 
 
-def plot_timeseries(x, y, y_name, stdev=None):
+def plot_timeseries(x, y, y_name, stdev=None, decimate=None):
     """
     Create a simple timeseries plot
     :param x: array containing data for x-axis (e.g. time)
     :param y: .nc data array for plotting on the y-axis, including data values, coordinates, and variable attributes
     :param stdev: desired standard deviation to exclude from plotting
+    :param decimate: drop the points that can't be seen in the saved figure. Default: DECIMATE
     """
 
     if type(y) is not np.ndarray:
@@ -229,6 +285,12 @@ def plot_timeseries(x, y, y_name, stdev=None):
     fig, ax = plt.subplots()
     plt.grid()
     if len(xD) > 0:
+        if decimate is None:
+            decimate = DECIMATE
+        if decimate:
+            xD, yD, _, dec_text = decimate_points(ax, xD, yD)
+            leg_text = add_legend_text(leg_text, dec_text)
+
         plt.plot(xD, yD, '.', markersize=2)
 
         y_units = get_units(y)
@@ -355,7 +417,8 @@ def plot_ts(sal_vector, temp_vector, dens, salinity, temperature, cbar):
     return fig, ax
 
 
-def plot_xsection(subsite, x, y, z, clabel, ylabel, t_eng=None, m_water_depth=None, inpercentile=None, stdev=None):
+def plot_xsection(subsite, x, y, z, clabel, ylabel, t_eng=None, m_water_depth=None, inpercentile=None, stdev=None,
+                  decimate=None, leg_below=None):
     """
     Create a cross-section plot for mobile instruments
     :param subsite: subsite part of reference designator to plot
@@ -368,6 +431,9 @@ def plot_xsection(subsite, x, y, z, clabel, ylabel, t_eng=None, m_water_depth=No
     :param m_water_depth: .nc data array containing water depth data from the engineering data stream
     :param inpercentile: percentile of data to exclude from plot
     :param stdev: desired standard deviation to exclude from plotting
+    :param decimate: drop the points that can't be seen in the saved figure. Default: DECIMATE
+    :param leg_below: legend entries to show below the plot, instead of the default legend (the decimation text is
+    added to them)
     """
     if type(z) is not np.ndarray:
         z = z.values
@@ -412,7 +478,14 @@ def plot_xsection(subsite, x, y, z, clabel, ylabel, t_eng=None, m_water_depth=No
     fig, ax = plt.subplots()
     plt.margins(y=.08, x=.02)
     try:
-        xc = ax.scatter(xD, yD, c=zD, s=2, edgecolor='None')
+        if decimate is None:
+            decimate = DECIMATE
+        dec_text = ''
+        xP, yP, zP = xD, yD, zD
+        if decimate:
+            xP, yP, zP, dec_text = decimate_points(ax, xD, yD, c=zD)
+
+        xc = ax.scatter(xP, yP, c=zP, s=2, edgecolor='None')
         #plt.ylim([0, 100])
         ax.invert_yaxis()
 
@@ -438,14 +511,17 @@ def plot_xsection(subsite, x, y, z, clabel, ylabel, t_eng=None, m_water_depth=No
         ax.set_ylabel(ylabel, fontsize=9)
         format_date_axis(ax, fig)
 
+        leg = ()
         if zeros is None and type(outliers) is str:
             leg = ('rm: {} outliers (SD={})'.format(outliers, stdev),)
-            ax.legend(leg, loc=1, fontsize=6)
         if type(zeros) is str and outliers is None:
             leg = ('rm: {} values <=0.0'.format(zeros),)
-            ax.legend(leg, loc=1, fontsize=6)
         if type(zeros) is str and type(outliers) is str:
             leg = ('rm: {} values <=0.0, rm: {} outliers (SD={})'.format(zeros, outliers, stdev),)
+        leg = add_legend_text(leg, dec_text)
+        if leg_below is not None:
+            add_legend_below(ax, leg_below, dec_text)
+        elif len(leg) > 0:
             ax.legend(leg, loc=1, fontsize=6)
     except ValueError:
         print("plot can't be generated")
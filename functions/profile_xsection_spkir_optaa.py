@@ -10,7 +10,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 import functions.common as cf
 import functions.plotting as pf
-import functions.group_by_timerange as gt
 
 
 def pf_xs_optaa(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, save_dir_profile, save_dir_xsection,
@@ -86,22 +85,19 @@ def pf_xs_optaa(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 print('removed {} data points using visual inspection of data'.format(
                     len(ndata) - len(z_portal)))
 
-                # create data groups
-                columns = ['tsec', 'dbar', str(sv)]
+                # create depth ranges
                 min_r = int(round(np.nanmin(y_portal) - zcell_size))
                 max_r = int(round(np.nanmax(y_portal) + zcell_size))
                 ranges = list(range(min_r, max_r, zcell_size))
 
-                groups, d_groups = gt.group_by_depth_range(t_portal, y_portal, z_portal, columns, ranges)
-
                 if 'scatter' in sv:
                     n_std = None  # to use percentile
                 else:
                     n_std = n_std
 
                 #  get percentile analysis for printing on the profile plot
-                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_groups(
-                    groups, d_groups, n_std, inpercentile)
+                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_depth_ranges(
+                    t_portal, y_portal, z_portal, ranges, n_std, inpercentile)
 
             """
             Plot all data
@@ -163,11 +159,6 @@ def pf_xs_optaa(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 ylabel = press[0] + " (" + y_units[0] + ")"
                 clabel = 'Time'
 
-                fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None)
-
-                ax.set_title(title, fontsize=9)
-                ax.plot(n_avg, y_avg, '-k')
-                ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
                 leg_text = (
                     'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                     '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
@@ -176,7 +167,12 @@ def pf_xs_optaa(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                     '\n(black) data average in {} dbar segments'.format(zcell_size) +
                     '\n(magenta) {} percentile envelope in {} dbar segments'.format(
                         int(100 - inpercentile * 2), zcell_size),)
-                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None,
+                                           leg_below=leg_text)
+
+                ax.set_title(title, fontsize=9)
+                ax.plot(n_avg, y_avg, '-k')
+                ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
                 fig.tight_layout()
                 pf.save_fig(save_dir_profile, sfile)
 
@@ -187,18 +183,17 @@ def pf_xs_optaa(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 ylabel = press[0] + " (" + y_units[0] + ")"
 
                 # plot non-erroneous data
-                fig, ax, bar = pf.plot_xsection(ds.subsite, t_portal, y_portal, z_portal, clabel, ylabel,
-                                                t_eng=None, m_water_depth=None, inpercentile=None,
-                                                stdev=None)
-
-                ax.set_title(title, fontsize=9)
                 leg_text = (
                     'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                     '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
                     '\nexcluded {} suspect data points when inspected visually'.format(
                         len(ndata) - len(z_portal)),
                 )
-                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                fig, ax, bar = pf.plot_xsection(ds.subsite, t_portal, y_portal, z_portal, clabel, ylabel,
+                                                t_eng=None, m_water_depth=None, inpercentile=None,
+                                                stdev=None, leg_below=leg_text)
+
+                ax.set_title(title, fontsize=9)
                 fig.tight_layout()
                 pf.save_fig(save_dir_xsection, sfile)
 
@@ -266,22 +261,19 @@ def pf_xs_spkir(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 print('removed {} data points using visual inspection of data'.format(
                     len(ndata) - len(z_portal)))
 
-                # create data groups
-                columns = ['tsec', 'dbar', str(sv)]
+                # create depth ranges
                 min_r = int(round(np.nanmin(y_portal) - zcell_size))
                 max_r = int(round(np.nanmax(y_portal) + zcell_size))
                 ranges = list(range(min_r, max_r, zcell_size))
 
-                groups, d_groups = gt.group_by_depth_range(t_portal, y_portal, z_portal, columns, ranges)
-
                 if 'scatter' in sv:
                     n_std = None  # to use percentile
                 else:
                     n_std = n_std
 
                 #  get percentile analysis for printing on the profile plot
-                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_groups(
-                    groups, d_groups, n_std, inpercentile)
+                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_depth_ranges(
+                    t_portal, y_portal, z_portal, ranges, n_std, inpercentile)
 
             """
             Plot all data
@@ -343,11 +335,6 @@ def pf_xs_spkir(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 ylabel = press[0] + " (" + y_units[0] + ")"
                 clabel = 'Time'
 
-                fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None)
-
-                ax.set_title(title, fontsize=9)
-                ax.plot(n_avg, y_avg, '-k')
-                ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
                 leg_text = (
                     'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                     '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
@@ -356,7 +343,12 @@ def pf_xs_spkir(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                     '\n(black) data average in {} dbar segments'.format(zcell_size) +
                     '\n(magenta) {} percentile envelope in {} dbar segments'.format(
                         int(100 - inpercentile * 2), zcell_size),)
-                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None,
+                                           leg_below=leg_text)
+
+                ax.set_title(title, fontsize=9)
+                ax.plot(n_avg, y_avg, '-k')
+                ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
                 fig.tight_layout()
                 pf.save_fig(save_dir_profile, sfile)
 
@@ -367,17 +359,16 @@ def pf_xs_spkir(ds, sv, time1, y1, ds_lat1, ds_lon1, zcell_size, inpercentile, s
                 ylabel = press[0] + " (" + y_units[0] + ")"
 
                 # plot non-erroneous data
-                fig, ax, bar = pf.plot_xsection(ds.subsite, t_portal, y_portal, z_portal, clabel, ylabel,
-                                                t_eng=None, m_water_depth=None, inpercentile=None,
-                                                stdev=None)
-
-                ax.set_title(title, fontsize=9)
                 leg_text = (
                     'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                     '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
                     '\nexcluded {} suspect data points when inspected visually'.format(
                         len(ndata) - len(z_portal)),
                 )
-                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                fig, ax, bar = pf.plot_xsection(ds.subsite, t_portal, y_portal, z_portal, clabel, ylabel,
+                                                t_eng=None, m_water_depth=None, inpercentile=None,
+                                                stdev=None, leg_below=leg_text)
+
+                ax.set_title(title, fontsize=9)
                 fig.tight_layout()
                 pf.save_fig(save_dir_xsection, sfile)
@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+"""
+@brief On-disk cache for text content fetched from remote servers (e.g. THREDDS catalog pages).
+Each url has a small index entry (etag, last-modified, fetch time) that points to a content-addressed object
+(named by the sha1 of the content), so identical pages are only stored once. Entries younger than the ttl are
+returned without touching the network, older entries are revalidated with a conditional request, and in offline
+mode only the cache is used.
+Defaults can be set with the environment variables DATA_REVIEW_CACHE_DIR, DATA_REVIEW_CACHE_TTL (seconds) and
+DATA_REVIEW_OFFLINE (1/true/yes), or with set_cache_options.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import functions.http_client as hc
+
+CACHE_DIR = os.environ.get('DATA_REVIEW_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.data-review-tools', 'cache'))
+TTL = float(os.environ.get('DATA_REVIEW_CACHE_TTL', 86400))
+OFFLINE = os.environ.get('DATA_REVIEW_OFFLINE', '').lower() in ['1', 'true', 'yes']
+
+_memory = dict()  # entries already read during this run, keyed by (namespace, url)
+
+
+def set_cache_options(cache_dir=None, ttl=None, offline=None):
+    """
+    Change the cache settings for the current run
+    :param cache_dir: directory where cache entries are stored
+    :param ttl: number of seconds a cache entry is used before it is revalidated with the server
+    :param offline: if True, never contact the server and only return cached content
+    """
+    global CACHE_DIR, TTL, OFFLINE
+    if cache_dir is not None:
+        CACHE_DIR = cache_dir
+        _memory.clear()
+    if ttl is not None:
+        TTL = float(ttl)
+    if offline is not None:
+        OFFLINE = offline
+
+
+def hash_string(s):
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
+def _write_file(path, content):
+    # write to a temporary file first so an interrupted run never leaves a partial entry behind
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _entry_path(namespace, url):
+    return os.path.join(CACHE_DIR, namespace, '{}.json'.format(hash_string(url)))
+
+
+def _object_path(content_hash):
+    return os.path.join(CACHE_DIR, 'objects', content_hash[0:2], content_hash)
+
+
+def read_entry(namespace, url):
+    """
+    Return the cache entry for a url, or None if the url has not been cached
+    :param namespace: cache sub-directory (e.g. 'catalog')
+    :param url: url of the cached content
+    :return: dictionary containing url, etag, last_modified, fetched (epoch seconds) and content
+    """
+    try:
+        return _memory[(namespace, url)]
+    except KeyError:
+        pass
+
+    try:
+        with open(_entry_path(namespace, url), encoding='utf-8') as f:
+            entry = json.load(f)
+        with open(_object_path(entry['sha1']), encoding='utf-8') as f:
+            entry['content'] = f.read()
+    except (OSError, ValueError, KeyError):
+        return None
+
+    _memory[(namespace, url)] = entry
+    return entry
+
+
+def write_entry(namespace, url, content, etag=None, last_modified=None):
+    content_hash = hash_string(content)
+    obj = _object_path(content_hash)
+    if not os.path.isfile(obj):
+        _write_file(obj, content)
+
+    entry = dict(url=url, etag=etag, last_modified=last_modified, fetched=time.time(), sha1=content_hash)
+    _write_file(_entry_path(namespace, url), json.dumps(entry))
+    entry['content'] = content
+    _memory[(namespace, url)] = entry
+    return entry
+
+
+def is_fresh(entry, ttl=None):
+    if ttl is None:
+        ttl = TTL
+    return (time.time() - entry['fetched']) < ttl
+
+
+def fetch_text(url, namespace='catalog', ttl=None):
+    """
+    Return the text content of a url, using the cache when possible
+    :param url: url to fetch
+    :param namespace: cache sub-directory (e.g. 'catalog')
+    :param ttl: number of seconds a cached copy is used before it is revalidated. Default: TTL
+    """
+    entry = read_entry(namespace, url)
+    if entry is not None and (OFFLINE or is_fresh(entry, ttl)):
+        return entry['content']
+
+    if OFFLINE:
+        raise Exception('Offline mode: no cached copy of {}'.format(url))
+
+    # revalidate the cached copy with a conditional request
+    headers = dict()
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    r = hc.get(url, headers=headers)
+    if r.status_code == 304 and entry is not None:
+        entry = write_entry(namespace, url, entry['content'], entry['etag'], entry['last_modified'])
+    elif r.status_code == 200:
+        entry = write_entry(namespace, url, r.text, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+    elif entry is not None:
+        print('{} returned {} - using cached copy from {}'.format(
+            url, r.status_code, time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(entry['fetched']))))
+    else:
+        return r.text
+
+    return entry['content']
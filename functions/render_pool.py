@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+"""
+@brief Pool of worker processes that render and save figures.
+A figure is submitted as a render function (a module-level function that draws the figure with pyplot), its
+arguments, and the file it's saved to. Workers use the Agg backend and save the PNGs concurrently. Large arrays are
+copied once into shared memory with share(), so each figure only sends a small handle to the worker instead of the
+data. Without multiprocessing.shared_memory (Python < 3.8) share() returns the array itself, which is then sent
+(pickled) with the arguments of each figure. With n_workers=1 (the default) figures are rendered in the calling
+process as soon as they are submitted, exactly like the plotting scripts did before.
+"""
+
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib.pyplot as plt
+import functions.plotting as pf
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+
+class SharedArray(object):
+    # description of an array in shared memory, sent to the workers instead of the data
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _init_worker():
+    plt.switch_backend('Agg')
+
+
+def _attach(a, blocks):
+    if not isinstance(a, SharedArray):
+        return a
+    shm = shared_memory.SharedMemory(name=a.name)
+    blocks.append(shm)
+    arr = np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)
+    arr.flags.writeable = False
+    return arr
+
+
+def _render(render, save_dir, file_name, res, args, kwargs):
+    blocks = []
+    args = [_attach(a, blocks) for a in args]
+    kwargs = {k: _attach(v, blocks) for k, v in kwargs.items()}
+    try:
+        if render(*args, **kwargs) is not False:
+            pf.save_fig(save_dir, file_name, res)
+    finally:
+        plt.close('all')
+        del args, kwargs
+        for shm in blocks:
+            try:
+                shm.close()
+            except BufferError:  # the array is still referenced, the block is closed when it's garbage collected
+                pass
+
+
+class RenderPool(object):
+    """
+    Usage:
+        pool = RenderPool(n_workers=4)
+        t = pool.share(time_array)
+        pool.submit(render_function, save_dir, file_name, t, y, title=title)
+        pool.release(t)  # no more figures will be submitted with t
+        pool.close()  # wait for all figures to be saved
+    """
+    def __init__(self, n_workers=1, res=150):
+        """
+        :param n_workers: number of worker processes. Figures are rendered in the calling process if n_workers <= 1
+        :param res: resolution of the saved figures (DPI)
+        """
+        self.res = res
+        self._executor = None
+        self._futures = []
+        self._blocks = dict()
+        self._refs = dict()
+        self._lock = threading.Lock()
+        if n_workers > 1:
+            # fork (where available) so the workers start without re-importing the plotting modules
+            ctx = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+            self._executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, initializer=_init_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def share(self, array):
+        """
+        Copy an array into shared memory, to be passed to any number of figures
+        :return: SharedArray handle (the array itself when rendering in the calling process, when shared memory isn't
+        available, or if the array can't be shared, e.g. an array of objects)
+        """
+        if self._executor is None or shared_memory is None:
+            return array
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject or array.nbytes == 0:
+            return array
+
+        shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        with self._lock:
+            self._blocks[shm.name] = shm
+            self._refs[shm.name] = 1  # released by release()
+        return SharedArray(shm.name, array.shape, array.dtype.str)
+
+    def release(self, *handles):
+        # the caller won't submit more figures with these arrays: their shared memory is freed once the figures that
+        # use them are saved
+        for h in handles:
+            if isinstance(h, SharedArray):
+                self._decref(h.name)
+
+    def _decref(self, name):
+        with self._lock:
+            self._refs[name] -= 1
+            if self._refs[name] > 0:
+                return
+            del self._refs[name]
+            shm = self._blocks.pop(name)
+        shm.close()
+        shm.unlink()
+
+    def submit(self, render, save_dir, file_name, *args, **kwargs):
+        """
+        Render a figure and save it to save_dir/file_name
+        :param render: module-level function that draws the figure with pyplot (it must be importable by the
+        workers). The figure that is current when it returns is saved, unless it returns False
+        :param args: arguments of render. Handles from share() are replaced by (read-only) arrays in the workers
+        :param kwargs: keyword arguments of render
+        """
+        if self._executor is None:
+            _render(render, save_dir, file_name, self.res, args, kwargs)
+            return
+
+        names = [a.name for a in list(args) + list(kwargs.values()) if isinstance(a, SharedArray)]
+        with self._lock:
+            for n in names:
+                self._refs[n] += 1
+        future = self._executor.submit(_render, render, save_dir, file_name, self.res, args, kwargs)
+        future.add_done_callback(lambda f: [self._decref(n) for n in names])
+        self._futures.append((file_name, future))
+
+    def wait(self):
+        # wait for the figures that were submitted. A figure that fails is reported and doesn't stop the others
+        futures, self._futures = self._futures, []
+        for file_name, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print('Unable to render {}: {}'.format(file_name, e))
+
+    def close(self):
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for name in list(self._blocks):
+            shm = self._blocks.pop(name)
+            shm.close()
+            shm.unlink()
+        self._refs.clear()
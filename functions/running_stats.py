@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+"""
+@brief Statistics that are calculated chunk by chunk.
+RunningStats keeps the count, NaN count, mean, sum of squared differences from the mean (Welford/Chan), minimum
+and maximum of the data it has been given. Chunks can be added one at a time and accumulators for different files
+or deployments can be merged, so a long record never has to be in memory at once.
+clipped_statistics uses two passes over the data to reject outliers (see functions.common.variable_statistics).
+"""
+
+import numpy as np
+
+CHUNK_SIZE = 1000000  # number of values processed at a time when an array is split into chunks
+
+
+class RunningStats(object):
+    def __init__(self):
+        self.n = 0  # number of values that are not NaN
+        self.n_nan = 0
+        self.mean = np.nan
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, chunk):
+        """
+        Add a chunk of data
+        :param chunk: array (or anything that can be converted to an array) of any shape
+        """
+        chunk = np.asarray(chunk, dtype='float64').ravel()
+        isnan = np.isnan(chunk)
+        n_nan = int(np.sum(isnan))
+        if n_nan > 0:
+            chunk = chunk[~isnan]
+            self.n_nan += n_nan
+        if len(chunk) == 0:
+            return self
+
+        other = RunningStats()
+        other.n = len(chunk)
+        other.mean = np.mean(chunk)
+        other.m2 = np.sum((chunk - other.mean) ** 2)
+        other.min = np.min(chunk)
+        other.max = np.max(chunk)
+        return self._combine(other)
+
+    def merge(self, other):
+        # add the statistics of another accumulator (e.g. from another file or deployment)
+        self.n_nan += other.n_nan
+        if other.n > 0:
+            self._combine(other)
+        return self
+
+    def _combine(self, other):
+        if self.n == 0:
+            self.n, self.mean, self.m2, self.min, self.max = other.n, other.mean, other.m2, other.min, other.max
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.n / n
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        # population standard deviation (same as np.nanstd)
+        if self.n == 0:
+            return np.nan
+        return np.sqrt(self.m2 / self.n)
+
+
+def iter_chunks(data, chunk_size=None):
+    # split an array into chunks along the first dimension
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def clipped_statistics(chunks, stdev):
+    """
+    Calculate statistics after rejecting extreme values (outside of +/- 1e7) and outliers beyond stdev standard
+    deviations of the mean. The first pass calculates the mean and standard deviation of the data without extreme
+    values, the second pass calculates the statistics of the data that are left.
+    :param chunks: function that returns an iterator over the chunks of data (it's called once for each pass), or
+    a list of arrays
+    :param stdev: number of standard deviations from the mean
+    :return: number of values rejected, RunningStats of the data that are left
+    """
+    if not callable(chunks):
+        chunk_list = chunks
+        chunks = lambda: iter(chunk_list)
+
+    first = RunningStats()
+    n_extreme = 0
+    for c in chunks():
+        c = np.asarray(c, dtype='float64').ravel()
+        ind = (c > -1e7) & (c < 1e7)  # NaNs are rejected here too
+        n_extreme += int(len(c) - np.sum(ind))
+        first.update(c[ind])
+
+    final = RunningStats()
+    n_outliers = 0
+    sd = first.std
+    for c in chunks():
+        c = np.asarray(c, dtype='float64').ravel()
+        c = c[(c > -1e7) & (c < 1e7)]
+        if sd > 0.0:
+            ind = np.abs(c - first.mean) < stdev * sd
+            n_outliers += int(len(c) - np.sum(ind))
+            c = c[ind]
+        final.update(c)
+
+    return n_extreme + n_outliers, final
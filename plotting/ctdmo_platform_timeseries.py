@@ -16,7 +16,6 @@ Example file 'ctdmo_data_request_summary.csv')
 
 import os
 import pandas as pd
-import xarray as xr
 import numpy as np
 import matplotlib.pyplot as plt
 from collections import OrderedDict
@@ -110,7 +109,7 @@ def main(sDir, f):
             for ds in datasets:
                 dms = deploy_method_stream(ds)
                 if dms == dd:
-                    f = xr.open_dataset(ds)
+                    f = cf.open_nc_dataset(ds)
                     f = f.swap_dims({'obs': 'time'})
                     refdes = '-'.join((f.subsite, f.node, f.sensor))
                     yD = f[v].values
@@ -10,6 +10,7 @@ f: file containing THREDDs urls with .nc files to analyze. The column containing
 start_time: optional start time to limit plotting time range
 end_time: optional end time to limit plotting time range
 preferred_only: if set to 'yes', only plots the preferred data for a deployment. Options are 'yes' or 'no'
+n_workers: number of processes that render and save figures (plot_profile_xsection)
 """
 
 import pandas as pd
@@ -40,12 +41,13 @@ inpercentile = 2.5
 
 zcell_size = 10  # depth cell size for data grouping
 deployment_num = None  # None or 3
+n_workers = 1
 
 ff = pd.read_csv(f)
 url_list = ff['outputUrl'].tolist()
 url_list = [u for u in url_list if u not in 'no_output_url']
 
 scripts.map_gliders.main(url_list, sDir, 'glider_track', start_time, end_time, deployment_num, bathy_files)
-scripts.plot_profile_xsection.main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n_std, inpercentile, zcell_size, zdbar)
+scripts.plot_profile_xsection.main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n_std, inpercentile, zcell_size, zdbar, n_workers)
 #scripts.plot_profile_xsection_rm_suspect_data.main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, zdbar, n_std, inpercentile, zcell_size)
 #data_review.scripts.mobile_data_range.main(url_list, sDir, mDir, zcell_size, zdbar, start_time, end_time)
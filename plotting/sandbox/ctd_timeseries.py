@@ -9,7 +9,6 @@ deployment, and delivery method. These plots omit data outside of 5 standard dev
 
 import os
 import pandas as pd
-import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import functions.common as cf
@@ -29,7 +28,7 @@ def main(sDir, f):
 
         colors = cm.jet(np.linspace(0, 1, len(sci_vars)))
 
-        with xr.open_dataset(d, mask_and_scale=False) as ds:
+        with cf.open_nc_dataset(d, mask_and_scale=False) as ds:
             ds = ds.swap_dims({'obs': 'time'})
             t = ds['time'].data
             t0 = pd.to_datetime(t.min()).strftime('%Y-%m-%dT%H:%M:%S')
@@ -10,7 +10,6 @@ outside of global ranges. Each plot contains data from one deployment and one sc
 
 import os
 import pandas as pd
-import xarray as xr
 import numpy as np
 import datetime as dt
 import itertools
@@ -124,7 +123,7 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
         for fd in fdatasets_sel:
             part_d = fd.split('/')[-1]
             print('\n{}'.format(part_d))
-            ds = xr.open_dataset(fd, mask_and_scale=False)
+            ds = cf.open_nc_dataset(fd, mask_and_scale=False)
             ds = ds.swap_dims({'obs': 'time'})
 
             fname, subsite, refdes, method, stream, deployment = cf.nc_attributes(fd)
@@ -139,7 +138,7 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                     # filter out collocated datasets
                     eng_dataset = [j for j in eng_datasets if (eng in j.split('/')[-1] and deployment in j.split('/')[-1])]
                     if len(eng_dataset) > 0:
-                        ds_eng = xr.open_dataset(eng_dataset[0], mask_and_scale=False)
+                        ds_eng = cf.open_nc_dataset(eng_dataset[0], mask_and_scale=False)
                         t_eng = ds_eng['time'].values
                         m_water_depth = ds_eng['m_water_depth'].values
 
@@ -316,11 +315,6 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                             ylabel = press[0] + " (" + y_units[0] + ")"
                             clabel = 'Time'
 
-                            fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None)
-
-                            ax.set_title(title, fontsize=9)
-                            ax.plot(n_med, y_plt,  '.k')
-                            ax.fill_betweenx(y_plt, n0_std, n1_std, color='m', alpha=0.2)
                             leg_text = (
                                 'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                                 '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
@@ -330,7 +324,12 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                     [surface_params[2], depth_params[2]], depth_params[0]) +
                                 '\n(magenta) upper and lower {} percentile envelope in {} dbar segments'.format(
                                     [surface_params[3], depth_params[3]], [surface_params[2], depth_params[2]]),)
-                            ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                            fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None,
+                                                       leg_below=leg_text)
+
+                            ax.set_title(title, fontsize=9)
+                            ax.plot(n_med, y_plt,  '.k')
+                            ax.fill_betweenx(y_plt, n0_std, n1_std, color='m', alpha=0.2)
                             fig.tight_layout()
                             pf.save_fig(save_dir_profile, sfile)
 
@@ -341,17 +340,17 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                             ylabel = press[0] + " (" + y_units[0] + ")"
 
                             # plot non-erroneous data
-                            fig, ax, bar = pf.plot_xsection(subsite, t_portal, y_portal, z_portal, clabel, ylabel, t_eng,
-                                                            m_water_depth, inpercentile=None, stdev=None)
-
-                            ax.set_title(title, fontsize=9)
                             leg_text = (
                                 'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                                 '{} zeros'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
                                 '\nexcluded {} suspect data points when inspected visually'.format(
                                     len(ndata) - len(z_portal)),
                             )
-                            ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
+                            fig, ax, bar = pf.plot_xsection(subsite, t_portal, y_portal, z_portal, clabel, ylabel, t_eng,
+                                                            m_water_depth, inpercentile=None, stdev=None,
+                                                            leg_below=leg_text)
+
+                            ax.set_title(title, fontsize=9)
                             fig.tight_layout()
                             pf.save_fig(save_dir_xsection, sfile)
 
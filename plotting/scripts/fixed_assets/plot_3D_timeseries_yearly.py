@@ -16,7 +16,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import datetime
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
@@ -147,7 +146,7 @@ def main(sDir, url_list, preferred_only):
             print('\nAppending data from files: {}'.format(ms))
             fcount = 0
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
                     if ds[var].units == sh['db_units']:
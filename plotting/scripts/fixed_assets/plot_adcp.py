@@ -11,7 +11,6 @@ method/stream.
 
 import os
 import pandas as pd
-import xarray as xr
 import datetime as dt
 import numpy as np
 import itertools
@@ -135,7 +134,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
 
         fdatasets = np.unique(fdatasets).tolist()
         for fd in fdatasets:
-            ds = xr.open_dataset(fd, mask_and_scale=False)
+            ds = cf.open_nc_dataset(fd, mask_and_scale=False)
             ds = ds.swap_dims({'obs': 'time'})
             #ds_vars = list(ds.data_vars.keys()) + [x for x in ds.coords.keys() if 'pressure' in x]  # get pressure variable from coordinates
 
@@ -9,7 +9,6 @@ beyond 5 standard deviations. The user has the option of selecting a specific ti
 """
 
 import os
-import xarray as xr
 import pandas as pd
 import numpy as np
 import datetime as dt
@@ -37,10 +36,10 @@ def compare_plot_datasets(df, r, start_time, end_time, sDir, strm=None):
                             compare = '{} {}'.format(names[x], n)
 
                             if len(f0) == 1:
-                                ds0 = xr.open_dataset(f0[0])
+                                ds0 = cf.open_nc_dataset(f0[0])
                                 ds0 = ds0.swap_dims({'obs': 'time'})
                             else:
-                                ds0 = xr.open_mfdataset(f0)
+                                ds0 = cf.open_nc_mfdataset(f0)
                                 ds0 = ds0.swap_dims({'obs': 'time'})
                                 ds0 = ds0.chunk({'time': 100})
                             splt0 = compare.split(' ')[0].split('-')
@@ -56,10 +55,10 @@ def compare_plot_datasets(df, r, start_time, end_time, sDir, strm=None):
                                     continue
 
                             if len(f1) == 1:
-                                ds1 = xr.open_dataset(f1[0])
+                                ds1 = cf.open_nc_dataset(f1[0])
                                 ds1 = ds1.swap_dims({'obs': 'time'})
                             else:
-                                ds1 = xr.open_mfdataset(f1)
+                                ds1 = cf.open_nc_mfdataset(f1)
                                 ds1 = ds1.swap_dims({'obs': 'time'})
                                 ds1 = ds1.chunk({'time': 100})
                             splt1 = compare.split(' ')[1].split('-')
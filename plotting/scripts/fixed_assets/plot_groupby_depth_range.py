@@ -15,7 +15,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import datetime
 import matplotlib.cm as cm
 from matplotlib import pyplot
@@ -110,7 +109,7 @@ def main(url_list, sDir, plot_type, deployment_num, start_time, end_time):
             y_unit = []
             y_name = []
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 print(fd)
 
                 if start_time is not None and end_time is not None:
@@ -246,59 +245,55 @@ def main(url_list, sDir, plot_type, deployment_num, start_time, end_time):
                                       'used bin = 2 dbar to calculate an average profile (black line) and 3-STD envelope (shaded area)'), fontsize=9)
 
                         # group by depth range
-                        columns = ['time', 'pressure', str(sv)]
                         # ranges = [0, 50, 100, 200, 400, 600]
                         ranges = list(range(int(round(min(y_nofv_nonan_noev))), int(round(max(y_nofv_nonan_noev))), 1))
-                        groups, d_groups = gt.group_by_depth_range(t_nofv_nonan_noev, y_nofv_nonan_noev, z_nofv_nonan_noev, columns, ranges)
+                        groups = gt.depth_groups(y_nofv_nonan_noev, ranges)
 
                         # describe_file = '_'.join((sname, 'statistics.csv'))
                         # # groups.describe().to_csv(save_dir + '/' + describe_file)
-                        ind = groups.describe()[sv]['mean'].notnull()
-                        groups.describe()[sv][ind].to_csv('{}/{}_statistics.csv'.format(save_dir, sname), index=True)
+                        stats = groups.describe(z_nofv_nonan_noev)
+                        stats.index.name = 'pressure'
+                        ind = stats['mean'].notnull()
+                        stats[ind].to_csv('{}/{}_statistics.csv'.format(save_dir, sname), index=True)
 
-                        tm = 1
                         fig, ax = pyplot.subplots(nrows=2, ncols=1)
                         pyplot.margins(y=.08, x=.02)
                         pyplot.grid()
-                        y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr = [], [], [], [], [], [], []
-
-                        for ii in range(len(groups)):
-
-                            nan_ind = d_groups[ii+tm].notnull()
-                            xtime = d_groups[ii+tm][nan_ind]
-                            colors = cm.rainbow(np.linspace(0, 1, len(xtime)))
-                            ypres = d_groups[ii+tm+1][nan_ind]
-                            nval = d_groups[ii+tm+2][nan_ind]
-                            tm += 2
-
-                            # fig, ax = pf.plot_xsection(subsite, xtime, ypres, nval, clabel, ylabel, stdev=None)
-                            # ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
-
-                            # pf.plot_profiles(nval, ypres, colors, ylabel, clabel, stdev=None)
-                            # ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
-
-                            ind2 = cf.reject_outliers(nval, 5)
-                            xD = nval[ind2]
-                            yD = ypres[ind2]
-                            nZ = colors[ind2]
-                            outliers = str(len(nval) - len(xD))
-                            leg_text = ('removed {} outliers (SD={})'.format(outliers, stdev),)
-
-                            ax.scatter(xD, yD, c=nZ, s=2, edgecolor='None')
-                            ax.invert_yaxis()
-                            ax.set_xlabel(clabel, fontsize=9)
-                            ax.set_ylabel(ylabel, fontsize=9)
-                            ax.legend(leg_text, loc='best', fontsize=6)
-                            ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
-
-                            l_arr.append(len(nval)) #  count of data to filter out small groups
-                            y_avg.append(ypres.mean())
-                            n_avg.append(nval.mean())
-                            n_min.append(nval.min())
-                            n_max.append(nval.max())
-                            n0_std.append(nval.mean() + 3 * nval.std())
-                            n1_std.append(nval.mean() - 3 * nval.std())
 
+                        # reject outliers (5 SD) in each depth range, for all depth ranges at once
+                        outliers, _, _ = groups.outlier_mask(z_nofv_nonan_noev, n_std=5, ddof=0)
+                        keep = (groups.codes >= 0) & ~outliers
+
+                        # color the data in each depth range by their order in time
+                        counts = groups.counts
+                        position = np.zeros(len(keep))
+                        position[groups.order] = (np.arange(len(groups.order)) - np.repeat(groups.starts, counts)) / \
+                            np.repeat(np.maximum(counts - 1, 1), counts)
+                        colors = cm.rainbow(position)
+
+                        # fig, ax = pf.plot_xsection(subsite, xtime, ypres, nval, clabel, ylabel, stdev=None)
+                        # ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
+
+                        # pf.plot_profiles(nval, ypres, colors, ylabel, clabel, stdev=None)
+                        # ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
+
+                        leg_text = ('removed {} outliers (SD={})'.format(int(np.sum(outliers)), stdev),)
+
+                        ax.scatter(z_nofv_nonan_noev[keep], y_nofv_nonan_noev[keep], c=colors[keep], s=2,
+                                   edgecolor='None')
+                        ax.invert_yaxis()
+                        ax.set_xlabel(clabel, fontsize=9)
+                        ax.set_ylabel(ylabel, fontsize=9)
+                        ax.legend(leg_text, loc='best', fontsize=6)
+                        ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
+
+                        # average profile and 3 SD envelope of the depth ranges that contain data
+                        ind = counts > 0
+                        y_avg = list(groups.mean(y_nofv_nonan_noev)[ind])
+                        n_avg = list(groups.mean(z_nofv_nonan_noev)[ind])
+                        n_sd = groups.std(z_nofv_nonan_noev)[ind]
+                        n0_std = list(np.array(n_avg) + 3 * n_sd)
+                        n1_std = list(np.array(n_avg) - 3 * n_sd)
 
                         ax.plot(n_avg, y_avg, '-k')
                         # ax.plot(n_min, y_avg, '-b')
@@ -12,7 +12,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import functions.common as cf
 import functions.plotting as pf
 import functions.combine_datasets as cd
@@ -99,7 +98,7 @@ def main(sDir, url_list):
             sci_vars_dict = cd.initialize_empty_arrays(stream_sci_vars_dict, ms)
             print('\nAppending data from files: {}'.format(ms))
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
                     if ds[var].units == sh['db_units']:
@@ -159,13 +158,16 @@ def main(sDir, url_list):
                                 sname = '-'.join((r, m, sv))
 
                             # group data by year
-                            groups, g_data = gt.group_by_timerange(x, y, 'A')
+                            x_sorted, y_sorted = gt.sort_by_time(x, y)
+                            cal = gt.CalendarPartitioner(x_sorted)
+                            groups = cal.group_index('Y')
+                            groups_stats = groups.describe(y_sorted)
 
                             # plotting
 
                             # create bins for histogram
-                            groups_min = min(groups.describe()['DO']['min'])
-                            groups_max = max(groups.describe()['DO']['max'])
+                            groups_min = np.nanmin(groups_stats['min'])
+                            groups_max = np.nanmax(groups_stats['max'])
                             lower_bound = int(round(groups_min))
                             upper_bound = int(round(groups_max + (groups_max / 50)))
                             step_bound = int(round((groups_max - groups_min) / 10))
@@ -193,30 +195,28 @@ def main(sDir, url_list):
                             # subplot for  histogram and basic statistics table
                             ax0[1].axis('off')
                             ax0[1].axis('tight')
-                            the_table = ax0[1].table(cellText=groups.describe().round(2).values,
-                                                     rowLabels=groups.describe().index.year,
+                            the_table = ax0[1].table(cellText=groups_stats.round(2).values,
+                                                     rowLabels=groups_stats.index.year,
                                                      rowColours=colors,
-                                                     colLabels=groups.describe().columns.levels[1],
+                                                     colLabels=groups_stats.columns,
                                                      loc='center')
                             the_table.set_fontsize(5)
 
                             # subplot for data
                             fig, ax = pyplot.subplots(nrows=len(groups), ncols=1, sharey=True)
 
-                            t = 1
-                            for ny in range(len(groups)):
+                            for ny, year, ys in cal.periods('Y'):
 
                                 # prepare data for plotting
-                                y_data = g_data[ny + (t + 1)].dropna(axis=0)
-                                x_time = g_data[ny + t][y_data.index]   #g_data[ny + t].dropna(axis=0)
-                                t += 1
+                                ind = ~np.isnan(y_sorted[ys])
+                                y_data = y_sorted[ys][ind]
+                                x_time = pd.DatetimeIndex(x_sorted[ys][ind])
                                 print(len(x_time), len(y_data))
-                                n_year = x_time[x_time.index.values[0]].year
+                                n_year = year.year
 
                                 col_name = str(n_year)
 
-                                serie_n = pd.DataFrame(columns=[col_name], index=x_time)
-                                serie_n[col_name] = list(y_data[:])
+                                serie_n = pd.DataFrame({col_name: y_data}, index=x_time)
 
                                 # plot histogram
                                 # serie_n.plot.hist(ax=ax0[0], bins=bin_range,
@@ -9,7 +9,6 @@ of selecting a specific time range to plot and only plotting data from the prefe
 
 import os
 import pandas as pd
-import xarray as xr
 import datetime as dt
 import numpy as np
 import itertools
@@ -56,7 +55,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
 
         fdatasets = np.unique(fdatasets).tolist()
         for fd in fdatasets:
-            ds = xr.open_dataset(fd, mask_and_scale=False)
+            ds = cf.open_nc_dataset(fd, mask_and_scale=False)
             ds = ds.swap_dims({'obs': 'time'})
 
             if start_time is not None and end_time is not None:
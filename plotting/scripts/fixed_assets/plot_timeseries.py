@@ -17,9 +17,20 @@ import numpy as np
 import itertools
 import functions.common as cf
 import functions.plotting as pf
+import functions.render_pool as rp
 
 
-def main(sDir, url_list, start_time, end_time, preferred_only):
+def render_timeseries(tm, values, fv, y_name, y_units, title, stdev=None):
+    # timeseries plot of one variable, without fill values (rendered by functions.render_pool)
+    ind = values != fv
+    y = xr.DataArray(values[ind], name=y_name, attrs=dict(units=y_units))
+    fig, ax = pf.plot_timeseries(tm[ind], y, y_name, stdev=stdev)
+    ax.set_title(title, fontsize=9)
+
+
+def main(sDir, url_list, start_time, end_time, preferred_only, n_workers=1):
+    # figures are rendered and saved by n_workers processes
+    pool = rp.RenderPool(n_workers)
     rd_list = []
     for uu in url_list:
         elements = uu.split('/')[-2].split('-')
@@ -62,7 +73,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
 
         for fd in fdatasets:
             if '_blank' not in fd:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 ds = ds.swap_dims({'obs': 'time'})
                 ds_vars = list(ds.data_vars.keys()) + [x for x in ds.coords.keys() if 'pressure' in x]  # get pressure variable from coordinates
                 #raw_vars = cf.return_raw_vars(ds_vars)
@@ -85,6 +96,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
                 cf.create_dir(save_dir)
 
                 tm = ds['time'].values
+                tm_shared = pool.share(tm)
                 t0 = pd.to_datetime(tm.min()).strftime('%Y-%m-%dT%H:%M:%S')
                 t1 = pd.to_datetime(tm.max()).strftime('%Y-%m-%dT%H:%M:%S')
                 title = ' '.join((deployment, refdes, method))
@@ -107,22 +119,23 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
                                 print('Array of all fill values - skipping plot.')
 
                             else:
-                                # reject fill values
-                                ind = y.values != fv
-                                t = tm[ind]
-                                y = y[ind]
+                                # fill values are rejected when the figures are rendered
+                                y_shared = pool.share(y.values)
+                                y_units = pf.get_units(y)
 
                                 # Plot all data
-                                fig, ax = pf.plot_timeseries(t, y, y.name, stdev=None)
-                                ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
                                 sfile = '-'.join((filename, y.name, t0[:10]))
-                                pf.save_fig(save_dir, sfile)
+                                pool.submit(render_timeseries, save_dir, sfile, tm_shared, y_shared, fv, y.name,
+                                            y_units, (title + '\n' + t0 + ' - ' + t1), stdev=None)
 
                                 # Plot data with outliers removed
-                                fig, ax = pf.plot_timeseries(t, y, y.name, stdev=5)
-                                ax.set_title((title + '\n' + t0 + ' - ' + t1), fontsize=9)
                                 sfile = '-'.join((filename, y.name, t0[:10])) + '_rmoutliers'
-                                pf.save_fig(save_dir, sfile)
+                                pool.submit(render_timeseries, save_dir, sfile, tm_shared, y_shared, fv, y.name,
+                                            y_units, (title + '\n' + t0 + ' - ' + t1), stdev=5)
+                                pool.release(y_shared)
+                pool.release(tm_shared)
+
+    pool.close()
 
 
 if __name__ == '__main__':
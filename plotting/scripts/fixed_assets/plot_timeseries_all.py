@@ -11,7 +11,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import functions.common as cf
 import functions.plotting as pf
 import functions.combine_datasets as cd
@@ -85,7 +84,7 @@ def main(sDir, url_list):
             sci_vars_dict = cd.initialize_empty_arrays(stream_sci_vars_dict, ms)
             print('\nAppending data from files: {}'.format(ms))
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
                     if ds[var].units == sh['db_units']:
@@ -11,7 +11,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import functions.common as cf
 import functions.plotting as pf
 import functions.combine_datasets as cd
@@ -94,7 +93,7 @@ def main(sDir, url_list):
             sci_vars_dict = cd.initialize_empty_arrays(stream_sci_vars_dict, ms)
             print('\nAppending data from files: {}'.format(ms))
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
                     if ds[var].units == sh['db_units']:
@@ -148,33 +147,17 @@ def main(sDir, url_list):
                             else:
                                 sname = '-'.join((r, m, sv))
 
-                            # 1st group by year
-                            ygroups, gy_data = gt.group_by_timerange(x_nonan_nofv_nE_nogr, y_nonan_nofv_nE_nogr, 'A')
+                            # sort the data once and find the year/month/day boundaries
+                            x_sorted, y_sorted = gt.sort_by_time(x_nonan_nofv_nE_nogr, y_nonan_nofv_nE_nogr)
+                            cal = gt.CalendarPartitioner(x_sorted)
 
-                            tn = 1
-                            for n in range(len(ygroups)):
-                                x_time = gy_data[n + tn].dropna(axis=0)
-                                y_data = gy_data[n + (tn + 1)].dropna(axis=0)
+                            # 1st group by year
+                            for n, year, ys in cal.periods('Y'):
 
                                 # 2nd group by month
-                                mgroups, gm_data = gt.group_by_timerange(x_time.values, y_data.values, 'M')
-
-                                if len(x_time) == 0:
-                                    continue
-
-                                td = 1
-                                for jj in range(len(mgroups)):
-                                    x_time = gm_data[jj + td].dropna(axis=0)
-                                    y_data = gm_data[jj + (td + 1)].dropna(axis=0)
-
-                                    if len(x_time) == 0:
-                                        continue
-
-                                    # 3rd group by day
-                                    dgroups, gd_data = gt.group_by_timerange(x_time.values, y_data.values, 'D')
-
-                                    x_year = x_time[0].year
-                                    x_month = x_time[0].month
+                                for jj, month, mslice in cal.periods('M', ys):
+                                    x_year = month.year
+                                    x_month = month.month
                                     month_name = calendar.month_abbr[x_month]
                                     print(x_year, x_month)
 
@@ -221,18 +204,12 @@ def main(sDir, url_list):
                                                 fig.delaxes(ax[kk][ff])
 
 
-                                    tm = 1
-                                    for mt in range(len(dgroups)):
-                                        x_time = gd_data[mt + tm].dropna(axis=0)
-                                        y_DO = gd_data[mt + (tm + 1)].dropna(axis=0)
-
-                                        series_m = pd.DataFrame(columns=['DO_n'], index=x_time)
-                                        series_m['DO_n'] = list(y_DO[:])
-
-                                        if len(x_time) == 0:
-                                            continue
+                                    # 3rd group by day
+                                    for mt, day, dslice in cal.periods('D', mslice):
+                                        x_time = pd.DatetimeIndex(x_sorted[dslice])
+                                        series_m = pd.DataFrame({'DO_n': y_sorted[dslice]}, index=x_time)
 
-                                        x_day = x_time[0].day
+                                        x_day = day.day
 
                                         print(x_time[0].year, x_time[0].month, x_day)
 
@@ -286,10 +263,7 @@ def main(sDir, url_list):
                                                                       ))
 
                                             dep += 1
-                                        tm += 1
-                                    td += 1
                                     pf.save_fig(save_dir, sfile)
-                                tn += 1
 
 
 if __name__ == '__main__':
@@ -13,7 +13,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import functions.common as cf
 import functions.plotting as pf
 import functions.combine_datasets as cd
@@ -110,7 +109,7 @@ def main(sDir, url_list):
             sci_vars_dict = cd.initialize_empty_arrays(stream_sci_vars_dict, ms)
             print('\nAppending data from files: {}'.format(ms))
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
                     if ds[var].units == sh['db_units']:
@@ -165,23 +164,23 @@ def main(sDir, url_list):
                             else:
                                 sname = '-'.join((r, m, sv))
 
-                            # 1st group by year
-                            ygroups, gy_data = gt.group_by_timerange(x_nonan_nofv_nE_nogr, y_nonan_nofv_nE_nogr, 'A')
+                            # sort the data once and find the year/month boundaries
+                            x_sorted, y_sorted = gt.sort_by_time(x_nonan_nofv_nE_nogr,
+                                                                 y_nonan_nofv_nE_nogr.astype(float))
+                            cal = gt.CalendarPartitioner(x_sorted)
 
-                            tn = 1
-                            for n in range(len(ygroups)):
-                                x_time = gy_data[n+tn].dropna(axis=0)
-                                y_data = gy_data[n+(tn+1)].dropna(axis=0)
-                                y_data = y_data.astype(float)
+                            # 1st group by year
+                            for n, year, ys in cal.periods('Y'):
                                 # 2nd group by month
-                                mgroups, gm_data = gt.group_by_timerange(x_time.values, y_data.values, 'M')
+                                mgroups = cal.group_index('M', ys)
+                                mgroups_stats = mgroups.describe(y_sorted[ys])
 
-                                x_year = x_time[0].year
+                                x_year = year.year
                                 print(x_year)
                                 #
                                 # create bins for histogram
-                                mgroups_min = min(mgroups.describe()['DO']['min'])
-                                mgroups_max = max(mgroups.describe()['DO']['max'])
+                                mgroups_min = np.nanmin(mgroups_stats['min'])
+                                mgroups_max = np.nanmax(mgroups_stats['max'])
                                 lower_bound = int(round(mgroups_min))
                                 upper_bound = int(round(mgroups_max + (mgroups_max / 50)))
                                 step_bound = int(round((mgroups_max - mgroups_min) / 10))
@@ -215,10 +214,10 @@ def main(sDir, url_list):
                                 ax0[0].axis('off')
                                 ax0[0].axis('tight')
 
-                                the_table = ax0[0].table(cellText=mgroups.describe().round(2).values,
-                                                         rowLabels=mgroups.describe().index.month,
+                                the_table = ax0[0].table(cellText=mgroups_stats.round(2).values,
+                                                         rowLabels=mgroups_stats.index.month,
                                                          rowColours=colors,
-                                                         colLabels=mgroups.describe().columns.levels[1], loc='center')
+                                                         colLabels=mgroups_stats.columns, loc='center')
                                 the_table.set_fontsize(5)
 
                                 fig, ax = pyplot.subplots(nrows=12, ncols=1, sharey=True)
@@ -241,21 +240,12 @@ def main(sDir, url_list):
                                     if kk == 11:
                                         ax[kk].set_xlabel('Days', rotation=0, fontsize=8, color='b')
 
-                                tm = 1
-                                for mt in range(len(mgroups)):
-                                    x_time = gm_data[mt+tm].dropna(axis=0)
-                                    y_data = gm_data[mt+(tm+1)].dropna(axis=0)
-
-                                    if len(x_time) == 0:
-                                        # ax[plt_index].tick_params(which='both', labelbottom=False, labelleft=False,
-                                        #                    pad=0.1, length=1)
-                                        continue
-
-                                    x_month = x_time[0].month
+                                for mt, month, mslice in cal.periods('M', ys):
+                                    x_month = month.month
                                     col_name = str(x_month)
 
-                                    series_m = pd.DataFrame(columns=[col_name], index=x_time)
-                                    series_m[col_name] = list(y_data[:])
+                                    series_m = pd.DataFrame({col_name: y_sorted[mslice]},
+                                                            index=pd.DatetimeIndex(x_sorted[mslice]))
 
 
                                     # serie_n.plot.hist(ax=ax0[0], bins=bin_range,
@@ -330,8 +320,6 @@ def main(sDir, url_list):
                                                                   fc=(1., 1., 1.),
                                                                   ))
                                         dep += 1
-                                    tm += 1
-                                tn += 1
 
 
                                 # pyplot.show()
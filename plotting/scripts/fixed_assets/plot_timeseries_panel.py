@@ -10,7 +10,6 @@ selecting a specific time range to plot and only plotting data from the preferre
 
 import os
 import pandas as pd
-import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import numpy as np
@@ -58,7 +57,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
         fdatasets_sel = cf.filter_collocated_instruments(main_sensor, fdatasets)
 
         for fd in fdatasets_sel:
-            with xr.open_dataset(fd, mask_and_scale=False) as ds:
+            with cf.open_nc_dataset(fd, mask_and_scale=False) as ds:
                 ds = ds.swap_dims({'obs': 'time'})
 
                 if start_time is not None and end_time is not None:
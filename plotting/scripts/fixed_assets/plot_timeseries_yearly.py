@@ -16,7 +16,6 @@ import os
 import pandas as pd
 import itertools
 import numpy as np
-import xarray as xr
 import datetime
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
@@ -153,7 +152,7 @@ def main(sDir, url_list, preferred_only):
             sci_vars_dict = cd.initialize_empty_arrays(stream_sci_vars_dict, ms)
             print('\nAppending data from files: {}'.format(ms))
             for fd in fdatasets_sel:
-                ds = xr.open_dataset(fd, mask_and_scale=False)
+                ds = cf.open_nc_dataset(fd, mask_and_scale=False)
                 print(fd)
                 for var in list(sci_vars_dict[ms]['vars'].keys()):
                     sh = sci_vars_dict[ms]['vars'][var]
@@ -224,7 +223,10 @@ def main(sDir, url_list, preferred_only):
                                 sname = '-'.join((r, m, sv))
 
                             # group data by year
-                            groups, g_data = gt.group_by_time_range(x_nonan_nofv_nE_nogr, y_nonan_nofv_nE_nogr, 'A')
+                            x_sorted, y_sorted = gt.sort_by_time(x_nonan_nofv_nE_nogr, y_nonan_nofv_nE_nogr)
+                            cal = gt.CalendarPartitioner(x_sorted)
+                            groups = cal.group_index('Y')
+                            groups_stats = groups.describe(y_sorted)
 
                             # create bins
                             # groups_min = min(groups.describe()['DO']['min'])
@@ -262,10 +264,10 @@ def main(sDir, url_list, preferred_only):
                             # subplot for  histogram and basic statistics table
                             ax0[1].axis('off')
                             ax0[1].axis('tight')
-                            the_table = ax0[1].table(cellText=groups.describe().round(2).values,
-                                                     rowLabels=groups.describe().index.year,
+                            the_table = ax0[1].table(cellText=groups_stats.round(2).values,
+                                                     rowLabels=groups_stats.index.year,
                                                      rowColours=colors,
-                                                     colLabels=groups.describe().columns.levels[1],
+                                                     colLabels=groups_stats.columns,
                                                      loc='center')
                             the_table.set_fontsize(5)
 
@@ -273,19 +275,16 @@ def main(sDir, url_list, preferred_only):
                             fig, ax = pyplot.subplots(nrows=len(groups), ncols=1, sharey=True)
                             if len(groups) == 1:
                                 ax=[ax]
-                            t = 1
-                            for ny in range(len(groups)):
+                            for ny, year, ys in cal.periods('Y'):
                                 # prepare data for plotting
-                                y_data = g_data[ny + (t + 1)].dropna(axis=0)
-                                x_time = g_data[ny+t].dropna(axis=0)
-                                t += 1
+                                y_data = y_sorted[ys]
+                                x_time = pd.DatetimeIndex(x_sorted[ys])
                                 if len(y_data) != 0 and len(x_time) != 0:
-                                    n_year = x_time[0].year
+                                    n_year = year.year
 
                                     col_name = str(n_year)
 
-                                    serie_n = pd.DataFrame(columns=[col_name], index=x_time)
-                                    serie_n[col_name] = list(y_data[:])
+                                    serie_n = pd.DataFrame({col_name: y_data}, index=x_time)
 
                                     # plot histogram
                                     # serie_n.plot.hist(ax=ax0[0], bins=bin_range,
@@ -7,8 +7,9 @@ Created on Jan 28 2019
 """
 
 import os
+import functools
+import warnings
 import pandas as pd
-import xarray as xr
 import datetime as dt
 import numpy as np
 import itertools
@@ -39,6 +40,28 @@ def return_var(dataset, raw_vars, fstring, longname):
     return var
 
 
+@functools.lru_cache(maxsize=32)
+def density_grid(smin, xdim, s_step, tmin, ydim, t_step, p_ref):
+    """
+    Calculate density on a salinity-temperature grid (background of the T-S plot) with one gsw call. Grids are cached,
+    so deployments that need the same grid at the same reference pressure reuse it.
+    :param smin: salinity of the first grid column
+    :param xdim: number of grid columns
+    :param s_step: salinity step between columns
+    :param tmin: temperature of the first grid row
+    :param ydim: number of grid rows
+    :param t_step: temperature step between rows
+    :param p_ref: reference pressure (dbar)
+    :return: salinity vector, temperature vector, density grid (ydim x xdim)
+    """
+    si = np.linspace(0, xdim - 1, xdim) * s_step + smin
+    ti = np.linspace(0, ydim - 1, ydim) * t_step + tmin
+    mdens = gsw.density.rho(si[np.newaxis, :], ti[:, np.newaxis], p_ref)
+    for a in [si, ti, mdens]:
+        a.flags.writeable = False  # cached arrays are shared between plots
+    return si, ti, mdens
+
+
 def main(sDir, url_list, start_time, end_time, preferred_only):
     rd_list = []
     for uu in url_list:
@@ -74,7 +97,7 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
             fdatasets = datasets
 
         for fd in fdatasets:
-            with xr.open_dataset(fd, mask_and_scale=False) as ds:
+            with cf.open_nc_dataset(fd, mask_and_scale=False) as ds:
                 ds = ds.swap_dims({'obs': 'time'})
 
                 if start_time is not None and end_time is not None:
@@ -192,25 +215,23 @@ def main(sDir, url_list, start_time, end_time, preferred_only):
                     xdim = int(round((smax-smin)/0.1 + 1, 0))
                     if xdim == 1:
                         xdim = 2
-                    si = np.linspace(0, xdim - 1, xdim) * 0.1 + smin
 
                     if 1.1 <= temp.max() - temp.min() < 1.7:  # if the diff between min and max temp is small
-                        ydim = int(round((tmax-tmin)/0.75 + 1, 0))
-                        ti = np.linspace(0, ydim - 1, ydim) * 0.75 + tmin
+                        t_step = 0.75
                     elif temp.max() - temp.min() < 1.1:
-                        ydim = int(round((tmax - tmin) / 0.1 + 1, 0))
-                        ti = np.linspace(0, ydim - 1, ydim) * 0.1 + tmin
+                        t_step = 0.1
                     else:
-                        ydim = int(round((tmax - tmin) + 1, 0))
-                        ti = np.linspace(0, ydim - 1, ydim) + tmin
-
-                    # Create empty grid of zeros
-                    mdens = np.zeros((ydim, xdim))
-
-                    # Loop to fill in grid with densities
-                    for j in range(0, ydim):
-                        for i in range(0, xdim):
-                            mdens[j, i] = gsw.density.rho(si[i], ti[j], np.median(p))  # calculate density using median pressure value
+                        t_step = 1.0
+                    ydim = int(round((tmax - tmin) / t_step + 1, 0))
+
+                    # Calculate the density grid using the median pressure value (density contours are labeled
+                    # to the nearest unit, so the grid origin and pressure are rounded to make cached grids reusable)
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', category=RuntimeWarning)  # no valid pressure values
+                        p_ref = float(np.nanmedian(p))
+                    if not np.isnan(p_ref):
+                        p_ref = round(p_ref)
+                    si, ti, mdens = density_grid(round(smin, 4), xdim, 0.1, round(tmin, 4), ydim, t_step, p_ref)
 
                     fig, ax = pf.plot_ts(si, ti, mdens, sal, temp, colors)
 
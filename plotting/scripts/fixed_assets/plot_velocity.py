@@ -2,7 +2,6 @@
 import os
 import itertools
 import pandas as pd
-import xarray as xr
 import numpy as np
 import functions.common as cf
 import matplotlib
@@ -139,7 +138,7 @@ def plot_velocity_variables(r, fdatasets, num_plots, save_dir):
         deployment = fdatasets[ii].split('/')[-1].split('_')[0].split('deployment')[-1]
         deployment = int(deployment)
 
-        ds = xr.open_dataset(fdatasets[ii], mask_and_scale=False)
+        ds = cf.open_nc_dataset(fdatasets[ii], mask_and_scale=False)
         time = ds['time'].values
 
         '''
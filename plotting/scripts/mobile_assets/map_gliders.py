@@ -6,6 +6,8 @@ Modified on Apr 11 2019 by Lori Garzio
 """
 import os
 import itertools
+import functools
+from collections import OrderedDict
 
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -17,6 +19,23 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import functions.plotting as pf
 import functions.common as cf
 
+# fixed map extent [lonmin, lonmax, latmin, latmax] (None: set from the data or the glider box), bathymetry grid file
+# and bathymetry contours of each array
+ARRAY_MAPS = {
+    'CE': (None, 'GMRTv3_6_20190510topo_CE.grd', [-3000, -2500, -2000, -1500, -1000, -50, 0]),
+    'CP': ([-72.5, -69.5, 38.5, 42], 'GMRTv3_6_20190510topo_CP.grd', [-3000, -2500, -2000, -1500, -1000, -50, 0]),
+    'GA': ([-43.5, -41.5, -43.5, -42], 'GMRTv3_6_20190510topo_GA.grd', [-5500, -5400, -5300, -5200, -5100, -5000]),
+    'GI': ([-40.1, -39, 59.2, 60.3], 'GMRTv3_6_20190510topo_GI.grd',
+           [-3500, -3250, -3000, -2750, -2500, -2250, -2000]),
+    'GP': ([-145.1, -143.95, 49.7, 50.6], 'GMRTv3_6_20190513topo_GP.grd',
+           [-4500, -4250, -4000, -3750, -3500, -3250, -3000]),
+    'GS': ([-89.95, -88.65, -54.8, -53.7], 'GMRTv3_6_20190513topo_GS.grd',
+           [-5500, -5000, -4500, -4000, -3500, -3000, -2500, -2000])
+}
+
+MAX_BASE_MAPS = 4  # number of base map figures kept open for reuse (see base_map)
+_base_maps = OrderedDict()
+
 
 def define_extent(data1, data2, version):
     dmin = np.min([np.nanmin(data1), np.nanmin(data2)])
@@ -40,7 +59,9 @@ def define_extent(data1, data2, version):
     return dmin_ex, dmax_ex
 
 
-def plot_glider_box(ax, array):
+@functools.lru_cache(maxsize=16)
+def glider_box(array):
+    # outline of the glider sampling area of an array, from asset management (requested once per run)
     bulk_load = pd.read_csv(
         'https://raw.githubusercontent.com/ooi-integration/asset-management/master/bulk/array_bulk_load-AssetRecord.csv')
     bulk_load['array'] = bulk_load['MIO_Inventory_Description'].str.split(' ', n=1, expand=True)[0]
@@ -52,12 +73,77 @@ def plot_glider_box(ax, array):
     for x in poly.split(', '):
         xx.append(float(x.split(' ')[0]))
         yy.append(float(x.split(' ')[1]))
+    return xx, yy
+
+
+def plot_glider_box(ax, array):
+    xx, yy = glider_box(array)
     ax.plot(xx, yy, color='b', linewidth=2)
     return ax
 
 
-def plot_map(save_directory, savefile, plt_title, londata, latdata, tm, array, bfiles, plt_type=None, add_box=None):
-    #ax = plt.axes(projection=ccrs.PlateCarree())
+@functools.lru_cache(maxsize=None)
+def open_bathymetry(gf):
+    # open a GMRT grid file once per run. netCDF3 grids are memory-mapped, so only the subsets that are plotted are read
+    try:
+        return xr.open_dataset(gf, engine='scipy')
+    except (TypeError, ValueError):  # not a netCDF3 file
+        return xr.open_dataset(gf)
+
+
+@functools.lru_cache(maxsize=32)
+def bathymetry_subset(gf, xlim, ylim):
+    """
+    Return the bathymetry inside the map limits (the grid coordinates are sorted, so the subset is a slice of the grid)
+    :param gf: GMRT grid file
+    :param xlim: (lonmin, lonmax) of the map
+    :param ylim: (latmin, latmax) of the map
+    :return: longitudes, latitudes and altitude of the grid points inside the limits (read-only arrays)
+    """
+    grid_file = open_bathymetry(gf)
+    gf_lon = grid_file['lon'].values
+    gf_lat = grid_file['lat'].values
+    lon_ind = slice(np.searchsorted(gf_lon, xlim[0], side='right'), np.searchsorted(gf_lon, xlim[1], side='left'))
+    lat_ind = slice(np.searchsorted(gf_lat, ylim[0], side='right'), np.searchsorted(gf_lat, ylim[1], side='left'))
+    subset = (gf_lon[lon_ind], gf_lat[lat_ind], grid_file['altitude'][lat_ind, lon_ind].values)
+    for a in subset:
+        a.flags.writeable = False
+    return subset
+
+
+def data_extent(londata, latdata, array_loc):
+    lonmin, lonmax = define_extent(array_loc.lon, londata, 'lon')
+    latmin, latmax = define_extent(array_loc.lat, latdata, 'lat')
+    return [lonmin, lonmax, latmin, latmax]
+
+
+def map_settings(array, bfiles, londata, latdata, array_loc, plt_type=None, add_box=None):
+    """
+    Return the map extent (None if it's set by the glider box), the bathymetry grid file (None if bathymetry isn't
+    plotted), the bathymetry contours, whether the glider box is drawn, and whether the base map is the same for
+    every plot of the array (the extent doesn't depend on the data)
+    """
+    lims, grid_name, bathy_contours = ARRAY_MAPS[array]
+    box = True
+    fixed = True
+    if array == 'CE':
+        box = add_box == 'yes'
+        fixed = False
+        if not box:
+            lims = data_extent(londata, latdata, array_loc)
+    elif array != 'CP' and plt_type == 'glider_track_drift':
+        grid_name = None
+        fixed = False
+        lims = data_extent(londata, latdata, array_loc)
+
+    gf = None
+    if grid_name is not None:
+        gf = os.path.join(bfiles, grid_name)
+    return lims, gf, bathy_contours, box, fixed
+
+
+def draw_base_map(lims, gf, bathy_contours, array, box):
+    # draw the parts of the map that don't depend on the glider data
     fig, ax = plt.subplots(figsize=(8, 8), subplot_kw=dict(projection=ccrs.PlateCarree()))
     plt.subplots_adjust(right=0.85)
     states = cfeature.NaturalEarthFeature(category="cultural", scale="10m",
@@ -75,78 +161,79 @@ def plot_map(save_directory, savefile, plt_title, londata, latdata, tm, array, b
     # gl.ylabel_style = {'size': 14.5}
     ax.coastlines('10m', linewidth=1)
 
-    array_loc = cf.return_array_subsites_standard_loc(array)
-
-    ax.set_title(plt_title, fontsize=10)
-
-    if array == 'CE':
-        if add_box == 'yes':
-            ax = plot_glider_box(ax, array)
-        else:
-            lonmin, lonmax = define_extent(array_loc.lon, londata, 'lon')
-            latmin, latmax = define_extent(array_loc.lat, latdata, 'lat')
-            lims = [lonmin, lonmax, latmin, latmax]
-            ax.set_extent(lims, crs=ccrs.PlateCarree())
-        gf = os.path.join(bfiles, 'GMRTv3_6_20190510topo_CE.grd')
-        grid_file = xr.open_dataset(gf)
-        bathy_contours = [-3000, -2500, -2000, -1500, -1000, -50, 0]
-    else:
-        if array == 'CP':
-            lims = [-72.5, -69.5, 38.5, 42]
-            gf = os.path.join(bfiles, 'GMRTv3_6_20190510topo_CP.grd')
-            grid_file = xr.open_dataset(gf)
-            bathy_contours = [-3000, -2500, -2000, -1500, -1000, -50, 0]
-        else:
-            if plt_type == 'glider_track_drift':
-                lonmin, lonmax = define_extent(array_loc.lon, londata, 'lon')
-                latmin, latmax = define_extent(array_loc.lat, latdata, 'lat')
-                lims = [lonmin, lonmax, latmin, latmax]
-                gf = None
-            else:
-                if array == 'GA':
-                    lims = [-43.5, -41.5, -43.5, -42]
-                    gf = os.path.join(bfiles, 'GMRTv3_6_20190510topo_GA.grd')
-                    grid_file = xr.open_dataset(gf)
-                    bathy_contours = [-5500, -5400, -5300, -5200, -5100, -5000]
-                elif array == 'GI':
-                    lims = [-40.1, -39, 59.2, 60.3]
-                    gf = os.path.join(bfiles, 'GMRTv3_6_20190510topo_GI.grd')
-                    grid_file = xr.open_dataset(gf)
-                    bathy_contours = [-3500, -3250, -3000, -2750, -2500, -2250, -2000]
-                elif array == 'GP':
-                    gf = os.path.join(bfiles, 'GMRTv3_6_20190513topo_GP.grd')
-                    grid_file = xr.open_dataset(gf)
-                    bathy_contours = [-4500, -4250, -4000, -3750, -3500, -3250, -3000]
-                    lims = [-145.1, -143.95, 49.7, 50.6]
-                elif array == 'GS':
-                    gf = os.path.join(bfiles, 'GMRTv3_6_20190513topo_GS.grd')
-                    grid_file = xr.open_dataset(gf)
-                    bathy_contours = [-5500, -5000, -4500, -4000, -3500, -3000, -2500, -2000]
-                    lims = [-89.95, -88.65, -54.8, -53.7]
+    if lims is not None:
         ax.set_extent(lims, crs=ccrs.PlateCarree())
+    if box:
         ax = plot_glider_box(ax, array)
 
     if gf:
-        gf_lon = grid_file['lon']
-        gf_lat = grid_file['lat']
-        lon_ind = np.logical_and(gf_lon > ax.get_xlim()[0], gf_lon < ax.get_xlim()[1])
-        lat_ind = np.logical_and(gf_lat > ax.get_ylim()[0], gf_lat < ax.get_ylim()[1])
-        bathy = grid_file['altitude'][lat_ind, lon_ind].values
-        CS = ax.contour(gf_lon[lon_ind], gf_lat[lat_ind], bathy, bathy_contours, colors='gray', linewidths=0.5, alpha=0.5)
+        gf_lon, gf_lat, bathy = bathymetry_subset(gf, tuple(ax.get_xlim()), tuple(ax.get_ylim()))
+        CS = ax.contour(gf_lon, gf_lat, bathy, bathy_contours, colors='gray', linewidths=0.5, alpha=0.5)
         ax.clabel(CS, inline=1, fontsize=8, fmt='%.0f')
         #h = ax.pcolormesh(xx, yy, bathy, cmap='Blues_r', linewidth=0, rasterized=True)
         #h = ax.pcolor(grid_file['altitude'], cmap='Blues_r', alpha=.1)
 
-    sct = plt.scatter(londata, latdata, c=tm, marker='.', s=2, cmap='rainbow', transform=ccrs.Geodetic())
-    plt.scatter(array_loc.lon, array_loc.lat, s=45, marker='x', color='k')
+    return fig, ax
+
+
+def base_map(lims, gf, bathy_contours, array, box):
+    """
+    Return a base map figure that is kept open and reused by every plot with the same settings. The coastlines,
+    features, glider box and bathymetry contours are only drawn the first time; the plots draw the glider track on
+    top and remove it after the figure is saved.
+    """
+    key = (array, tuple(lims), gf, tuple(bathy_contours), box)
+    if key in _base_maps:
+        _base_maps.move_to_end(key)
+        return _base_maps[key]
 
-    divider = make_axes_locatable(ax)
-    cax = divider.new_horizontal(size='5%', pad=0.1, axes_class=plt.Axes)
-    fig.add_axes(cax)
-    cbar = plt.colorbar(sct, cax=cax, label='Time')
-    cbar.ax.set_yticklabels(pd.to_datetime(cbar.ax.get_yticks()).strftime(date_format='%Y-%m-%d'))
+    if len(_base_maps) >= MAX_BASE_MAPS:
+        plt.close(_base_maps.popitem(last=False)[1][0])
+    _base_maps[key] = draw_base_map(lims, gf, bathy_contours, array, box)
+    return _base_maps[key]
 
-    pf.save_fig(save_directory, savefile)
+
+def close_base_maps():
+    while _base_maps:
+        plt.close(_base_maps.popitem()[1][0])
+
+
+def plot_map(save_directory, savefile, plt_title, londata, latdata, tm, array, bfiles, plt_type=None, add_box=None):
+    array_loc = cf.return_array_subsites_standard_loc(array)
+    lims, gf, bathy_contours, box, fixed = map_settings(array, bfiles, londata, latdata, array_loc, plt_type, add_box)
+    if fixed:
+        fig, ax = base_map(lims, gf, bathy_contours, array, box)
+        plt.figure(fig.number)
+    else:
+        fig, ax = draw_base_map(lims, gf, bathy_contours, array, box)
+
+    overlays = []  # artists drawn on top of the base map, in the order they are removed
+    try:
+        ax.set_title(plt_title, fontsize=10)
+        sct = ax.scatter(londata, latdata, c=tm, marker='.', s=2, cmap='rainbow', transform=ccrs.Geodetic())
+        overlays.append(sct)
+        loc = ax.scatter(array_loc.lon, array_loc.lat, s=45, marker='x', color='k')
+        overlays.append(loc)
+
+        divider = make_axes_locatable(ax)
+        cax = divider.new_horizontal(size='5%', pad=0.1, axes_class=plt.Axes)
+        fig.add_axes(cax)
+        overlays.insert(0, cax)  # before the track, the colorbar needs it to restore the map axes
+        cbar = plt.colorbar(sct, cax=cax, label='Time')
+        cbar.ax.set_yticklabels(pd.to_datetime(cbar.ax.get_yticks()).strftime(date_format='%Y-%m-%d'))
+
+        if not fixed:
+            pf.save_fig(save_directory, savefile)
+        else:
+            # save the figure without closing it, so the base map can be reused
+            plt.savefig(str(os.path.join(save_directory, savefile)), dpi=150)
+    finally:
+        if fixed:
+            # remove the glider track (also if the plot failed), so it doesn't show up on the next plots
+            for a in overlays:
+                a.remove()
+            ax.set_axes_locator(None)
+            ax.set_title('')
 
 
 def main(url_list, sDir, plot_type, start_time, end_time, deployment_num, bfiles):
@@ -157,99 +244,102 @@ def main(url_list, sDir, plot_type, start_time, end_time, deployment_num, bfiles
         if rd not in rd_list:
             rd_list.append(rd)
 
-    for r in rd_list:
-        if 'ENG' not in r:
-            print('\n{}'.format(r))
-            datasets = []
-            for u in url_list:
-                splitter = u.split('/')[-2].split('-')
-                rd_check = '-'.join((splitter[1], splitter[2], splitter[3], splitter[4]))
-                if rd_check == r:
-                    if 'bottom_track_earth' not in splitter[-1]:
-                        udatasets = cf.get_nc_urls([u])
-                        datasets.append(udatasets)
-            datasets = list(itertools.chain(*datasets))
-            fdatasets = []
-
-            # get the preferred stream information
-            ps_df, n_streams = cf.get_preferred_stream_info(r)
-
-            for index, row in ps_df.iterrows():
-                for ii in range(n_streams):
+    try:
+        for r in rd_list:
+            if 'ENG' not in r:
+                print('\n{}'.format(r))
+                datasets = []
+                for u in url_list:
+                    splitter = u.split('/')[-2].split('-')
+                    rd_check = '-'.join((splitter[1], splitter[2], splitter[3], splitter[4]))
+                    if rd_check == r:
+                        if 'bottom_track_earth' not in splitter[-1]:
+                            udatasets = cf.get_nc_urls([u])
+                            datasets.append(udatasets)
+                datasets = list(itertools.chain(*datasets))
+                fdatasets = []
+
+                # get the preferred stream information
+                ps_df, n_streams = cf.get_preferred_stream_info(r)
+
+                for index, row in ps_df.iterrows():
+                    for ii in range(n_streams):
+                        try:
+                            rms = '-'.join((r, row[ii]))
+                        except TypeError:
+                            continue
+                        for dd in datasets:
+                            spl = dd.split('/')[-2].split('-')
+                            catalog_rms = '-'.join((spl[1], spl[2], spl[3], spl[4], spl[5], spl[6]))
+                            fdeploy = dd.split('/')[-1].split('_')[0]
+                            if rms == catalog_rms and fdeploy == row['deployment']:
+                                fdatasets.append(dd)
+
+                main_sensor = r.split('-')[-1]
+                fdatasets_sel = cf.filter_collocated_instruments(main_sensor, fdatasets)
+                subsite = r.split('-')[0]
+                array = subsite[0:2]
+                save_dir = os.path.join(sDir, array, subsite, r, plot_type)
+                cf.create_dir(save_dir)
+                sname = '_'.join((r, plot_type))
+
+                sh = pd.DataFrame()
+                deployments = []
+                for ii, d in enumerate(fdatasets_sel):
+                    print('\nDataset {} of {}: {}'.format(ii + 1, len(fdatasets_sel), d.split('/')[-1]))
+                    deploy = d.split('/')[-1].split('_')[0]
+                    if deployment_num:
+                        if int(deploy[-4:]) is not deployment_num:
+                            continue
+
+                    ds = cf.open_nc_dataset(d, mask_and_scale=False)
+                    ds = ds.swap_dims({'obs': 'time'})
+
+                    if start_time is not None and end_time is not None:
+                        ds = ds.sel(time=slice(start_time, end_time))
+                        if len(ds['time'].values) == 0:
+                            print('No data to plot for specified time range: ({} to {})'.format(start_time, end_time))
+                            continue
+
+                    try:
+                        ds_lat = ds['lat'].values
+                    except KeyError:
+                        ds_lat = None
+                        print('No latitude variable in file')
                     try:
-                        rms = '-'.join((r, row[ii]))
-                    except TypeError:
-                        continue
-                    for dd in datasets:
-                        spl = dd.split('/')[-2].split('-')
-                        catalog_rms = '-'.join((spl[1], spl[2], spl[3], spl[4], spl[5], spl[6]))
-                        fdeploy = dd.split('/')[-1].split('_')[0]
-                        if rms == catalog_rms and fdeploy == row['deployment']:
-                            fdatasets.append(dd)
-
-            main_sensor = r.split('-')[-1]
-            fdatasets_sel = cf.filter_collocated_instruments(main_sensor, fdatasets)
-            subsite = r.split('-')[0]
-            array = subsite[0:2]
-            save_dir = os.path.join(sDir, array, subsite, r, plot_type)
-            cf.create_dir(save_dir)
-            sname = '_'.join((r, plot_type))
-
-            sh = pd.DataFrame()
-            deployments = []
-            for ii, d in enumerate(fdatasets_sel):
-                print('\nDataset {} of {}: {}'.format(ii + 1, len(fdatasets_sel), d.split('/')[-1]))
-                deploy = d.split('/')[-1].split('_')[0]
-                if deployment_num:
-                    if int(deploy[-4:]) is not deployment_num:
-                        continue
-
-                ds = xr.open_dataset(d, mask_and_scale=False)
-                ds = ds.swap_dims({'obs': 'time'})
-
-                if start_time is not None and end_time is not None:
-                    ds = ds.sel(time=slice(start_time, end_time))
-                    if len(ds['time'].values) == 0:
-                        print('No data to plot for specified time range: ({} to {})'.format(start_time, end_time))
-                        continue
-
-                try:
-                    ds_lat = ds['lat'].values
-                except KeyError:
-                    ds_lat = None
-                    print('No latitude variable in file')
-                try:
-                    ds_lon = ds['lon'].values
-                except KeyError:
-                    ds_lon = None
-                    print('No longitude variable in file')
-
-                if ds_lat is not None and ds_lon is not None:
-                    data = {'lat': ds_lat, 'lon': ds_lon}
-                    new_r = pd.DataFrame(data, columns=['lat', 'lon'], index=ds['time'].values)
-                    sh = sh.append(new_r)
-
-                    # append the deployments that are actually plotted
-                    if int(deploy[-4:]) not in deployments:
-                        deployments.append(int(deploy[-4:]))
-
-                    # plot data by deployment
-                    sfile = '-'.join((deploy, sname))
-                    if array == 'CE':
-                        ttl = 'Glider Track - ' + r + ' - ' + deploy + '\nx: Mooring Locations'
-                    else:
-                        ttl = 'Glider Track - ' + r + ' - ' + deploy + '\nx: Mooring Locations' + '\n blue box: Glider Sampling Area'
-                    #fig, ax = pf.plot_profiles(ds_lon, ds_lat, ds['time'].values, ylabel, xlabel, clabel, stdev=None)
-                    plot_map(save_dir, sfile, ttl, ds_lon, ds_lat, ds['time'].values, array, bfiles, plot_type)
-
-            sh = sh.resample('H').median()  # resample hourly
-            xD = sh.lon.values
-            yD = sh.lat.values
-            tD = sh.index.values
-            title = 'Glider Track - ' + r + '\nDeployments: ' + str(deployments) + '   x: Mooring Locations' + '\n blue box: Glider Sampling Area'
-            save_dir_main = os.path.join(sDir, array, subsite, r)
-
-            plot_map(save_dir_main, sname, title, xD, yD, tD, array, bfiles, plot_type, add_box='yes')
+                        ds_lon = ds['lon'].values
+                    except KeyError:
+                        ds_lon = None
+                        print('No longitude variable in file')
+
+                    if ds_lat is not None and ds_lon is not None:
+                        data = {'lat': ds_lat, 'lon': ds_lon}
+                        new_r = pd.DataFrame(data, columns=['lat', 'lon'], index=ds['time'].values)
+                        sh = sh.append(new_r)
+
+                        # append the deployments that are actually plotted
+                        if int(deploy[-4:]) not in deployments:
+                            deployments.append(int(deploy[-4:]))
+
+                        # plot data by deployment
+                        sfile = '-'.join((deploy, sname))
+                        if array == 'CE':
+                            ttl = 'Glider Track - ' + r + ' - ' + deploy + '\nx: Mooring Locations'
+                        else:
+                            ttl = 'Glider Track - ' + r + ' - ' + deploy + '\nx: Mooring Locations' + '\n blue box: Glider Sampling Area'
+                        #fig, ax = pf.plot_profiles(ds_lon, ds_lat, ds['time'].values, ylabel, xlabel, clabel, stdev=None)
+                        plot_map(save_dir, sfile, ttl, ds_lon, ds_lat, ds['time'].values, array, bfiles, plot_type)
+
+                sh = sh.resample('H').median()  # resample hourly
+                xD = sh.lon.values
+                yD = sh.lat.values
+                tD = sh.index.values
+                title = 'Glider Track - ' + r + '\nDeployments: ' + str(deployments) + '   x: Mooring Locations' + '\n blue box: Glider Sampling Area'
+                save_dir_main = os.path.join(sDir, array, subsite, r)
+
+                plot_map(save_dir_main, sname, title, xD, yD, tD, array, bfiles, plot_type, add_box='yes')
+    finally:
+        close_base_maps()
 
 
 if __name__ == '__main__':
@@ -10,7 +10,6 @@ outside of global ranges. Each plot contains data from one deployment and one sc
 
 import os
 import pandas as pd
-import xarray as xr
 import numpy as np
 import datetime as dt
 import itertools
@@ -19,11 +18,52 @@ import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import functions.common as cf
 import functions.plotting as pf
-import functions.group_by_timerange as gt
 import functions.profile_xsection_spkir_optaa as pxso
-
-
-def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n_std, inpercentile, zcell_size, zdbar):
+import functions.render_pool as rp
+
+
+def render_profile(x, y, t, ylabel, xlabel, clabel, title, avg=None, leg_text=None):
+    # profile plot (rendered by functions.render_pool). avg: data average, depths, and envelope limits per depth range
+    fig, ax = pf.plot_profiles(x, y, t, ylabel, xlabel, clabel, stdev=None, leg_below=leg_text)
+    ax.set_title(title, fontsize=9)
+    if avg is not None:
+        n_avg, y_avg, n0_std, n1_std = avg
+        ax.plot(n_avg, y_avg, '-k')
+        ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
+    fig.tight_layout()
+
+
+def render_xsection(subsite, t, y, z, clabel, ylabel, title, leg_text=None):
+    # cross-section plot (rendered by functions.render_pool)
+    fig, ax, bar = pf.plot_xsection(subsite, t, y, z, clabel, ylabel, t_eng=None, m_water_depth=None,
+                                    inpercentile=None, stdev=None, leg_below=leg_text)
+    if not fig:
+        return False
+    ax.set_title(title, fontsize=9)
+    fig.tight_layout()
+
+
+def render_4d(lon, lat, y, z, clabel, zlabel, title):
+    # 4D color scatter plot for gliders (rendered by functions.render_pool)
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    sct = ax.scatter(lon, lat, y, c=z, s=2)
+    cbar = plt.colorbar(sct, label=clabel, extend='both')
+    cbar.ax.tick_params(labelsize=8)
+    ax.invert_zaxis()
+    ax.view_init(25, 32)
+    ax.invert_xaxis()
+    ax.invert_yaxis()
+    ax.set_zlabel(zlabel, fontsize=9)
+    ax.set_ylabel('Latitude', fontsize=9)
+    ax.set_xlabel('Longitude', fontsize=9)
+    ax.set_title(title, fontsize=9)
+
+
+def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n_std, inpercentile, zcell_size, zdbar,
+         n_workers=1):
+    # figures are rendered and saved by n_workers processes
+    pool = rp.RenderPool(n_workers)
     rd_list = []
     for uu in url_list:
         elements = uu.split('/')[-2].split('-')
@@ -66,7 +106,7 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
         for fd in fdatasets_sel:
             part_d = fd.split('/')[-1]
             print('\n{}'.format(part_d))
-            ds = xr.open_dataset(fd, mask_and_scale=False)
+            ds = cf.open_nc_dataset(fd, mask_and_scale=False)
             ds = ds.swap_dims({'obs': 'time'})
 
             fname, subsite, refdes, method, stream, deployment = cf.nc_attributes(fd)
@@ -237,22 +277,19 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                 print('removed {} data points using visual inspection of data'.format(
                                     len(ndata) - len(z_portal)))
 
-                                # create data groups
-                                columns = ['tsec', 'dbar', str(sv)]
+                                # create depth ranges
                                 min_r = int(round(np.nanmin(y_portal) - zcell_size))
                                 max_r = int(round(np.nanmax(y_portal) + zcell_size))
                                 ranges = list(range(min_r, max_r, zcell_size))
 
-                                groups, d_groups = gt.group_by_depth_range(t_portal, y_portal, z_portal, columns, ranges)
-
                                 if 'scatter' in sv:
                                     n_std = None  # to use percentile
                                 else:
                                     n_std = n_std
 
                                 #  get percentile analysis for printing on the profile plot
-                                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_groups(
-                                    groups, d_groups, n_std, inpercentile)
+                                y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_depth_ranges(
+                                    t_portal, y_portal, z_portal, ranges, n_std, inpercentile)
 
                             """
                             Plot all data
@@ -275,11 +312,9 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                 ylabel = press[0] + " (" + y_units[0] + ")"
                                 clabel = 'Time'
 
-                                fig, ax = pf.plot_profiles(z1, y1, time1, ylabel, xlabel, clabel, stdev=None)
-
-                                ax.set_title(title, fontsize=9)
-                                fig.tight_layout()
-                                pf.save_fig(save_dir_profile, sfileall)
+                                data_all = [pool.share(a) for a in [time1, y1, z1]]
+                                pool.submit(render_profile, save_dir_profile, sfileall, data_all[2], data_all[1],
+                                            data_all[0], ylabel, xlabel, clabel, title)
 
                                 '''
                                 xsection plot
@@ -287,13 +322,9 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                 clabel = sv + " (" + sv_units + ")"
                                 ylabel = press[0] + " (" + y_units[0] + ")"
 
-                                fig, ax, bar = pf.plot_xsection(subsite, time1, y1, z1, clabel, ylabel, t_eng=None,
-                                                                m_water_depth=None, inpercentile=None, stdev=None)
-
-                                if fig:
-                                    ax.set_title(title, fontsize=9)
-                                    fig.tight_layout()
-                                    pf.save_fig(save_dir_xsection, sfileall)
+                                pool.submit(render_xsection, save_dir_xsection, sfileall, subsite, data_all[0],
+                                            data_all[1], data_all[2], clabel, ylabel, title)
+                                pool.release(*data_all)
 
                             """
                             Plot cleaned-up data
@@ -313,11 +344,8 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                 ylabel = press[0] + " (" + y_units[0] + ")"
                                 clabel = 'Time'
 
-                                fig, ax = pf.plot_profiles(z_portal, y_portal, t_portal, ylabel, xlabel, clabel, stdev=None)
+                                data_portal = [pool.share(a) for a in [t_portal, y_portal, z_portal]]
 
-                                ax.set_title(title, fontsize=9)
-                                ax.plot(n_avg, y_avg, '-k')
-                                ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
                                 if inpercentile:
                                     leg_text = (
                                         'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
@@ -337,9 +365,9 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                         '\n(black) data average in {} dbar segments'.format(zcell_size) +
                                         '\n(magenta) +/- {} SD envelope in {} dbar segments'.format(
                                             int(n_std), zcell_size),)
-                                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
-                                fig.tight_layout()
-                                pf.save_fig(save_dir_profile, sfile)
+                                pool.submit(render_profile, save_dir_profile, sfile, data_portal[2], data_portal[1],
+                                            data_portal[0], ylabel, xlabel, clabel, title,
+                                            avg=(n_avg, y_avg, n0_std, n1_std), leg_text=leg_text)
 
                                 '''
                                 xsection plot
@@ -348,20 +376,14 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                 ylabel = press[0] + " (" + y_units[0] + ")"
 
                                 # plot non-erroneous data
-                                fig, ax, bar = pf.plot_xsection(subsite, t_portal, y_portal, z_portal, clabel, ylabel,
-                                                                t_eng=None, m_water_depth=None, inpercentile=None,
-                                                                stdev=None)
-
-                                ax.set_title(title, fontsize=9)
                                 leg_text = (
                                     'removed {} fill values, {} NaNs, {} Extreme Values (1e7), {} Global ranges [{} - {}], '
                                     '{} unreasonable values'.format(lenfv, lennan, lenev, lengr, global_min, global_max, lenzero) +
                                     '\nexcluded {} suspect data points when inspected visually'.format(
                                         len(ndata) - len(z_portal)),
                                 )
-                                ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
-                                fig.tight_layout()
-                                pf.save_fig(save_dir_xsection, sfile)
+                                pool.submit(render_xsection, save_dir_xsection, sfile, subsite, data_portal[0],
+                                            data_portal[1], data_portal[2], clabel, ylabel, title, leg_text=leg_text)
 
                                 '''
                                 4D plot for gliders only
@@ -373,21 +395,11 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, n
                                         clabel = sv + " (" + sv_units + ")"
                                         zlabel = press[0] + " (" + y_units[0] + ")"
 
-                                        fig = plt.figure()
-                                        ax = fig.add_subplot(111, projection='3d')
-                                        sct = ax.scatter(lon_portal, lat_portal, y_portal, c=z_portal, s=2)
-                                        cbar = plt.colorbar(sct, label=clabel, extend='both')
-                                        cbar.ax.tick_params(labelsize=8)
-                                        ax.invert_zaxis()
-                                        ax.view_init(25, 32)
-                                        ax.invert_xaxis()
-                                        ax.invert_yaxis()
-                                        ax.set_zlabel(zlabel, fontsize=9)
-                                        ax.set_ylabel('Latitude', fontsize=9)
-                                        ax.set_xlabel('Longitude', fontsize=9)
-
-                                        ax.set_title(title, fontsize=9)
-                                        pf.save_fig(save_dir_4d, sfile)
+                                        pool.submit(render_4d, save_dir_4d, sfile, lon_portal, lat_portal,
+                                                    data_portal[1], data_portal[2], clabel, zlabel, title)
+                                pool.release(*data_portal)
+
+    pool.close()
 
 
 if __name__ == '__main__':
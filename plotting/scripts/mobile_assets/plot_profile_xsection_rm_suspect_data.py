@@ -11,7 +11,6 @@ one deployment and one science variable.
 
 import os
 import pandas as pd
-import xarray as xr
 import numpy as np
 import datetime as dt
 import itertools
@@ -19,7 +18,6 @@ from mpl_toolkits.mplot3d import Axes3D  # need this for 4D scatter plot
 import matplotlib.pyplot as plt
 import functions.common as cf
 import functions.plotting as pf
-import functions.group_by_timerange as gt
 
 
 def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, zdbar, n_std, inpercentile, zcell_size):
@@ -65,7 +63,7 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, z
         for fd in fdatasets_sel:
             part_d = fd.split('/')[-1]
             print('\n{}'.format(part_d))
-            ds = xr.open_dataset(fd, mask_and_scale=False)
+            ds = cf.open_nc_dataset(fd, mask_and_scale=False)
             ds = ds.swap_dims({'obs': 'time'})
 
             fname, subsite, refdes, method, stream, deployment = cf.nc_attributes(fd)
@@ -217,22 +215,19 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, z
                             print('removed {} data points using visual inspection of data'.format(
                                 len(ndata) - len(z_portal)))
 
-                            # create data groups
-                            columns = ['tsec', 'dbar', str(sv)]
+                            # create depth ranges
                             min_r = int(round(min(y_portal) - zcell_size))
                             max_r = int(round(max(y_portal) + zcell_size))
                             ranges = list(range(min_r, max_r, zcell_size))
 
-                            groups, d_groups = gt.group_by_depth_range(t_portal, y_portal, z_portal, columns, ranges)
-
                             if 'scatter' in sv:
                                 n_std = None  # to use percentile
                             else:
                                 n_std = n_std
 
                             #  identifying timestamps from percentile analysis
-                            y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_groups(
-                                groups, d_groups, n_std, inpercentile)
+                            y_avg, n_avg, n_min, n_max, n0_std, n1_std, l_arr, time_ex = cf.reject_timestamps_in_depth_ranges(
+                                t_portal, y_portal, z_portal, ranges, n_std, inpercentile)
 
                             """
                             writing timestamps to .csv file to use with data_range.py script
@@ -309,12 +304,12 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, z
 
                                     # plot non-erroneous data
                                     print('plotting profile')
-                                    fig, ax = pf.plot_profiles(z_nospct, y_nospct, t_nospct, ylabel, xlabel, clabel, stdev=None)
+                                    fig, ax = pf.plot_profiles(z_nospct, y_nospct, t_nospct, ylabel, xlabel, clabel, stdev=None,
+                                                               leg_below=leg_text)
 
                                     ax.set_title(title, fontsize=9)
                                     ax.plot(n_avg, y_avg, '-k')
                                     #ax.fill_betweenx(y_avg, n0_std, n1_std, color='m', alpha=0.2)
-                                    ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
                                     fig.tight_layout()
                                     pf.save_fig(save_dir_profile, sfile)
 
@@ -334,10 +329,10 @@ def main(url_list, sDir, deployment_num, start_time, end_time, preferred_only, z
                                     # plot non-erroneous data
                                     fig, ax, bar = pf.plot_xsection(subsite, t_nospct, y_nospct, z_nospct, clabel, ylabel,
                                                                     t_eng=None, m_water_depth=None,
-                                                                    inpercentile=inpercentile, stdev=None)
+                                                                    inpercentile=inpercentile, stdev=None,
+                                                                    leg_below=leg_text)
 
                                     ax.set_title(title, fontsize=9)
-                                    ax.legend(leg_text, loc='upper center', bbox_to_anchor=(0.5, -0.17), fontsize=6)
                                     fig.tight_layout()
                                     pf.save_fig(save_dir_xsection, sfile)
 
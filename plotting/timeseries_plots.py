@@ -9,6 +9,7 @@ f: file containing THREDDs urls with .nc files to analyze. The column containing
 start_time: optional start time to limit plotting time range
 end_time: optional end time to limit plotting time range
 preferred_only: if set to 'yes', only plots the preferred data for a deployment. Options are 'yes' or 'no'
+n_workers: number of processes that render and save figures (plot_timeseries)
 """
 
 import pandas as pd
@@ -20,12 +21,13 @@ f = '/Users/lgarzio/Documents/OOI/DataReviews/CP/CP01CNSM/data_request_summary_p
 start_time = None  # dt.datetime(2017, 1, 25, 0, 0, 0)  # optional, set to None if plotting all data
 end_time = None  # dt.datetime(2017, 1, 30, 0, 0, 0)  # optional, set to None if plotting all data
 preferred_only = 'yes'  # options: 'yes', 'no'
+n_workers = 1
 
 ff = pd.read_csv(f)
 url_list = ff['outputUrl'].tolist()
 url_list = [u for u in url_list if u not in 'no_output_url']
 
-scripts.plot_timeseries.main(sDir, url_list, start_time, end_time, preferred_only)
+scripts.plot_timeseries.main(sDir, url_list, start_time, end_time, preferred_only, n_workers)
 scripts.plot_timeseries_panel.main(sDir, url_list, start_time, end_time, preferred_only)
 scripts.plot_timeseries_pm_all.main(sDir, url_list, start_time, end_time)
 scripts.plot_timeseries_all.main(sDir, url_list)
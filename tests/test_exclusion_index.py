@@ -0,0 +1,45 @@
+#! /usr/bin/env python
+"""
+@brief Tests for the exclusion notes from the Data Review Database (functions.common.get_exclusion_index and
+exclusion_time_ranges), with the notes export replaced by a local table.
+"""
+
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+import functions.common as cf
+
+NOTES = pd.DataFrame(dict(
+    type=['exclusion', 'annotation', 'exclusion', 'exclusion', 'exclusion'],
+    reference_designator=['CE01ISSM', 'CE01ISSM-MFD37-03-CTDBPC000', 'CE01ISSM-MFD37-03-CTDBPC000', 'GP03FLMA',
+                          'CE01ISSM-MFD37'],
+    start_date=['1/2/19, 1:00 PM', '1/3/19, 1:00 PM', '2/1/19, 12:00 AM', np.nan, '3/1/19, 6:30 AM'],
+    end_date=['1/4/19, 1:00 PM', '1/5/19, 1:00 PM', '2/3/19, 12:00 AM', '5/1/18, 1:00 PM', 'not a date'],
+))
+
+
+class TestExclusionIndex(unittest.TestCase):
+
+    def setUp(self):
+        cf.get_exclusion_index.cache_clear()
+        mock.patch('functions.common._review_notes', return_value=NOTES).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        cf.get_exclusion_index.cache_clear()
+
+    def test_exclusion_time_ranges(self):
+        ranges = cf.exclusion_time_ranges('CE01ISSM', 'CE01ISSM-MFD37-03-CTDBPC000')
+        self.assertEqual([x[0:2] for x in ranges], [('2019-01-02T13:00:00', '2019-01-04T13:00:00'),
+                                                     ('2019-02-01T00:00:00', '2019-02-03T00:00:00')])
+        self.assertEqual(ranges[0][2], np.datetime64('2019-01-02T13:00:00'))
+
+    def test_invalid_dates_are_skipped(self):
+        index = cf.get_exclusion_index()
+        self.assertEqual(sorted(index), ['CE01ISSM', 'CE01ISSM-MFD37-03-CTDBPC000'])
+        self.assertEqual(cf.exclusion_time_ranges('GP03FLMA', 'GP03FLMA-RIM01-02-CTDMOG040'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+"""
+@brief Tests for functions.common.iter_nc_urls and resolve_catalogs, and for the scripts that use them, against a stub
+THREDDS server running in a thread.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import functions.common as cf
+import functions.remote_cache as rc
+import data_review.scripts.compare_methods as compare_methods
+
+CATALOG_HTML = '''<html><body>
+<a href="catalog.html?dataset=ooi/user/{name}/deployment0001_{rms}_20190101T000000-20190201T000000.nc">file 1</a>
+<a href="catalog.html?dataset=ooi/user/{name}/deployment0002_{rms}_20190201T000000-20190301T000000.nc">file 2</a>
+<a href="catalog.html?dataset=ooi/user/{name}/deployment0001_{rms}.ncml">aggregation</a>
+</body></html>'''
+
+
+class StubThredds(BaseHTTPRequestHandler):
+    # status.txt of a data request returns 404 until it has been requested pending_checks[name] times
+    pending_checks = dict()
+    status_requests = dict()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        parts = self.path.split('/')  # /thredds/<catalog or fileServer>/ooi/user/<name>/<file>
+        name = parts[-2]
+        if parts[2] == 'fileServer' and parts[-1] == 'status.txt':
+            with self.lock:
+                n = self.status_requests.get(name, 0) + 1
+                self.status_requests[name] = n
+            if n <= self.pending_checks.get(name, 0):
+                self._send(404, 'Not Found')
+            else:
+                self._send(200, 'Complete')
+        elif parts[2] == 'catalog' and parts[-1] == 'catalog.html':
+            # catalogs of data requests are named <request time>-<refdes>-<method>-<stream>
+            rms = name.split('-', 1)[-1]
+            self._send(200, CATALOG_HTML.format(name=name, rms=rms))
+        else:
+            self._send(404, 'Not Found')
+
+    def _send(self, code, text):
+        body = text.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubThreddsTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), StubThredds)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubThredds.pending_checks.clear()
+        StubThredds.status_requests.clear()
+        self.cache_settings = (rc.CACHE_DIR, rc.TTL, rc.OFFLINE)
+        self.cache_dir = tempfile.mkdtemp()
+        rc.set_cache_options(cache_dir=self.cache_dir, offline=False)
+        self.sleep = mock.patch('functions.common.time.sleep').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        cache_dir, ttl, offline = self.cache_settings
+        rc.set_cache_options(cache_dir=cache_dir, ttl=ttl, offline=offline)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def catalog_url(self, name):
+        return 'http://127.0.0.1:{}/thredds/catalog/ooi/user/{}/catalog.html'.format(self.server.server_port, name)
+
+
+class TestResolveCatalogs(StubThreddsTestCase):
+
+    def waits(self):
+        return [c[0][0] for c in self.sleep.call_args_list]
+
+    def test_ready_catalogs_first(self):
+        StubThredds.pending_checks['slow'] = 2
+        slow = self.catalog_url('slow')
+        ready = self.catalog_url('ready')
+
+        results = cf.iter_nc_urls([slow, ready], wait=1, max_wait=60)
+        url, nc_urls = next(results)
+        self.assertEqual(url, ready)
+        self.assertEqual(StubThredds.status_requests['slow'], 1)  # still fulfilling
+        self.assertEqual([u.split('/')[-1] for u in nc_urls],
+                         ['deployment0001_ready_20190101T000000-20190201T000000.nc',
+                          'deployment0002_ready_20190201T000000-20190301T000000.nc'])
+
+        url, nc_urls = next(results)
+        self.assertEqual(url, slow)
+        self.assertEqual(len(nc_urls), 2)
+        self.assertEqual(StubThredds.status_requests['slow'], 3)
+        self.assertEqual(list(results), [])
+        self.assertEqual(self.waits(), [1, 2])
+
+    def test_backoff_stops_at_max_wait(self):
+        StubThredds.pending_checks['slow'] = 6
+        resolved = cf.resolve_catalogs([self.catalog_url('slow')])
+        self.assertEqual(len(resolved[self.catalog_url('slow')]), 2)
+        self.assertEqual(self.waits(), [5, 10, 20, 40, 60, 60])
+
+    def test_cached_catalog_is_not_checked(self):
+        url = self.catalog_url('ready')
+        cf.resolve_catalogs([url])
+        self.assertEqual(StubThredds.status_requests['ready'], 1)
+        cf.resolve_catalogs([url])
+        self.assertEqual(StubThredds.status_requests['ready'], 1)
+
+    def test_failed_catalog_is_skipped(self):
+        bad = 'http://127.0.0.1:not-a-port/thredds/catalog/ooi/user/bad/catalog.html'
+        ready = self.catalog_url('ready')
+        resolved = cf.resolve_catalogs([bad, ready])
+        self.assertEqual(list(resolved), [ready])
+        self.assertEqual(len(cf.get_nc_urls([bad, ready])), 2)
+
+
+class TestCompareMethods(StubThreddsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.sDir, ignore_errors=True)
+
+    def test_failed_catalog_is_skipped(self):
+        refdes = 'GP03FLMA-RIM01-02-CTDMOG040'
+        recovered = self.catalog_url('20181001T150658-{}-recovered_host-ctdmo_ghqr_sio_mule_instrument'.format(refdes))
+        telemetered = 'http://127.0.0.1:not-a-port/thredds/catalog/ooi/user/' \
+                      '20181001T150716-{}-telemetered-ctdmo_ghqr_sio_mule_instrument/catalog.html'.format(refdes)
+
+        with mock.patch.object(compare_methods, 'compare_data', return_value=dict(compared=True)) as compare_data:
+            json_files = compare_methods.main(self.sDir, [recovered, telemetered])
+
+        # the files of the catalog that resolved are still compared
+        dinfo_df = compare_data.call_args[0][0]
+        self.assertEqual(list(dinfo_df.columns), ['recovered_host-ctdmo_ghqr_sio_mule_instrument'])
+        self.assertEqual(sorted(dinfo_df.index), ['deployment0001', 'deployment0002'])
+        self.assertEqual(json_files, [os.path.join(self.sDir, 'GP03FLMA', refdes,
+                                                   '{}-method_comparison.json'.format(refdes))])
+        with open(json_files[0]) as f:
+            self.assertEqual(json.load(f), dict(compared=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
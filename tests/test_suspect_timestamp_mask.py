@@ -0,0 +1,32 @@
+#! /usr/bin/env python
+"""
+@brief Tests for functions.common.suspect_timestamp_mask
+"""
+
+import unittest
+import numpy as np
+import pandas as pd
+import functions.common as cf
+
+
+class TestSuspectTimestampMask(unittest.TestCase):
+
+    def setUp(self):
+        self.t = np.datetime64('2019-01-01T00:00:00', 'ns') + np.array([0, 500, 1000, 1500], dtype='timedelta64[ms]')
+
+    def test_mixed_string_formats(self):
+        # str(Timestamp) drops zero fractional seconds: '2019-01-01 00:00:00' and '2019-01-01 00:00:00.500000'
+        timestamps = [str(pd.Timestamp(x)) for x in self.t[0:2]]
+        keep = cf.suspect_timestamp_mask(self.t, timestamps)
+        self.assertEqual(keep.tolist(), [False, False, True, True])
+
+    def test_datetime_types(self):
+        keep = cf.suspect_timestamp_mask(self.t, [self.t[3], pd.Timestamp(self.t[2]), '2019-01-02T00:00:00'])
+        self.assertEqual(keep.tolist(), [True, True, False, False])
+
+    def test_no_timestamps(self):
+        self.assertEqual(cf.suspect_timestamp_mask(self.t, []).tolist(), [True] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+"""
+@brief Tests for functions.common.time_exclusion_mask
+"""
+
+import unittest
+import numpy as np
+import functions.common as cf
+
+
+def baseline_mask(t, time_ranges):
+    # one comparison per time range (what time_exclusion_mask replaces)
+    ind = np.ones(len(t), dtype=bool)
+    for ts, te in time_ranges:
+        ind &= (t < np.datetime64(ts)) | (t > np.datetime64(te))
+    return ind
+
+
+class TestTimeExclusionMask(unittest.TestCase):
+
+    def test_unsorted_with_nat(self):
+        t = np.array(['2020-01-05', 'NaT', '2020-01-01', '2020-01-03'], dtype='datetime64[ns]')
+        keep, counts = cf.time_exclusion_mask(t, [['2020-01-01', '2020-01-02']])
+        self.assertEqual(keep.tolist(), [True, False, False, True])
+        self.assertEqual(counts, [1])
+
+    def test_no_time_ranges(self):
+        t = np.array(['2020-01-05', 'NaT'], dtype='datetime64[ns]')
+        keep, counts = cf.time_exclusion_mask(t, [])
+        self.assertEqual(keep.tolist(), [True, True])
+        self.assertEqual(counts, [])
+
+    def test_same_as_one_mask_per_range(self):
+        rng = np.random.RandomState(0)
+        t0 = np.datetime64('2020-01-01T00:00:00', 'ns')
+        for _ in range(200):
+            n = rng.randint(0, 50)
+            t = t0 + rng.randint(0, 100, n).astype('timedelta64[h]')
+            t[rng.rand(n) < 0.2] = np.datetime64('NaT')
+            if rng.rand() < 0.5:
+                t = np.sort(t)
+            time_ranges = []
+            for _ in range(rng.randint(1, 4)):
+                ts = t0 + np.timedelta64(rng.randint(0, 100), 'h')
+                time_ranges.append([ts, ts + np.timedelta64(rng.randint(0, 30), 'h')])
+
+            keep, counts = cf.time_exclusion_mask(t, time_ranges)
+            self.assertEqual(keep.tolist(), baseline_mask(t, time_ranges).tolist())
+            self.assertEqual(counts, [int(np.sum((t >= ts) & (t <= te))) for ts, te in time_ranges])
+
+
+if __name__ == '__main__':
+    unittest.main()